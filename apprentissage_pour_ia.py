@@ -64,9 +64,11 @@ class QueueWriter(io.TextIOBase):
 class TrainingThread(threading.Thread):
     """Thread d'entra\xeenement du mod\xE8le."""
 
-    def __init__(self, cfg: Dict[str, Any], log_q: queue.Queue[str], metric_q: queue.Queue[Dict[str, Any]]):
+    def __init__(self, cfg: Dict[str, Any], log_q: queue.Queue[str], metric_q: queue.Queue[Dict[str, Any]],
+                 resume: bool = False):
         super().__init__(daemon=True)
         self.cfg = cfg
+        self.resume = resume
         self.log_q = log_q
         self.metric_q = metric_q
         self.stop_event = threading.Event()
@@ -78,8 +80,17 @@ class TrainingThread(threading.Thread):
         stdout = QueueWriter(self.log_q)
         stderr = QueueWriter(self.log_q)
         with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
-            training.train_html_selector(progress_cb=progress, stop_event=self.stop_event)
-        self.log_q.put("\nEntra\xeenement termin\xE9\n")
+            metrics = training.train_html_selector(
+                progress_cb=progress, stop_event=self.stop_event, resume=self.resume
+            )
+        if metrics["stopped"]:
+            self.log_q.put(f"\nEntra\xeenement arr\xEAt\xE9 \xE0 l'\xE9tape {metrics['steps']} : "
+                           "cliquez sur Reprendre pour le continuer\n")
+        elif metrics["early_stopped"]:
+            self.log_q.put(f"\nArr\xEAt anticip\xE9 \xE0 l'\xE9tape {metrics['steps']}, "
+                           f"meilleur point de contr\xF4le : \xE9tape {metrics['best_step']}\n")
+        else:
+            self.log_q.put("\nEntra\xeenement termin\xE9\n")
 
     def stop(self) -> None:
         self.stop_event.set()
@@ -151,6 +162,7 @@ class TrainingApp:
         btn_frame = ttk.Frame(right)
         btn_frame.pack(pady=5)
         ttk.Button(btn_frame, text="D\xE9marrer", command=self.start_training).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Reprendre", command=self.resume_training).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Arr\xEAter", command=self.stop_training).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Exporter logs", command=self.export_logs).pack(side=tk.LEFT, padx=5)
 
@@ -163,14 +175,18 @@ class TrainingApp:
         ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor="w").pack(fill=tk.X)
 
     # ------------------------ UI actions ------------------------
-    def start_training(self) -> None:
+    def start_training(self, resume: bool = False) -> None:
         if self.train_thread and self.train_thread.is_alive():
             return
         self.start_time = time.time()
         self.status_var.set("Entra\xeenement")
-        self.train_thread = TrainingThread(self.cfg, self.log_q, self.metric_q)
+        self.train_thread = TrainingThread(self.cfg, self.log_q, self.metric_q, resume=resume)
         self.train_thread.start()
 
+    def resume_training(self) -> None:
+        """Reprend depuis le point de contr\xF4le enregistr\xE9 \xE0 l'arr\xEAt."""
+        self.start_training(resume=True)
+
     def stop_training(self) -> None:
         if self.train_thread:
             self.train_thread.stop()
@@ -0,0 +1,382 @@
+"""Asynchronous ASGI variant of the selector web service.
+
+The event loop only does I/O: heuristic scoring runs in a thread pool of
+``config.ASGI_CPU_WORKERS`` threads and model inference in a pool of
+``config.ASGI_MODEL_WORKERS``, so thousands of idle or slow connections
+cost no worker. Load is bounded at three points:
+
+* each route admits ``concurrency`` requests at once and lets at most
+  ``queue`` more wait for a slot (``config.ASGI_ROUTE_LIMITS``); beyond
+  that the request is answered 429 at once, before its body is read;
+  bodies are capped per route (``config.ASGI_SELECTORS_MAX_BODY_BYTES``,
+  ``config.ASGI_MAX_BODY_BYTES`` for the stream), 413 above;
+* every request has a deadline (``config.ASGI_REQUEST_TIMEOUT``, or less
+  with an ``X-Request-Timeout`` header in seconds). A request still
+  waiting for a slot or a worker at its deadline gets 503, one still
+  being computed gets 504;
+* a pool accepts at most its workers plus ``config.ASGI_POOL_BACKLOG``
+  tasks; a slot is freed when the thread finishes, not when the request
+  gives up, so abandoned work cannot pile up.
+
+``POST /api/v1/selectors`` answers a batch in one JSON document, like the
+Flask service. ``POST /api/v1/selectors/stream`` accepts larger batches and
+writes one JSON line per snippet (NDJSON) as chunks are computed.
+
+Run it with ``python cli.py serve-asgi`` (needs uvicorn) or any ASGI server
+(``uvicorn asgi_app:app``).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+import tracing
+from selector_service import BatchError, metrics_lines, parse_batch, select_batch
+from src.memoire_generale import flush_interactions
+
+SELECTORS_ROUTE = "/api/v1/selectors"
+STREAM_ROUTE = "/api/v1/selectors/stream"
+
+
+class Rejected(Exception):
+    """A request refused because of load, with the HTTP status to answer."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RouteLimiter:
+    """Admit ``concurrency`` requests at once with at most ``queue`` waiting."""
+
+    def __init__(self, concurrency: int, queue: int):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self.queue_full = 0
+        self.expired = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _get(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self, deadline: float):
+        semaphore = self._get()
+        if semaphore.locked() and self.waiting >= self.queue:
+            self.queue_full += 1
+            raise Rejected(429, "too many requests queued, retry later")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), _remaining(deadline))
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise Rejected(503, "deadline expired while queued") from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            semaphore.release()
+
+
+class BoundedPool:
+    """A thread pool holding at most ``workers + backlog`` running or queued tasks."""
+
+    def __init__(self, name: str, workers: int, backlog: int):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + backlog
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"asgi-{name}")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _get(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.capacity)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, deadline: float, fn, *args):
+        """Run ``fn(*args)`` in the pool; raise :class:`asyncio.TimeoutError`
+        if it has not finished by ``deadline``."""
+        semaphore = self._get()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), _remaining(deadline))
+        except asyncio.TimeoutError:
+            raise Rejected(503, f"no {self.name} worker free before the deadline") from None
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+
+        def release():
+            self.pending -= 1
+            semaphore.release()
+
+        def done(_):
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:  # loop closed
+                pass
+
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(done)
+        return await asyncio.wait_for(asyncio.wrap_future(future), _remaining(deadline))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+def _traced_batch(name: str, htmls, questions, engine: str, top_k: int):
+    with tracing.trace(name, items=len(htmls), engine=engine):
+        return select_batch(htmls, questions, engine, top_k)
+
+
+def _timeout_result() -> Dict[str, Any]:
+    return {"error": "deadline exceeded", "error_type": "TimeoutError"}
+
+
+class SelectorApp:
+    """The ASGI application; limits default to :mod:`config`."""
+
+    def __init__(
+        self,
+        route_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        timeout: Optional[float] = None,
+        cpu_workers: Optional[int] = None,
+        model_workers: Optional[int] = None,
+        pool_backlog: Optional[int] = None,
+        warmup: bool = True,
+    ):
+        limits = route_limits or config.ASGI_ROUTE_LIMITS
+        self.limiters = {route: RouteLimiter(*limits[route]) for route in limits}
+        self.timeout = timeout if timeout is not None else config.ASGI_REQUEST_TIMEOUT
+        backlog = pool_backlog if pool_backlog is not None else config.ASGI_POOL_BACKLOG
+        self.cpu_pool = BoundedPool("cpu", cpu_workers or config.ASGI_CPU_WORKERS, backlog)
+        self.model_pool = BoundedPool("model", model_workers or config.ASGI_MODEL_WORKERS, backlog)
+        self.warmup = warmup
+        self.ready = False
+        self.routes = {
+            ("GET", "/healthz"): self.healthz,
+            ("GET", "/readyz"): self.readyz,
+            ("GET", "/metrics"): self.metrics,
+            ("POST", SELECTORS_ROUTE): self.selectors,
+            ("POST", STREAM_ROUTE): self.selectors_stream,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout(scope)
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            known = any(path == scope["path"] for _, path in self.routes)
+            await _send_json(send, 405 if known else 404,
+                             {"error": "method not allowed" if known else "not found"})
+            return
+        try:
+            await handler(scope, receive, send, deadline)
+        except Rejected as e:
+            await _send_json(send, e.status, {"error": str(e)}, [(b"retry-after", b"1")])
+        except BatchError as e:
+            await _send_json(send, e.status, {"error": str(e)})
+
+    def _timeout(self, scope) -> float:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-timeout":
+                try:
+                    return min(self.timeout, max(0.0, float(value)))
+                except ValueError:
+                    break
+        return self.timeout
+
+    # -- lifespan --------------------------------------------------------
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self) -> None:
+        """Load and warm up the models in the model pool, then report ready."""
+        if self.warmup:
+            import server
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self.model_pool.executor, lambda: server.warmup(server.load_models())
+            )
+        self.ready = True
+
+    async def shutdown(self) -> None:
+        self.ready = False
+        loop = asyncio.get_running_loop()
+        for pool in (self.cpu_pool, self.model_pool):
+            await loop.run_in_executor(None, pool.shutdown)
+        flush_interactions()
+
+    # -- routes ----------------------------------------------------------
+    async def healthz(self, scope, receive, send, deadline):
+        await _send_json(send, 200, {"status": "ok"})
+
+    async def readyz(self, scope, receive, send, deadline):
+        if self.ready:
+            await _send_json(send, 200, {"status": "ready"})
+        else:
+            await _send_json(send, 503, {"status": "starting"})
+
+    async def metrics(self, scope, receive, send, deadline):
+        lines = metrics_lines()
+        lines += tracing.counter_lines(
+            "selector_asgi_rejected_total", "Requests refused because the route queue was full.",
+            [(route, limiter.queue_full) for route, limiter in self.limiters.items()], "route",
+        )
+        lines += tracing.counter_lines(
+            "selector_asgi_expired_total", "Requests whose deadline expired while queued.",
+            [(route, limiter.expired) for route, limiter in self.limiters.items()], "route",
+        )
+        lines += tracing.counter_lines(
+            "selector_asgi_active", "Requests being processed.",
+            [(route, limiter.active) for route, limiter in self.limiters.items()], "route", "gauge",
+        )
+        lines += tracing.counter_lines(
+            "selector_asgi_waiting", "Requests waiting for a slot.",
+            [(route, limiter.waiting) for route, limiter in self.limiters.items()], "route", "gauge",
+        )
+        lines += tracing.counter_lines(
+            "selector_asgi_pool_pending", "Tasks running or queued in each pool.",
+            [(pool.name, pool.pending) for pool in (self.cpu_pool, self.model_pool)], "pool", "gauge",
+        )
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        await _send(send, 200, body, b"text/plain; version=0.0.4")
+
+    def _pool(self, engine: str) -> BoundedPool:
+        # The ranker is a parse and a dot product per candidate, like the heuristic
+        return self.cpu_pool if engine in ("heuristic", "ranker") else self.model_pool
+
+    async def selectors(self, scope, receive, send, deadline):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with self.limiters[SELECTORS_ROUTE].slot(deadline):
+            payload = await _read_json(receive, deadline, config.ASGI_SELECTORS_MAX_BODY_BYTES)
+            htmls, questions, engine, top_k = parse_batch(payload, config.API_MAX_BATCH)
+            try:
+                results = await self._pool(engine).run(
+                    deadline, _traced_batch, "asgi.selectors", htmls, questions, engine, top_k
+                )
+            except asyncio.TimeoutError:
+                await _send_json(send, 504, {"error": "deadline exceeded"})
+                return
+        await _send_json(send, 200, {
+            "engine": engine,
+            "results": results,
+            "timings": {"total_ms": round((loop.time() - started) * 1000, 3)},
+        })
+
+    async def selectors_stream(self, scope, receive, send, deadline):
+        async with self.limiters[STREAM_ROUTE].slot(deadline):
+            payload = await _read_json(receive, deadline, config.ASGI_MAX_BODY_BYTES)
+            htmls, questions, engine, top_k = parse_batch(payload, config.ASGI_STREAM_MAX_ITEMS)
+            chunk = config.ASGI_STREAM_CHUNK
+            pool = self._pool(engine)
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            })
+            for start in range(0, len(htmls), chunk):
+                end = min(start + chunk, len(htmls))
+                try:
+                    results = await pool.run(
+                        deadline, _traced_batch, "asgi.selectors_stream",
+                        htmls[start:end], questions[start:end], engine, top_k,
+                    )
+                except (asyncio.TimeoutError, Rejected):
+                    # The status is already sent; report the deadline per item
+                    results = [_timeout_result() for _ in range(start, end)]
+                lines = "".join(
+                    json.dumps({"index": start + i, **result}, ensure_ascii=False) + "\n"
+                    for i, result in enumerate(results)
+                )
+                try:
+                    await send({"type": "http.response.body", "body": lines.encode("utf-8"),
+                                "more_body": True})
+                except OSError:
+                    # Client gone; stop computing for it
+                    return
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _read_json(receive, deadline: float, max_bytes: int) -> Any:
+    """Read the request body (at most ``max_bytes``) as JSON."""
+    parts: List[bytes] = []
+    size = 0
+    while True:
+        try:
+            message = await asyncio.wait_for(receive(), _remaining(deadline))
+        except asyncio.TimeoutError:
+            raise BatchError("request body not received before the deadline", 408) from None
+        if message["type"] == "http.disconnect":
+            raise BatchError("client disconnected", 400)
+        body = message.get("body", b"")
+        size += len(body)
+        if size > max_bytes:
+            raise BatchError(f"request body over {max_bytes} bytes", 413)
+        parts.append(body)
+        if not message.get("more_body", False):
+            break
+    try:
+        return json.loads(b"".join(parts))
+    except ValueError:
+        return None
+
+
+async def _send(send, status: int, body: bytes, content_type: bytes,
+                headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type),
+                    (b"content-length", str(len(body)).encode())] + list(headers or ()),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status: int, data: Any,
+                     headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await _send(send, status, body, b"application/json", headers)
+
+
+app = SelectorApp()
@@ -0,0 +1,86 @@
+"""Benchmark the scoring pass of :mod:`detect_selector` on synthetic pages.
+
+Usage::
+
+    python benchmarks/bench_detect_selector.py
+    python benchmarks/bench_detect_selector.py --sizes 100 1000 10000 --legacy-max 5000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import detect_selector as ds
+
+
+def synthetic_page(nodes: int, seed: int = 0) -> str:
+    """Return a product listing page with roughly ``nodes`` elements."""
+    rng = random.Random(seed)
+    parts = ["<main class='listing'>"]
+    count = 1
+    i = 0
+    while count < nodes:
+        cls = rng.choice(["card", "item", "row", "box", f"p{rng.randint(10, 999)}"])
+        parts.append(
+            f"<div class='{cls}'><h3 class='title'>Produit {i}</h3>"
+            f"<p>Description du produit {i} avec un peu de texte.</p>"
+            f"<span class='price'>{rng.randint(1, 500)} EUR</span>"
+            f"<a href='/p/{i}'>voir</a></div>"
+        )
+        count += 5
+        i += 1
+    parts.append("</main>")
+    return "".join(parts)
+
+
+def legacy_scores(soup):
+    """Score every element the pre-annotation way (one walk per element)."""
+    return [ds.compute_score(el) for el in soup.find_all(True)]
+
+
+def annotated_scores(soup):
+    """Score every element from a single annotation pass."""
+    annotations = ds.annotate_tree(soup)
+    return [ds.compute_score(el, annotations[id(el)]) for el in soup.find_all(True)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=[100, 1_000, 5_000, 10_000, 50_000, 100_000],
+    )
+    parser.add_argument(
+        "--legacy-max", type=int, default=5_000,
+        help="Largest page scored with the quadratic legacy path",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'nodes':>8} {'legacy (s)':>12} {'annotated (s)':>14} {'µs/node':>9}")
+    for size in args.sizes:
+        soup = BeautifulSoup(synthetic_page(size), "html.parser")
+        n = len(soup.find_all(True))
+        fast, fast_scores = timed(annotated_scores, soup)
+        if size <= args.legacy_max:
+            slow, slow_scores = timed(legacy_scores, soup)
+            assert slow_scores == fast_scores
+            slow_txt = f"{slow:12.3f}"
+        else:
+            slow_txt = f"{'-':>12}"
+        print(f"{n:>8} {slow_txt} {fast:14.3f} {fast / n * 1e6:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
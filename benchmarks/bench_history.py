@@ -0,0 +1,48 @@
+"""Request-path cost of ajouter_interaction, synchronous vs batched.
+
+Usage::
+
+    python benchmarks/bench_history.py
+    python benchmarks/bench_history.py --entries 20000 --durability fsync
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import config
+from src import memoire_generale as mg
+
+ENTRY = {"html": "<div class='card'><h2 class='title'>Titre</h2></div>", "reponse": ".card .title"}
+
+
+def run(fichier, entries):
+    start = time.perf_counter()
+    for _ in range(entries):
+        mg.ajouter_interaction("prediction", ENTRY, fichier=fichier)
+    call = time.perf_counter() - start
+    mg.flush_interactions()
+    return call, time.perf_counter() - start
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--durability", choices=mg.DURABILITY_MODES, default="none")
+    args = parser.parse_args(argv)
+
+    config.HISTORY_DURABILITY = mg._writer.durability = args.durability
+    print(f"{'mode':<6} {'us/call':>8} {'total s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, asynchronous in (("sync", False), ("async", True)):
+            config.HISTORY_ASYNC = asynchronous
+            call, total = run(str(Path(tmp) / f"{mode}.jsonl"), args.entries)
+            print(f"{mode:<6} {call / args.entries * 1e6:8.1f} {total:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latency and throughput of the PyTorch and ONNX Runtime backends.
+
+Export the graphs first (``python cli.py export-onnx --quantize``).
+
+Usage::
+
+    python benchmarks/bench_onnx.py
+    python benchmarks/bench_onnx.py --model html_selector --texts 256 --batch-size 32
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from src.model_registry import ModelRegistry, registry
+from src.onnx_backend import BACKENDS, check_parity, onnx_path, sample_texts
+
+
+def single_latency(model, texts, calls):
+    """Return the median and p95 milliseconds of one-text calls."""
+    times = []
+    for text in (texts * calls)[:calls]:
+        start = time.perf_counter()
+        model.logits([text])
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95) - 1]
+
+
+def batched_throughput(model, texts, batch_size):
+    start = time.perf_counter()
+    model.logits(texts, batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="html_only_selector", choices=sorted(registry.paths))
+    parser.add_argument("--texts", type=int, default=128)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    path = Path(registry.paths[args.model])
+    texts = sample_texts(args.model, args.texts)
+    print(f"{args.model}: {len(texts)} texts from the training data")
+    print(f"{'backend':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>9} {'max|diff|':>10} {'agree':>7}")
+    for backend in BACKENDS:
+        if backend != "torch" and not onnx_path(path, backend == "onnx-int8").is_file():
+            print(f"{backend:<10} not exported")
+            continue
+        model = ModelRegistry({args.model: path}, backend=backend).get(args.model)
+        model.logits(texts[:4])  # warm up
+        p50, p95 = single_latency(model, texts, args.calls)
+        rate = batched_throughput(model, texts, args.batch_size)
+        parity = {"max_abs_diff": 0.0, "agreement": 1.0}
+        if backend != "torch":
+            parity = check_parity(path, texts, backend, args.batch_size)
+        print(
+            f"{backend:<10} {model.load_seconds:7.2f} {p50:8.2f} {p95:8.2f} {rate:9.1f} "
+            f"{parity['max_abs_diff']:10.2e} {parity['agreement']:7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Parse throughput of each installed parser backend.
+
+Usage::
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --page-nodes 20000 --repeat 5
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from html_parsing import available_backends, make_soup
+from bench_detect_selector import synthetic_page
+
+
+def load_snippets(limit: int):
+    snippets = []
+    with open(ROOT / "data" / "dataset.jsonl", encoding="utf-8") as f:
+        for line in f:
+            snippets.append(json.loads(line)["html"])
+            if len(snippets) >= limit:
+                break
+    return snippets
+
+
+def throughput(backend, docs, repeat):
+    """Return (documents/s, MB/s) for parsing ``docs`` ``repeat`` times."""
+    size = sum(len(d.encode("utf-8")) for d in docs) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for doc in docs:
+            make_soup(doc, backend)
+    elapsed = time.perf_counter() - start
+    return len(docs) * repeat / elapsed, size / elapsed / 1e6
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=2000)
+    parser.add_argument("--page-nodes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    workloads = {
+        f"{args.snippets} snippets": load_snippets(args.snippets),
+        f"page {args.page_nodes} nodes": [synthetic_page(args.page_nodes)],
+    }
+    print(f"{'backend':<12} {'workload':<22} {'docs/s':>10} {'MB/s':>8}")
+    for backend in available_backends():
+        for label, docs in workloads.items():
+            docs_s, mb_s = throughput(backend, docs, args.repeat)
+            print(f"{backend:<12} {label:<22} {docs_s:10.1f} {mb_s:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the vectorized element scoring of :mod:`selector_features`.
+
+For both engines, compares scoring every element with ``compute_score``
+and sorting the page against one feature matrix, a matrix-vector product
+and an ``argpartition`` top-k, checking that the scores and the chosen
+elements are identical. The last column is the cost of scoring the page
+again with other weights once the matrix exists.
+
+Usage::
+
+    python benchmarks/bench_selector_features.py
+    python benchmarks/bench_selector_features.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import css_selector_generator as csg
+import detect_selector as ds
+import selector_features as sf
+from bench_detect_selector import synthetic_page, timed
+
+
+def scalar_top(soup, engine, annotations, k):
+    """Score element by element and sort the page, as before."""
+    if engine == "css":
+        scores = [csg.compute_score(el) for el in soup.find_all(True)]
+    else:
+        scores = [ds.compute_score(el, annotations[id(el)]) for el in soup.find_all(True)]
+    return scores, sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+
+
+def vector_top(soup, engine, annotations, k):
+    """One feature matrix, one matrix-vector product and an argpartition."""
+    _, scores = sf.score_elements(soup, engine, annotations)
+    return scores.tolist(), sf.top_k(scores, k).tolist()
+
+
+def best(repeat, fn, *args):
+    return min((timed(fn, *args) for _ in range(repeat)), key=lambda r: r[0])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000, 100_000])
+    parser.add_argument("--top", type=int, default=3, help="Elements kept per page")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args(argv)
+
+    print(f"{'engine':>7} {'nodes':>8} {'scalar (s)':>11} {'vector (s)':>11} "
+          f"{'speedup':>8} {'dot (ms)':>9}")
+    for size in args.sizes:
+        soup = BeautifulSoup(synthetic_page(size), "html.parser")
+        annotations = ds.annotate_tree(soup)
+        n = len(soup.find_all(True))
+        for engine in ("css", "detect"):
+            slow, expected = best(args.repeat, scalar_top, soup, engine, annotations, args.top)
+            fast, result = best(args.repeat, vector_top, soup, engine, annotations, args.top)
+            assert result == expected
+            # Scoring again with other weights only costs the product
+            _, matrix = sf.extract(soup, annotations)
+            dot, _ = best(args.repeat, matrix.__matmul__, sf.engine_weights(engine))
+            print(f"{engine:>7} {n:>8} {slow:11.3f} {fast:11.3f} {slow / fast:7.1f}x "
+                  f"{dot * 1e3:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
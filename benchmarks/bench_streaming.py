@@ -0,0 +1,66 @@
+"""Peak memory of the tree-based and streaming selector detection.
+
+Usage::
+
+    python benchmarks/bench_streaming.py
+    python benchmarks/bench_streaming.py --sizes 10000 100000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import detect_selector as ds
+from bench_detect_selector import synthetic_page
+
+
+def tree_path(path):
+    with open(path, "r", encoding="utf-8") as f:
+        html = f.read()
+    ds.choose_best_elements(ds.make_soup(html, "html.parser"))
+
+
+def stream_path(path):
+    with open(path, "r", encoding="utf-8") as f:
+        ds.stream_best_elements(f)
+
+
+def measure(fn, path):
+    """Return (seconds, peak MB) for ``fn(path)``."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000, 100_000])
+    args = parser.parse_args(argv)
+
+    print(f"{'nodes':>8} {'page MB':>8} {'tree s':>8} {'tree MB':>8} {'stream s':>9} {'stream MB':>10}")
+    for size in args.sizes:
+        html = synthetic_page(size)
+        page_mb = len(html.encode("utf-8")) / 1e6
+        with tempfile.NamedTemporaryFile("w", suffix=".html", encoding="utf-8", delete=False) as f:
+            f.write(html)
+        del html
+        tree_s, tree_mb = measure(tree_path, f.name)
+        stream_s, stream_mb = measure(stream_path, f.name)
+        Path(f.name).unlink()
+        print(
+            f"{size:>8} {page_mb:8.2f} {tree_s:8.2f} {tree_mb:8.1f} "
+            f"{stream_s:9.2f} {stream_mb:10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Training throughput with fixed padding versus dynamic padding.
+
+Runs a few training steps of a task twice: the former way (every example
+padded to the task's fixed max_length, random batches) and with dynamic
+padding, length-grouped batches and the data-driven max_length.
+
+Usage::
+
+    python benchmarks/bench_training.py
+    python benchmarks/bench_training.py --task html_selector --steps 100 --base-model path/to/model
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import config
+from src import training
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task", default="html_only_selector", choices=sorted(training.TASKS))
+    parser.add_argument("--base-model", default=config.BASE_MODEL)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=config.TRAIN_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    spec = training.TASKS[args.task]
+    runs = {
+        "fixed": dict(max_length=spec.max_length, dynamic_padding=False, group_by_length=False),
+        "dynamic": dict(),
+    }
+    results = {}
+    for mode, options in runs.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            results[mode] = training.train(
+                spec, base_model=args.base_model, output_dir=Path(tmp), max_steps=args.steps,
+                batch_size=args.batch_size, save=False, **options,
+            )
+    print(f"{args.task}: {args.steps} steps of {args.batch_size} examples")
+    print(f"{'mode':<8} {'max_len':>7} {'padding':>8} {'samples/s':>10}")
+    for mode, metrics in results.items():
+        print(f"{mode:<8} {metrics['max_length']:>7} {metrics['padding_ratio']:>8.1%} "
+              f"{metrics['samples_per_second']:>10.1f}")
+    speedup = results["dynamic"]["samples_per_second"] / results["fixed"]["samples_per_second"]
+    print(f"speed-up: x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
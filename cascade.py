@@ -0,0 +1,261 @@
+"""Confidence-gated cascade from the heuristic engine to the selector models.
+
+:class:`Cascade` ranks the elements of a snippet with the cheap
+``css_selector_generator`` scoring first. When the score gap between the
+two best distinct selectors reaches ``threshold`` the heuristic answer is
+returned; otherwise the snippet is routed to the ``html_selector`` model
+(with a question) or the ``html_only_selector`` model (without). Either
+way the top-k selectors come back with softmax probabilities.
+
+Every call records which stage answered and how long each stage took, and
+the recent heuristic margins are kept so :meth:`Cascade.sweep` can show the
+routing rate and expected latency of other thresholds.
+"""
+
+import argparse
+import math
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import config
+from css_selector_generator import build_selector, refine_candidate
+from html_parsing import PARSER_BACKENDS, make_soup
+from limits import WorkLimits
+from selector_features import ranked, score_elements
+
+HEURISTIC = "heuristic"
+MODEL = "model"
+
+
+def softmax(scores: Sequence[float], temperature: float = 1.0) -> List[float]:
+    """Return the softmax of ``scores`` divided by ``temperature``."""
+    if not scores:
+        return []
+    top = max(scores)
+    exps = [math.exp((s - top) / temperature) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def heuristic_candidates(html: str, limit: int = 3, parser: Optional[str] = None,
+                         limits: Optional[WorkLimits] = None) -> List[Tuple[str, float]]:
+    """Return up to ``limit`` distinct selectors with their heuristic score.
+
+    Elements are taken by decreasing score (document order on ties), each
+    refined and turned into a selector as :func:`generate_selector` does
+    for the best one, so the first entry is its answer. ``limits`` (by
+    default those of :mod:`config`) apply as in :func:`generate_selector`;
+    when time runs out the candidates found so far are returned.
+    """
+    limits = limits or WorkLimits.from_config()
+    soup = make_soup(limits.check_input(html), parser)
+    limits.prune(soup)
+    elements, scores = score_elements(soup, "css", limits=limits)
+    candidates: Dict[str, float] = {}
+    for i in ranked(scores):
+        selector = build_selector(refine_candidate(elements[i]))
+        if selector not in candidates:
+            candidates[selector] = float(scores[i])
+            if len(candidates) >= limit or limits.out_of_time():
+                break
+    return list(candidates.items())
+
+
+@dataclass
+class CascadeResult:
+    """Selectors proposed for one snippet and how they were obtained."""
+
+    selectors: List[Tuple[str, float]]
+    stage: str
+    margin: float
+    heuristic_seconds: float
+    model_seconds: float = 0.0
+
+    @property
+    def selector(self) -> str:
+        return self.selectors[0][0] if self.selectors else ''
+
+
+@dataclass
+class _StageStats:
+    calls: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "mean_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+class Cascade:
+    """Answer with the heuristic when it is confident, else with a model."""
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        k: Optional[int] = None,
+        temperature: Optional[float] = None,
+        parser: Optional[str] = None,
+        history: int = 10000,
+    ):
+        # Defaults are read from config when the cascade is built, not at import
+        self.threshold = config.CASCADE_MARGIN if threshold is None else threshold
+        self.k = config.CASCADE_TOP_K if k is None else k
+        self.temperature = config.CASCADE_TEMPERATURE if temperature is None else temperature
+        self.parser = parser
+        self._lock = threading.Lock()
+        self._stages = {HEURISTIC: _StageStats(), MODEL: _StageStats()}
+        self._requests = 0
+        self._routed = 0
+        self._fallbacks = 0
+        self._margins: deque = deque(maxlen=history)
+
+    def predict(self, html: str, question: Optional[str] = None) -> CascadeResult:
+        """Return the top-k selectors for ``html``."""
+        start = time.perf_counter()
+        # One extra candidate so the margin exists even when k is 1
+        candidates = heuristic_candidates(html, max(self.k, 2), self.parser)
+        if len(candidates) > 1:
+            margin = candidates[0][1] - candidates[1][1]
+        else:
+            margin = math.inf
+        candidates = candidates[:self.k]
+        scores = [score for _, score in candidates]
+        result = CascadeResult(
+            selectors=list(zip((s for s, _ in candidates), softmax(scores, self.temperature))),
+            stage=HEURISTIC,
+            margin=margin,
+            heuristic_seconds=time.perf_counter() - start,
+        )
+        fallback = False
+        if margin < self.threshold:
+            start = time.perf_counter()
+            try:
+                result.selectors = self._predict_model(html, question)
+                result.stage = MODEL
+            except FileNotFoundError:
+                # No trained model: keep the heuristic answer
+                fallback = True
+            result.model_seconds = time.perf_counter() - start
+        self._record(result, fallback)
+        return result
+
+    def _predict_model(self, html: str, question: Optional[str]) -> List[Tuple[str, float]]:
+        if question:
+            from src import html_selector
+
+            return html_selector.predict_topk([question], [html], self.k)[0]
+        from src import html_only_predictor
+
+        return html_only_predictor.predict_topk([html], self.k)[0]
+
+    def _record(self, result: CascadeResult, fallback: bool) -> None:
+        with self._lock:
+            self._requests += 1
+            self._margins.append(result.margin)
+            self._stages[HEURISTIC].add(result.heuristic_seconds)
+            if result.stage == MODEL:
+                self._routed += 1
+                self._stages[MODEL].add(result.model_seconds)
+            self._fallbacks += int(fallback)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the routing rate and per-stage latency figures."""
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "requests": self._requests,
+                "routed": self._routed,
+                "routing_rate": self._routed / self._requests if self._requests else 0.0,
+                "fallbacks": self._fallbacks,
+                "heuristic": self._stages[HEURISTIC].as_dict(),
+                "model": self._stages[MODEL].as_dict(),
+            }
+
+    def sweep(self, thresholds: Sequence[float]) -> List[Dict[str, float]]:
+        """Estimate the routing rate and mean latency of other thresholds.
+
+        Uses the margins of the recent requests and the mean stage
+        latencies observed so far.
+        """
+        with self._lock:
+            margins = list(self._margins)
+            heuristic = self._stages[HEURISTIC].as_dict()["mean_seconds"]
+            model = self._stages[MODEL].as_dict()["mean_seconds"]
+        rows = []
+        for threshold in thresholds:
+            rate = sum(m < threshold for m in margins) / len(margins) if margins else 0.0
+            rows.append({
+                "threshold": threshold,
+                "routing_rate": rate,
+                "mean_seconds": heuristic + rate * model,
+            })
+        return rows
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stages = {HEURISTIC: _StageStats(), MODEL: _StageStats()}
+            self._requests = self._routed = self._fallbacks = 0
+            self._margins.clear()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_cascade() -> Cascade:
+    """Return the shared cascade configured from :mod:`config`."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Cascade()
+        return _default
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Propose CSS selectors, calling the model only when the heuristic hesitates"
+    )
+    parser.add_argument("file", nargs="?", help="HTML file, default stdin")
+    parser.add_argument("--question", default=None, help="Use the question-aware model")
+    parser.add_argument("--threshold", type=float, default=config.CASCADE_MARGIN)
+    parser.add_argument("--top-k", type=int, default=config.CASCADE_TOP_K)
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_BACKENDS + ("auto",),
+        default=None,
+        help="HTML parser backend (default from config)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            html = f.read()
+    else:
+        html = sys.stdin.read()
+
+    cascade = Cascade(args.threshold, args.top_k, parser=args.parser)
+    result = cascade.predict(html, args.question)
+    for selector, prob in result.selectors:
+        print(f"{prob:6.1%}  {selector}")
+    print(
+        f"stage={result.stage} margin={result.margin:g} "
+        f"heuristic={result.heuristic_seconds * 1000:.1f}ms model={result.model_seconds * 1000:.1f}ms",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
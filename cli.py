@@ -1,5 +1,6 @@
 import click
 import importlib
+from pathlib import Path
 
 @click.group()
 def cli():
@@ -13,45 +14,357 @@ def generate():
     mod.main()
 
 @cli.command('train-classifier')
-def train_classifier():
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped run.')
+def train_classifier(resume):
     """Train the intent classifier."""
     from src import train_classifier as tc
-    tc.main()
+    tc.main(resume=resume)
 
 @cli.command('train-selector')
-def train_selector():
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped run.')
+def train_selector(resume):
     """Train the HTML selector model."""
     from src import train_html_selector_model as th
-    th.main()
+    th.main(resume=resume)
 
 
 @cli.command('train-selector-html')
-def train_selector_html():
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped run.')
+def train_selector_html(resume):
     """Train the HTML-only selector model."""
     from src import train_html_only_selector_model as thh
-    thh.main()
+    thh.main(resume=resume)
+
+
+@cli.command()
+@click.argument('task', type=click.Choice(['classifier', 'html_selector', 'html_only_selector']))
+@click.option('--base-model', default=None, help='Model to fine-tune, default config.BASE_MODEL.')
+@click.option('--epochs', type=int, default=None, help='Default: the task default.')
+@click.option('--batch-size', type=int, default=None, help='Default: config.TRAIN_BATCH_SIZE.')
+@click.option('--max-length', type=int, default=None,
+              help='Default: a percentile of the token lengths of the training set.')
+@click.option('--dynamic-padding/--fixed-padding', default=True, show_default=True,
+              help='Pad each batch to its longest example, or every example to max-length.')
+@click.option('--group-by-length/--no-group-by-length', default=True, show_default=True,
+              help='Batch examples of similar length together.')
+@click.option('--rebuild-cache', is_flag=True, help='Tokenize again even if a cached copy exists.')
+@click.option('--streaming/--no-streaming', default=None,
+              help='Stream the data file. Default: only files over config.TRAIN_STREAMING_MIN_BYTES.')
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped run.')
+@click.option('--patience', type=int, default=None,
+              help='Evaluations without improvement before stopping, '
+                   'default config.TRAIN_EARLY_STOPPING_PATIENCE (0: never).')
+@click.option('--num-proc', type=int, default=None,
+              help='Tokenization processes, default every available core.')
+def train(task, base_model, epochs, batch_size, max_length, dynamic_padding, group_by_length,
+          rebuild_cache, streaming, resume, patience, num_proc):
+    """Train one of the models and report its throughput."""
+    import config
+    from src import training
+    if num_proc:
+        config.TRAIN_NUM_PROC = num_proc
+    metrics = training.train(
+        task, base_model=base_model, epochs=epochs, batch_size=batch_size,
+        max_length=max_length, dynamic_padding=dynamic_padding, group_by_length=group_by_length,
+        rebuild_cache=rebuild_cache, streaming=streaming, resume=resume, patience=patience,
+    )
+    cache = metrics['cache']
+    line = f"tokenized dataset: {cache['status']} in {cache['seconds']:.2f}s"
+    if 'saved_seconds' in cache:
+        line += f", {cache['saved_seconds']:.2f}s saved"
+    click.echo(line)
+    click.echo(f"{metrics['rows']['train']} train / {metrics['rows']['test']} test rows")
+    click.echo(f"{task}: max_length={metrics['max_length']} "
+               f"padding={metrics['padding_ratio']:.1%} "
+               f"{metrics['samples_per_second']:.1f} samples/s")
+    if metrics['resumed_from']:
+        click.echo(f"resumed from {metrics['resumed_from']}")
+    if metrics['stopped']:
+        click.echo(f"stopped at step {metrics['steps']}; continue with --resume")
+    elif metrics['early_stopped']:
+        click.echo(f"early stop at step {metrics['steps']}")
+    if metrics['best_step'] is not None:
+        click.echo(f"best checkpoint: step {metrics['best_step']}, "
+                   f"{config.TRAIN_BEST_METRIC}={metrics['best_metric']:.3f}")
+
+
+@cli.command('train-incremental')
+@click.argument('task', type=click.Choice(['html_selector', 'html_only_selector']))
+@click.option('--since', default=None,
+              help='ISO timestamp of the first history entry, default the end of the last round.')
+@click.option('--replay-ratio', type=float, default=None,
+              help='Old rows replayed per new row, default config.INCREMENTAL_REPLAY_RATIO.')
+@click.option('--epochs', type=int, default=None, help='Default: config.INCREMENTAL_EPOCHS.')
+@click.option('--batch-size', type=int, default=None, help='Default: config.TRAIN_BATCH_SIZE.')
+def train_incremental(task, since, replay_ratio, epochs, batch_size):
+    """Continue the saved model on the labels logged since the last round."""
+    from src import incremental
+    summary = incremental.train_incremental(
+        task, since=since, replay_ratio=replay_ratio, epochs=epochs, batch_size=batch_size,
+    )
+    if summary['status'] == 'up to date':
+        click.echo(f"{task}: no new labels since {summary['since']}")
+        return
+    click.echo(f"{task}: {summary['new_rows']} new + {summary['replay_rows']} replayed rows, "
+               f"{summary['added_labels']} new selectors ({summary['labels']} in all)")
+    for name, accuracy in summary['accuracy'].items():
+        click.echo(f"accuracy on {name} rows: {accuracy:.3f}")
+    click.echo(f"done in {summary['seconds']:.1f}s")
+
+
+@cli.command()
+@click.argument('selector')
+@click.argument('file', required=False, type=click.Path())
+@click.option('--question', default=None, help='Question the selector answers (html_selector).')
+@click.option('--predicted', default=None, help='Selector that was proposed, if any.')
+def label(selector, file, question, predicted):
+    """Record SELECTOR as the right answer for the HTML of FILE (or stdin).
+
+    Labels are the rows 'train-incremental' learns from.
+    """
+    from src import incremental
+    from src.memoire_generale import flush_interactions
+    if file:
+        with open(file, 'r', encoding='utf-8') as f:
+            html = f.read()
+    else:
+        import sys
+        html = sys.stdin.read()
+    incremental.record_label(html, selector, question, predicted)
+    flush_interactions()
+
+
+@cli.command()
+@click.argument('task', type=click.Choice(['classifier', 'html_selector', 'html_only_selector']))
+@click.option('--output', type=click.Path(), default=None,
+              help='Student model directory, default <model dir>_student.')
+@click.option('--layers', type=int, default=None, help='Default: config.DISTILL_LAYERS.')
+@click.option('--dim', type=int, default=None, help='Hidden size, default config.DISTILL_DIM.')
+@click.option('--hidden-dim', type=int, default=None,
+              help='Feed-forward size, default config.DISTILL_HIDDEN_DIM.')
+@click.option('--heads', type=int, default=None, help='Default: config.DISTILL_HEADS.')
+@click.option('--prune-vocab/--full-vocab', default=None,
+              help='Keep only the tokens of the dataset. Default: config.DISTILL_PRUNE_VOCAB.')
+@click.option('--epochs', type=int, default=None, help='Default: config.DISTILL_EPOCHS.')
+@click.option('--batch-size', type=int, default=None, help='Default: config.TRAIN_BATCH_SIZE.')
+def distill(task, output, layers, dim, hidden_dim, heads, prune_vocab, epochs, batch_size):
+    """Train a small student of a trained model and compare the two."""
+    from src import distillation
+    result = distillation.distill(
+        task, output_dir=Path(output) if output else None, layers=layers, dim=dim,
+        hidden_dim=hidden_dim, heads=heads, prune_vocab=prune_vocab, epochs=epochs,
+        batch_size=batch_size,
+    )
+    vocab = result['vocab_size']
+    click.echo(f"student saved in {result['output_dir']} "
+               f"(vocabulary {vocab['student']} / {vocab['teacher']} tokens)")
+    texts, labels = result['test']
+    rows = distillation.compare(
+        {'teacher': result['teacher_dir'], 'student': result['output_dir']}, texts, labels
+    )
+    click.echo(f"{len(texts)} test rows")
+    click.echo(f"{'model':<8} {'params M':>9} {'size MB':>8} {'p50 ms':>7} {'texts/s':>8} "
+               f"{'accuracy':>9} {'agree':>6}")
+    for row in rows:
+        if not texts:
+            click.echo(f"{row['model']:<8} {row['params'] / 1e6:9.2f} {row['size_bytes'] / 1e6:8.1f}")
+            continue
+        click.echo(f"{row['model']:<8} {row['params'] / 1e6:9.2f} {row['size_bytes'] / 1e6:8.1f} "
+                   f"{row['latency_ms']:7.2f} {row['texts_per_second']:8.1f} "
+                   f"{row['accuracy']:9.3f} {row['agreement']:6.3f}")
+
+
+@cli.command('train-ranker')
+@click.option('--data-file', type=click.Path(), default=None,
+              help='CSV of html,selector rows, default config.HTML_ONLY_SELECTOR_FILE.')
+@click.option('--output', type=click.Path(), default=None,
+              help='Directory of the ranker, default config.RANKER_MODEL_DIR.')
+@click.option('--max-rows', type=int, default=None, help='Read at most this many rows.')
+def train_ranker(data_file, output, max_rows):
+    """Train the candidate selector ranker and compare it with the heuristic."""
+    from src import selector_ranker
+    metrics = selector_ranker.train_ranker(
+        Path(data_file) if data_file else None, Path(output) if output else None,
+        max_rows=max_rows,
+    )
+    click.echo(f"ranker saved in {metrics['path']} "
+               f"({metrics['train_candidates']} training candidates, {metrics['seconds']:.1f}s)")
+    if metrics['uncovered']:
+        click.echo(f"{metrics['uncovered']} snippets skipped: no candidate matches their selector")
+    click.echo(f"top-1 accuracy on {metrics['test_snippets']} test snippets: "
+               f"ranker {metrics['accuracy']:.3f}, heuristic {metrics['heuristic_accuracy']:.3f}")
 
 
 @cli.command('predict-selector-html')
 @click.argument('file', required=False, type=click.Path())
-def predict_selector_html(file):
-    """Predict CSS selector from a HTML snippet."""
-    from src import html_only_predictor as hp
+@click.option('--batch-size', default=32, show_default=True,
+              help='Snippets per forward pass for directory/JSONL input.')
+@click.option('--ranker', is_flag=True, help='Rank candidate selectors instead of classifying.')
+def predict_selector_html(file, batch_size, ranker):
+    """Predict CSS selector from a HTML snippet.
+
+    FILE may also be a directory of HTML files or a JSONL file with an
+    ``html`` field; one JSON line is then written per snippet.
+    """
+    if ranker:
+        from src import selector_ranker
+        predict_one = selector_ranker.predict_selector
+
+        def predict_many(htmls, _batch_size):
+            return [predict_one(html) for html in htmls]
+    else:
+        from src import html_only_predictor as hp
+        predict_one, predict_many = hp.predict_selector, hp.predict_selectors
+    if file and (Path(file).is_dir() or file.endswith('.jsonl')):
+        import json
+        from itertools import islice
+        import css_selector_generator as csg
+        sources = csg.iter_html_sources(file)
+        # Sort within windows of several batches to keep memory bounded
+        while True:
+            window = list(islice(sources, batch_size * 16))
+            if not window:
+                break
+            names = [name for name, _ in window]
+            selectors = predict_many([html for _, html in window], batch_size)
+            for name, selector in zip(names, selectors):
+                click.echo(json.dumps({'source': name, 'selector': selector}, ensure_ascii=False))
+        return
     if file:
         with open(file, 'r', encoding='utf-8') as f:
             html = f.read()
     else:
         import sys
         html = sys.stdin.read()
-    selector = hp.predict_selector(html)
+    selector = predict_one(html)
     click.echo(selector)
 
+@cli.command('batch-selectors')
+@click.argument('source')
+@click.option('--workers', '-w', default=1, show_default=True, help='Number of worker processes.')
+@click.option('--chunksize', default=64, show_default=True, help='Snippets sent to a worker at once.')
+@click.option('--unordered', is_flag=True, help='Write results as soon as they are ready.')
+@click.option('--output', '-o', type=click.Path(), help='Output JSONL file, default stdout.')
+@click.option('--parser', default=None, help='HTML parser backend.')
+def batch_selectors(source, workers, chunksize, unordered, output, parser):
+    """Generate selectors for a directory, glob or JSONL file of snippets."""
+    import json
+    import sys
+    import time
+    import css_selector_generator as csg
+
+    # Sources of the snippets in flight: generate_selectors reads one window
+    # ahead and each entry is dropped once its result is written
+    names = {}
+
+    def snippets():
+        for index, (name, html) in enumerate(csg.iter_html_sources(source)):
+            names[index] = name
+            yield html
+
+    out = open(output, 'w', encoding='utf-8') if output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    try:
+        results = csg.generate_selectors(
+            snippets(), workers=workers, chunksize=chunksize,
+            ordered=not unordered, parser=parser,
+        )
+        for index, selector in results:
+            record = {'source': names.pop(index), 'selector': selector}
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    finally:
+        if output:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0.0
+    click.echo(f'{count} snippets in {elapsed:.2f}s ({rate:.1f}/s, {workers} worker(s))', err=True)
+
+@cli.command()
+@click.option('--load', 'to_load', multiple=True,
+              help='Load this model before reporting (repeatable, or "all").')
+def models(to_load):
+    """Show load time and memory of the registered models."""
+    from src.model_registry import registry
+    names = list(registry.paths) if 'all' in to_load else list(to_load)
+    for name in names:
+        try:
+            registry.get(name)
+        except (FileNotFoundError, KeyError) as e:
+            click.echo(f'{name}: {e}', err=True)
+    click.echo(f"{'model':<20} {'loaded':<7} {'load s':>7} {'params MB':>10} {'RSS MB':>8}")
+    for name, info in registry.stats().items():
+        if info['loaded']:
+            figures = (
+                f"{info['load_seconds']:7.2f} {info['param_bytes'] / 1e6:10.1f} "
+                f"{info['rss_bytes'] / 1e6:8.1f}"
+            )
+        else:
+            figures = f"{'-':>7} {'-':>10} {'-':>8}"
+        click.echo(f"{name:<20} {str(info['loaded']):<7} {figures}")
+
+@cli.command('export-onnx')
+@click.option('--model', 'names', multiple=True,
+              help='Model to export (repeatable), default all trained models.')
+@click.option('--quantize', is_flag=True, help='Also write a dynamic int8 graph.')
+@click.option('--check/--no-check', default=True, show_default=True,
+              help='Compare ONNX and PyTorch logits on dataset samples.')
+def export_onnx(names, quantize, check):
+    """Export the trained models to ONNX for ONNX Runtime inference."""
+    from src import onnx_backend
+    from src.model_registry import registry
+    for name in names or registry.paths:
+        path = Path(registry.paths[name])
+        if not path.exists():
+            click.echo(f'{name}: skipped, {path} not found', err=True)
+            continue
+        written = onnx_backend.export_onnx(path, quantize=quantize)
+        for backend, graph in written.items():
+            line = f'{name:<20} {backend:<10} {graph.stat().st_size / 1e6:8.1f} MB  {graph}'
+            if check:
+                parity = onnx_backend.check_parity(path, onnx_backend.sample_texts(name), backend)
+                line += (f"  max|diff|={parity['max_abs_diff']:.2e}"
+                         f"  agreement={parity['agreement']:.1%}")
+            click.echo(line)
+
 @cli.command()
-def serve():
+@click.option('--workers', '-w', type=int, default=None,
+              help='Serve from N prefork worker processes instead of the dev server.')
+@click.option('--host', default=None, help='Bind address, default config.FLASK_HOST.')
+@click.option('--port', type=int, default=None, help='Port, default config.FLASK_PORT.')
+@click.option('--threads', type=int, default=None, help='PyTorch threads per worker.')
+def serve(workers, host, port, threads):
     """Run the Flask web interface."""
     import web_interface as wi
     import config
-    wi.app.run(debug=config.FLASK_DEBUG, host=config.FLASK_HOST, port=config.FLASK_PORT)
+    host = host or config.FLASK_HOST
+    port = port if port is not None else config.FLASK_PORT
+    if workers:
+        from server import serve_prefork
+        serve_prefork(wi.app, wi.ready, host, port, workers, threads)
+        return
+    wi.ready.set()
+    wi.app.run(debug=config.FLASK_DEBUG, host=host, port=port)
+
+@cli.command('serve-asgi')
+@click.option('--host', default=None, help='Bind address, default config.FLASK_HOST.')
+@click.option('--port', type=int, default=None, help='Port, default config.FLASK_PORT.')
+@click.option('--workers', '-w', default=1, show_default=True, help='Number of worker processes.')
+def serve_asgi(host, port, workers):
+    """Run the asynchronous ASGI service with uvicorn."""
+    import config
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException('serve-asgi needs uvicorn: pip install uvicorn')
+    uvicorn.run(
+        'asgi_app:app',
+        host=host or config.FLASK_HOST,
+        port=port if port is not None else config.FLASK_PORT,
+        workers=workers,
+        lifespan='on',
+    )
 
 if __name__ == '__main__':
     cli()
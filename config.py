@@ -13,13 +13,144 @@ HTML_ONLY_SELECTOR_FILE = DATA_DIR / "dataset_with_selector.csv"
 CLASSIFIER_MODEL_DIR = MODEL_DIR / "trained_model"
 HTML_SELECTOR_MODEL_DIR = MODEL_DIR / "html_selector"
 HTML_ONLY_SELECTOR_MODEL_DIR = MODEL_DIR / "html_only_selector"
+RANKER_MODEL_DIR = MODEL_DIR / "html_selector_ranker"
 
 # Training hyperparameters
 TRAIN_EPOCHS = 5
 TRAIN_BATCH_SIZE = 8
 LEARNING_RATE = 5e-5
+BASE_MODEL = "distilbert-base-multilingual-cased"
+# max_length = this percentile of the training token lengths, capped per task
+TRAIN_LENGTH_PERCENTILE = 95
+# Tokenized training datasets kept between runs (None = no cache)
+TOKENIZED_CACHE_DIR = DATA_DIR / "cache" / "tokenized"
+# Tokenization processes (None = every available core); datasets under
+# TRAIN_ROWS_PER_PROC rows per process are tokenized in-process
+TRAIN_NUM_PROC = None
+TRAIN_ROWS_PER_PROC = 20000
+# Data files this large are streamed instead of converted to Arrow
+TRAIN_STREAMING_MIN_BYTES = 2 * 1024 ** 3
+TRAIN_SHUFFLE_BUFFER = 10000  # rows shuffled together when streaming
+TRAIN_STREAM_GROUP_ROWS = 1024  # streamed rows grouped by length together
+TRAIN_LENGTH_SAMPLE = 10000  # texts measured to choose max_length
+# Evaluation at every checkpoint: training stops after this many
+# evaluations without TRAIN_BEST_METRIC improving by the threshold
+# (0 = never), and the best checkpoint is kept as the model
+TRAIN_BEST_METRIC = "accuracy"
+TRAIN_EARLY_STOPPING_PATIENCE = 3
+TRAIN_EARLY_STOPPING_THRESHOLD = 0.0
+# Incremental rounds (`python cli.py train-incremental`) continue the saved
+# model on the new history rows plus INCREMENTAL_REPLAY_RATIO old rows each
+INCREMENTAL_EPOCHS = 2
+INCREMENTAL_LEARNING_RATE = 2e-5
+INCREMENTAL_REPLAY_RATIO = 1.0
+# Candidate ranker (src/selector_ranker.py): elements whose selectors are scored
+RANKER_MAX_ELEMENTS = 20
+# Element scoring (selector_features.py): JSON {feature: weight} files
+# replacing the built-in weights of each engine (None = built-in)
+CSS_SCORE_WEIGHTS_FILE = None
+DETECT_SCORE_WEIGHTS_FILE = None
+# Students trained by `python cli.py distill` (src/distillation.py)
+DISTILL_LAYERS = 2
+DISTILL_DIM = 256
+DISTILL_HIDDEN_DIM = 1024
+DISTILL_HEADS = 4
+DISTILL_PRUNE_VOCAB = True  # keep only the tokens found in the dataset
+DISTILL_TEMPERATURE = 2.0
+DISTILL_ALPHA = 0.5  # weight of the teacher's soft targets against the labels
+DISTILL_EPOCHS = 10
+DISTILL_LEARNING_RATE = 1e-4
 
 # Flask configuration
 FLASK_DEBUG = True
 FLASK_HOST = "127.0.0.1"
 FLASK_PORT = 5000
+
+# HTML parser backend for the heuristic engines
+# ("html.parser", "lxml", "selectolax" or "auto")
+PARSER_BACKEND = "html.parser"
+
+# Entries kept by each memoized id/class classification cache
+TOKEN_CACHE_SIZE = 4096
+
+# Model registry budget (None = unlimited): number of models kept loaded
+# and total parameter bytes before least recently used models are unloaded
+MODEL_REGISTRY_MAX_MODELS = None
+MODEL_REGISTRY_MAX_BYTES = None
+
+# Micro-batching of concurrent predictions (html_selector, html_only_selector):
+# requests are grouped for up to MICRO_BATCH_WAIT_MS or MICRO_BATCH_MAX_SIZE
+MICRO_BATCHING = False
+MICRO_BATCH_MAX_SIZE = 16
+MICRO_BATCH_WAIT_MS = 5.0
+
+# Inference backend of the predictors: "torch", "onnx" or "onnx-int8"
+# (the ONNX graphs are written by "python cli.py export-onnx")
+INFERENCE_BACKEND = "torch"
+
+# Heuristic -> model cascade (cascade.py). The model is only called when the
+# heuristic score gap between the two best selectors is below CASCADE_MARGIN.
+# The web interface uses the cascade instead of the heuristic alone when
+# CASCADE_ENABLED is set.
+CASCADE_ENABLED = False
+CASCADE_MARGIN = 2.0
+CASCADE_TOP_K = 3
+CASCADE_TEMPERATURE = 2.0
+
+# Prediction cache (src/prediction_cache.py): entries kept in memory
+# (0 disables the memory tier) and optional SQLite file shared by processes
+PREDICTION_CACHE_SIZE = 1024
+PREDICTION_CACHE_PATH = None  # e.g. DATA_DIR / "prediction_cache.sqlite"
+# Latest entries kept in the SQLite file, older ones are deleted (None = no bound)
+PREDICTION_CACHE_DISK_SIZE = 100_000
+
+# Interaction history (src/memoire_generale.py): entries are appended by a
+# background thread in batches of HISTORY_BATCH_SIZE or every
+# HISTORY_FLUSH_INTERVAL seconds. HISTORY_DURABILITY is "none", "flush"
+# (fdatasync per batch) or "fsync".
+HISTORY_ASYNC = True
+HISTORY_BATCH_SIZE = 64
+HISTORY_FLUSH_INTERVAL = 0.5
+HISTORY_DURABILITY = "none"
+# Rotation of the history file into data/historique/ segments
+HISTORY_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+HISTORY_ROTATE_DAILY = True
+HISTORY_COMPRESS_SEGMENTS = True
+
+# Work limits per snippet for the heuristic engines (None = unlimited).
+# LIMIT_MODE "truncate" cuts the input, prunes the tree or returns the best
+# selector found in time; "error" raises limits.LimitExceeded instead.
+MAX_INPUT_BYTES = 10 * 1024 * 1024
+MAX_NODES = 200000
+MAX_DEPTH = 512
+MAX_SECONDS = 5.0
+LIMIT_MODE = "truncate"
+# Ancestors css_selector_generator.build_selector walks up at most
+BUILD_SELECTOR_MAX_LEVELS = 64
+
+# Stage tracing (tracing.py): per-stage histograms served at /metrics and,
+# with TRACE_FILE, one JSON line per request with its spans
+TRACING_ENABLED = False
+TRACE_FILE = None  # e.g. DATA_DIR / "traces.jsonl"
+
+# JSON batch API (/api/v1/selectors)
+API_MAX_BATCH = 256
+API_DEFAULT_ENGINE = "heuristic"  # "heuristic", "cascade", "model" or "ranker"
+
+# Async ASGI service (asgi_app.py, `python cli.py serve-asgi`).
+# Per route: (requests processed at once, requests allowed to wait);
+# further requests get 429.
+ASGI_ROUTE_LIMITS = {
+    "/api/v1/selectors": (8, 64),
+    "/api/v1/selectors/stream": (2, 8),
+}
+ASGI_REQUEST_TIMEOUT = 10.0  # seconds, including the time spent queued
+ASGI_CPU_WORKERS = 4  # threads running the heuristic
+ASGI_MODEL_WORKERS = 1  # threads running the models (PyTorch uses its own threads)
+ASGI_POOL_BACKLOG = 32  # tasks queued per pool beyond its workers
+# Request bodies are read once a route slot is taken, so a full queue
+# answers 429 before any upload; above these sizes, 413
+ASGI_SELECTORS_MAX_BODY_BYTES = 2 * 1024 * 1024
+ASGI_MAX_BODY_BYTES = 32 * 1024 * 1024  # streaming route
+ASGI_STREAM_MAX_ITEMS = 10000
+ASGI_STREAM_CHUNK = 16  # snippets computed per NDJSON write
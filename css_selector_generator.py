@@ -1,7 +1,18 @@
 import sys
 import re
+import glob
+import json
 import argparse
+from functools import lru_cache, partial
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 from bs4 import BeautifulSoup
+from html_parsing import PARSER_BACKENDS, make_soup
+from limits import WorkLimits, record as record_limit
+from tracing import span
+import config
 
 INLINE_TAGS = {
     "span", "i", "b", "em", "strong", "small", "label"
@@ -25,17 +36,54 @@ POSITIVE_KEYWORDS = {
     "item", "nav", "link", "button"
 }
 
+_DYNAMIC_ID_RE = re.compile(r"\d{2,}")
+# One alternation matching any positive keyword in a single scan
+_KEYWORD_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(POSITIVE_KEYWORDS, key=len, reverse=True))
+)
+_CLASS_RE = re.compile(r'\.([\w-]+)')
+
+# Pages repeat the same few hundred ids and class names, so the token
+# predicates below are memoized (sized by config.TOKEN_CACHE_SIZE).
+@lru_cache(maxsize=config.TOKEN_CACHE_SIZE)
 def is_dynamic_id(value: str) -> bool:
     """Return True if the id looks auto‑generated (contains long digits)."""
-    return bool(re.search(r"\d{2,}", value)) or len(value) > 30
+    return bool(_DYNAMIC_ID_RE.search(value)) or len(value) > 30
 
+@lru_cache(maxsize=config.TOKEN_CACHE_SIZE)
 def has_keyword(value: str) -> bool:
-    low = value.lower()
-    return any(k in low for k in POSITIVE_KEYWORDS)
+    return _KEYWORD_RE.search(value.lower()) is not None
 
+@lru_cache(maxsize=config.TOKEN_CACHE_SIZE)
 def is_generic(value: str) -> bool:
     return value.lower() in GENERIC_CLASSES
 
+_TOKEN_CACHES = {
+    "is_dynamic_id": is_dynamic_id,
+    "has_keyword": has_keyword,
+    "is_generic": is_generic,
+}
+
+def token_cache_info() -> Dict[str, Dict[str, float]]:
+    """Return hit/miss statistics of the token classification caches."""
+    stats = {}
+    for name, fn in _TOKEN_CACHES.items():
+        info = fn.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+    return stats
+
+def clear_token_cache() -> None:
+    """Empty the token classification caches and reset their statistics."""
+    for fn in _TOKEN_CACHES.values():
+        fn.cache_clear()
+
 def compute_score(tag) -> int:
     score = 0
     name = tag.name.lower()
@@ -64,15 +112,32 @@ def compute_score(tag) -> int:
                 score += 1
     return score
 
-def choose_best_element(soup: BeautifulSoup):
-    best = None
-    best_score = float('-inf')
-    for el in soup.find_all(True):
-        sc = compute_score(el)
-        if sc > best_score:
-            best_score = sc
-            best = el
-    return best
+def choose_best_element(soup: BeautifulSoup, limits: Optional[WorkLimits] = None):
+    """Return the highest scoring element, the first one on ties.
+
+    Every element is scored at once by :mod:`selector_features` (the
+    weights of :func:`compute_score` unless ``config.CSS_SCORE_WEIGHTS_FILE``
+    is set). When ``limits`` runs out of time the best element so far is
+    returned.
+    """
+    from selector_features import score_elements
+
+    elements, scores = score_elements(soup, "css", limits=limits)
+    if not elements:
+        return None
+    # argmax keeps the first element on ties
+    return elements[int(scores.argmax())]
+
+def stream_best_element(source):
+    """Like :func:`choose_best_element` followed by :func:`refine_candidate`,
+    reading the HTML incrementally from a file object with bounded memory.
+    """
+    from streaming_selector import stream_best_elements
+
+    best = stream_best_elements(
+        source, lambda tag, stats: compute_score(tag), build_selector, limit=1
+    )
+    return best[0] if best else None
 
 def refine_candidate(el):
     """If the element contains a single anchor, return that anchor."""
@@ -89,7 +154,12 @@ def build_selector(elem) -> str:
     parts = []
     current = elem
     first = True
+    levels = 0
     while current and current.name != '[document]':
+        levels += 1
+        if levels > config.BUILD_SELECTOR_MAX_LEVELS:
+            record_limit("levels")
+            break
         if has_good_id(current):
             parts.append(f"#{current['id']}")
             break
@@ -182,7 +252,7 @@ def _score_candidate(selector: str) -> float:
         score += 100
     if selector and selector[0].isalpha():
         score += 5
-    classes = re.findall(r'\.([\w-]+)', selector)
+    classes = _CLASS_RE.findall(selector)
     for cls in classes:
         if is_generic(cls):
             score -= 8
@@ -212,15 +282,87 @@ def display_choices(tag) -> None:
         print(f"{idx}. {sel}\n   \u2192 {exp}\n")
     print(f"\u2705 Choix recommand\u00e9 : {best}")
 
-def generate_selector(html: str) -> str:
-    """Return the best CSS selector for the given HTML snippet."""
-    soup = BeautifulSoup(html, 'html.parser')
-    target = choose_best_element(soup)
-    if target:
-        target = refine_candidate(target)
+def generate_selector(
+    html: str, parser: Optional[str] = None, limits: Optional[WorkLimits] = None
+) -> str:
+    """Return the best CSS selector for the given HTML snippet.
+
+    ``parser`` selects the parser backend (see :mod:`html_parsing`) and
+    ``limits`` the work limits, by default those of :mod:`config`.
+    """
+    limits = limits or WorkLimits.from_config()
+    with span("css.parse"):
+        soup = make_soup(limits.check_input(html), parser)
+        limits.prune(soup)
+    with span("css.score"):
+        target = choose_best_element(soup, limits)
     if target is None:
         return ''
-    return build_selector(target)
+    with span("css.build_selector"):
+        return build_selector(refine_candidate(target))
+
+def _generate_indexed(item: Tuple[int, str], parser: Optional[str] = None) -> Tuple[int, str]:
+    index, html = item
+    return index, generate_selector(html, parser)
+
+def generate_selectors(
+    snippets: Iterable[str],
+    workers: int = 1,
+    chunksize: int = 64,
+    ordered: bool = True,
+    parser: Optional[str] = None,
+    window: Optional[int] = None,
+) -> Iterator[Tuple[int, str]]:
+    """Yield ``(index, selector)`` for every snippet of ``snippets``.
+
+    With ``workers`` > 1 the snippets are sent to a process pool in chunks
+    of ``chunksize``. Results come back in input order unless ``ordered``
+    is False, in which case they are yielded as soon as they are ready
+    within each window. The input is read ``window`` snippets at a time
+    (four chunks per worker by default) and the next window is only read
+    once the previous one is done, so memory stays bounded when it is a
+    generator over a large corpus.
+    """
+    items = enumerate(snippets)
+    work = partial(_generate_indexed, parser=parser)
+    if workers <= 1:
+        yield from map(work, items)
+        return
+    window = window or chunksize * workers * 4
+    with Pool(workers) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        while True:
+            batch = list(islice(items, window))
+            if not batch:
+                break
+            yield from mapper(work, batch, chunksize)
+
+def iter_html_sources(source: str) -> Iterator[Tuple[str, str]]:
+    """Yield ``(name, html)`` pairs from a directory, glob or JSONL file.
+
+    A directory yields every ``*.html``/``*.htm`` file below it, a JSONL
+    file yields the ``html`` field of each line (named ``file:line``) and
+    anything else is treated as a glob pattern.
+    """
+    path = Path(source)
+    if path.is_dir():
+        files = sorted(
+            p for p in path.rglob('*') if p.suffix.lower() in {'.html', '.htm'}
+        )
+    elif path.is_file() and path.suffix.lower() == '.jsonl':
+        with path.open('r', encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield f"{path}:{lineno}", json.loads(line)['html']
+        return
+    elif path.is_file():
+        files = [path]
+    else:
+        files = [Path(p) for p in sorted(glob.glob(source, recursive=True))]
+    for file in files:
+        with file.open('r', encoding='utf-8') as f:
+            yield str(file), f.read()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -229,18 +371,38 @@ def main():
     parser.add_argument(
         "file", nargs="?", help="Optional HTML file. If omitted, read from stdin"
     )
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_BACKENDS + ("auto",),
+        default=None,
+        help="HTML parser backend (default from config)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the input incrementally with bounded memory (large pages)",
+    )
     args = parser.parse_args()
 
-    if args.file:
-        with open(args.file, 'r', encoding='utf-8') as f:
-            html = f.read()
+    if args.stream:
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                target = stream_best_element(f)
+        else:
+            target = stream_best_element(sys.stdin)
     else:
-        html = sys.stdin.read()
-
-    soup = BeautifulSoup(html, 'html.parser')
-    target = choose_best_element(soup)
-    if target:
-        target = refine_candidate(target)
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                html = f.read()
+        else:
+            html = sys.stdin.read()
+
+        limits = WorkLimits.from_config()
+        soup = make_soup(limits.check_input(html), args.parser)
+        limits.prune(soup)
+        target = choose_best_element(soup, limits)
+        if target:
+            target = refine_candidate(target)
     if target is None:
         return
 
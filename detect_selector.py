@@ -1,9 +1,22 @@
 import sys
-import re
 import argparse
-from typing import List, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
 from src.memoire_generale import ajouter_interaction
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from html_parsing import PARSER_BACKENDS, make_soup
+from limits import WorkLimits
+from tracing import span
+# The memoized token predicates (and through them the generic classes and
+# positive keywords) are shared with css_selector_generator so both engines
+# use the same caches
+from css_selector_generator import (
+    has_keyword,
+    is_dynamic_id,
+    is_generic,
+)
 
 # Inline and structural tags used to weight candidate elements
 INLINE_TAGS = {
@@ -19,33 +32,87 @@ STRUCTURAL_TAGS = {
 # Tags that are too generic to rely on when building a selector
 GENERIC_TAGS = {"div", "span", "li", "ul", "ol", "p"}
 
-# Classes considered generic and usually not helpful for a selector
-GENERIC_CLASSES = {
-    "container", "wrapper", "wrap", "box", "block",
-    "row", "col", "inner", "outer", "bold"
-}
+# String types counted by ``Tag.get_text`` for ordinary elements
+_MAIN_STRING_TYPES = {NavigableString, CData}
 
-# Keywords that hint an element is interesting (title, card, ...)
-POSITIVE_KEYWORDS = {
-    "title", "desc", "description", "content", "card",
-    "item", "nav", "link", "button"
-}
 
-def is_dynamic_id(value: str) -> bool:
-    """Return True if the id looks auto-generated (contains long digits)."""
-    return bool(re.search(r"\d{2,}", value)) or len(value) > 30
+@dataclass
+class NodeStats:
+    """Structural facts about an element used by the scoring functions."""
+
+    depth: int = 0
+    text_length: int = 0
+    descendants: int = 0
+    anchors: int = 0
+    first_anchor: Optional[Tag] = None
+
+
+def node_stats(tag) -> NodeStats:
+    """Compute the statistics of a single element by walking the tree."""
+    depth = 0
+    parent = tag.parent
+    while parent and parent.name != '[document]':
+        depth += 1
+        parent = parent.parent
+    anchors = tag.find_all('a', recursive=True)
+    return NodeStats(
+        depth=depth,
+        text_length=len(tag.get_text(strip=True)),
+        descendants=len(tag.find_all(True)),
+        anchors=len(anchors),
+        first_anchor=anchors[0] if anchors else None,
+    )
+
+
+def annotate_tree(soup: BeautifulSoup) -> Dict[int, NodeStats]:
+    """Return :class:`NodeStats` for every element, keyed by ``id(tag)``.
+
+    The tree is visited once top-down for depths and once bottom-up to
+    aggregate text length, descendant and anchor counts, so annotating a
+    page is linear in its size instead of quadratic.
+    """
+    stats: Dict[int, NodeStats] = {}
+    tags: List[Tag] = []
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            parent = stats.get(id(node.parent))
+            stats[id(node)] = NodeStats(depth=parent.depth + 1 if parent else 0)
+            tags.append(node)
+        elif type(node) in _MAIN_STRING_TYPES:
+            owner = stats.get(id(node.parent))
+            if owner is not None:
+                owner.text_length += len(node.strip())
+
+    # Reversed document order visits children before their parents
+    for tag in reversed(tags):
+        own = stats[id(tag)]
+        if tag.interesting_string_types != _MAIN_STRING_TYPES:
+            # script, style, template... only count their own string type
+            own.text_length = len(tag.get_text(strip=True))
+        parent = stats.get(id(tag.parent))
+        if parent is None:
+            continue
+        if tag.interesting_string_types == _MAIN_STRING_TYPES:
+            parent.text_length += own.text_length
+        parent.descendants += own.descendants + 1
+        if tag.name == 'a':
+            parent.anchors += own.anchors + 1
+            parent.first_anchor = tag
+        else:
+            parent.anchors += own.anchors
+            if own.first_anchor is not None:
+                parent.first_anchor = own.first_anchor
+    return stats
 
-def has_keyword(value: str) -> bool:
-    """Return True if the given string contains a positive keyword."""
-    low = value.lower()
-    return any(k in low for k in POSITIVE_KEYWORDS)
 
-def is_generic(value: str) -> bool:
-    """Return True if the class name is too generic."""
-    return value.lower() in GENERIC_CLASSES
+def compute_score(tag, stats: Optional[NodeStats] = None) -> int:
+    """Score an element to estimate how good it is as a target.
 
-def compute_score(tag) -> int:
-    """Score an element to estimate how good it is as a target."""
+    ``stats`` comes from :func:`annotate_tree`; when omitted the element's
+    statistics are computed on the fly.
+    """
+    if stats is None:
+        stats = node_stats(tag)
     score = 0
     name = tag.name.lower()
 
@@ -55,16 +122,11 @@ def compute_score(tag) -> int:
         score += 2
 
     # Penalise very deep elements
-    depth = 0
-    parent = tag.parent
-    while parent and parent.name != '[document]':
-        depth += 1
-        parent = parent.parent
-    score -= depth
+    score -= stats.depth
 
     # Favour elements that contain a fair amount of text
-    text_length = len(tag.get_text(strip=True))
-    density = text_length / (len(tag.find_all(True)) + 1)
+    text_length = stats.text_length
+    density = text_length / (stats.descendants + 1)
     if text_length > 40:
         score += 2
     elif text_length > 15:
@@ -97,37 +159,71 @@ def compute_score(tag) -> int:
                 score += 1
     return score
 
-def choose_best_elements(soup: BeautifulSoup, mode: str = 'all', limit: int = 3):
-    """Return a list of promising elements in the snippet."""
-    candidates: List[Tuple[int, any]] = []
-    for el in soup.find_all(True):
-        if mode == 'links' and el.name != 'a':
-            continue
-        if mode == 'text' and el.name not in {
-            'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'
-        }:
-            continue
-        sc = compute_score(el)
-        candidates.append((sc, el))
-    candidates.sort(key=lambda x: x[0], reverse=True)
+def matches_mode(name: str, mode: str) -> bool:
+    """Return True if an element named ``name`` is a target in ``mode``."""
+    if mode == 'links':
+        return name == 'a'
+    if mode == 'text':
+        return name in {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+    return True
+
+def choose_best_elements(soup: BeautifulSoup, mode: str = 'all', limit: int = 3,
+                         limits: Optional[WorkLimits] = None):
+    """Return a list of promising elements in the snippet.
+
+    Elements are scored all at once by :mod:`selector_features` (the
+    weights of :func:`compute_score` unless
+    ``config.DETECT_SCORE_WEIGHTS_FILE`` is set) and visited by decreasing
+    score, document order on ties. When ``limits`` runs out of time only
+    the elements scored so far are ranked.
+    """
+    from selector_features import ranked, score_elements
+
+    with span("detect.annotate"):
+        annotations = annotate_tree(soup)
+    with span("detect.score"):
+        elements, scores = score_elements(soup, "detect", annotations, limits)
+        if mode != 'all':
+            scores[[not matches_mode(el.name, mode) for el in elements]] = -np.inf
     result = []
     selectors_seen = set()
-    for score, el in candidates:
-        candidate = refine_candidate(el)
-        sel = build_selector(candidate)
-        if sel in selectors_seen:
-            continue
-        selectors_seen.add(sel)
-        result.append(candidate)
-        if len(result) >= limit:
-            break
+    with span("detect.build_selector"):
+        for i in ranked(scores):
+            if scores[i] == -np.inf:
+                break
+            el = elements[i]
+            candidate = refine_candidate(el, annotations.get(id(el)))
+            sel = build_selector(candidate)
+            if sel in selectors_seen:
+                continue
+            selectors_seen.add(sel)
+            result.append(candidate)
+            if len(result) >= limit:
+                break
     return result
 
-def refine_candidate(el):
+def stream_best_elements(source, mode: str = 'all', limit: int = 3):
+    """Like :func:`choose_best_elements` but reading HTML from a file object.
+
+    The page is parsed incrementally with bounded memory, see
+    :mod:`streaming_selector`.
+    """
+    from streaming_selector import stream_best_elements as stream
+
+    return stream(
+        source,
+        compute_score,
+        build_selector,
+        limit=limit,
+        keep=lambda name: matches_mode(name, mode),
+    )
+
+def refine_candidate(el, stats: Optional[NodeStats] = None):
     """If the element contains a single anchor, return that anchor."""
-    anchors = el.find_all('a', recursive=True)
-    if len(anchors) == 1:
-        return anchors[0]
+    if stats is None:
+        stats = node_stats(el)
+    if stats.anchors == 1:
+        return stats.first_anchor
     return el
 
 def has_good_id(tag) -> bool:
@@ -200,33 +296,52 @@ def main():
         default="auto",
         help="Type d'\u00e9l\u00e9ments \u00e0 cibler"
     )
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_BACKENDS + ("auto",),
+        default=None,
+        help="HTML parser backend (default from config)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the input incrementally with bounded memory (large pages)",
+    )
     args = parser.parse_args()
-
-    if args.file:
-        with open(args.file, 'r', encoding='utf-8') as f:
-            html = f.read()
-    else:
-        html = prompt_input()
-    try:
-        ajouter_interaction("texte_libre", {"message": html})
-    except Exception:
-        pass
-
-    soup = BeautifulSoup(html, 'html.parser')
     mode = args.mode
     search_mode = 'all' if mode == 'auto' else mode
-    targets = choose_best_elements(soup, search_mode)
+
+    if args.stream:
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                targets = stream_best_elements(f, search_mode)
+        else:
+            targets = stream_best_elements(sys.stdin, search_mode)
+    else:
+        if args.file:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                html = f.read()
+        else:
+            html = prompt_input()
+        try:
+            ajouter_interaction("texte_libre", {"message": html})
+        except Exception:
+            pass
+        limits = WorkLimits.from_config()
+        with span("detect.parse"):
+            soup = make_soup(limits.check_input(html), args.parser)
+            limits.prune(soup)
+        targets = [refine_candidate(t) for t in choose_best_elements(soup, search_mode, limits=limits)]
     if not targets:
         return
     for target in targets:
-        target = refine_candidate(target)
         selector = build_selector(target)
         explanation = describe_element(target)
+        # Streamed elements keep no markup to log
+        contenu = {} if args.stream else {"html": str(target)}
+        contenu["reponse"] = selector
         try:
-            ajouter_interaction(
-                "prediction",
-                {"html": str(target), "reponse": selector},
-            )
+            ajouter_interaction("prediction", contenu)
         except Exception:
             pass
         print(f"\u2705 S\u00e9lecteur g\u00e9n\u00e9r\u00e9 : {selector}")
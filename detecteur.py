@@ -1,9 +1,17 @@
 import sys
 import argparse
+from typing import Optional
 from bs4 import BeautifulSoup
+import css_selector_generator
+import html_parsing
+import intelligence
 from intelligence import analyser_question
 from css_selector_generator import build_selector
+from html_parsing import PARSER_BACKENDS, make_soup, resolve_backend
+from limits import TIME_CHECK_EVERY, WorkLimits, limits_version
+from tracing import span
 from src.memoire_generale import ajouter_interaction
+from src.prediction_cache import Uncached, cache, source_version
 
 
 _LABEL_TAGS = {
@@ -20,19 +28,61 @@ def trouver_elements(soup: BeautifulSoup, label: str):
         return soup.find_all(tags)
     return soup.find_all(True)
 
-def choisir_meilleur(elements):
-    if not elements:
-        return None
-    return max(elements, key=lambda el: len(el.get_text(strip=True)))
+def choisir_meilleur(elements, limits: Optional[WorkLimits] = None):
+    """Return the element with the longest text, the first one on ties.
 
-def generer_selecteur(html: str, question: str) -> str:
+    When ``limits`` runs out of time the best element so far is returned.
+    """
+    meilleur = None
+    longueur = -1
+    for i, el in enumerate(elements, 1):
+        n = len(el.get_text(strip=True))
+        if n > longueur:
+            meilleur, longueur = el, n
+        if limits is not None and i % TIME_CHECK_EVERY == 0 and limits.out_of_time():
+            break
+    return meilleur
+
+def _generer(html: str, question: str, parser: Optional[str], limits: WorkLimits) -> str:
     label = analyser_question(question)
-    soup = BeautifulSoup(html, "html.parser")
-    elements = trouver_elements(soup, label)
-    cible = choisir_meilleur(elements)
+    with span("detecteur.parse"):
+        soup = make_soup(limits.check_input(html), parser)
+        limits.prune(soup)
+    with span("detecteur.score"):
+        elements = trouver_elements(soup, label)
+        cible = choisir_meilleur(elements, limits)
     if cible is None:
         return ""
-    selector = build_selector(cible)
+    with span("detecteur.build_selector"):
+        return build_selector(cible)
+
+def proposer_selecteur(html: str, question: str, parser: Optional[str] = None) -> str:
+    """Return the selector answering ``question`` on ``html`` without
+    logging it, for callers keeping their own history.
+
+    Answers are cached by :mod:`src.prediction_cache`, keyed on the
+    source of the modules involved, the parser backend and the work
+    limits; an answer degraded by a limit is not cached.
+    """
+    backend = resolve_backend(parser, len(html))
+    version = source_version(sys.modules[__name__], intelligence, css_selector_generator, html_parsing)
+
+    def compute():
+        limits = WorkLimits.from_config()
+        selector = _generer(html, question, backend, limits)
+        # A best-so-far answer is not kept for later requests
+        return Uncached(selector) if limits.fired else selector
+
+    return cache.get_or_compute(
+        "detecteur", html, question, f"{version}:{backend}:{limits_version()}", compute,
+    )
+
+def generer_selecteur(html: str, question: str, parser: Optional[str] = None) -> str:
+    """Return the selector answering ``question`` on ``html`` and log it
+    in the interaction history."""
+    selector = proposer_selecteur(html, question, parser)
+    if not selector:
+        return selector
     try:
         ajouter_interaction(
             "prediction",
@@ -48,6 +98,12 @@ def main():
     )
     parser.add_argument("question", help="Question en langage naturel")
     parser.add_argument("file", nargs="?", help="Fichier HTML, default stdin")
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_BACKENDS + ("auto",),
+        default=None,
+        help="Backend d'analyse HTML (par defaut celui de config)",
+    )
     args = parser.parse_args()
 
     if args.file:
@@ -58,7 +114,7 @@ def main():
 
     ajouter_interaction("texte_libre", {"message": args.question})
     try:
-        selector = generer_selecteur(html, args.question)
+        selector = generer_selecteur(html, args.question, args.parser)
         ajouter_interaction("reponse", {"texte": selector})
     except Exception as e:
         ajouter_interaction("erreur", {"exception": str(e)})
@@ -0,0 +1,168 @@
+"""Parser backends building BeautifulSoup trees for the selector engines.
+
+Three backends are available:
+
+``html.parser``
+    Python's standard library parser, always available (the default).
+``lxml``
+    libxml2 through BeautifulSoup's ``lxml`` builder. The ``<html>`` and
+    ``<body>`` wrappers it adds around fragments are removed so the tree
+    matches the one ``html.parser`` builds.
+``selectolax``
+    The lexbor engine from ``selectolax``, parsed in fragment mode and
+    replayed into a BeautifulSoup tree. Fragments starting with table
+    parts (``<tr>``, ``<td>``...) are parsed in a matching context element
+    so they are kept as ``html.parser`` keeps them, and ``<tbody>``
+    elements the HTML5 rules insert into tables are flattened. Other
+    HTML5 repairs of malformed markup (misnested ``<p>`` or formatting
+    tags) may still give a different tree.
+
+``auto`` keeps ``html.parser`` for short snippets, where its lower setup
+cost wins, and picks the fastest installed C backend for larger pages
+(see ``benchmarks/bench_parsers.py``).
+"""
+
+import re
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.element import Comment
+
+import config
+
+try:
+    import lxml  # noqa: F401
+except ImportError:  # pragma: no cover - optional dependency
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # pragma: no cover - optional dependency
+    LexborHTMLParser = None
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+# Preference order used by the ``auto`` backend
+_FASTEST_FIRST = ("selectolax", "lxml", "html.parser")
+# Below this many characters ``auto`` uses html.parser
+AUTO_MIN_SIZE = 4096
+
+_DOCUMENT_TAGS = re.compile(r"<\s*(html|head|body)[\s/>]", re.IGNORECASE)
+_FIRST_TAG = re.compile(r"<\s*([a-zA-Z][a-zA-Z0-9]*)")
+
+# Context element needed by lexbor to keep a fragment's leading element
+_FRAGMENT_CONTEXT = {
+    "tr": "tbody",
+    "td": "tr",
+    "th": "tr",
+    "tbody": "table",
+    "thead": "table",
+    "tfoot": "table",
+    "caption": "table",
+    "colgroup": "table",
+    "col": "colgroup",
+}
+
+
+def available_backends() -> List[str]:
+    """Return the backends that can be used in this environment."""
+    backends = ["html.parser"]
+    if lxml is not None:
+        backends.append("lxml")
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    return backends
+
+
+def resolve_backend(name: Optional[str] = None, size: Optional[int] = None) -> str:
+    """Return the concrete backend for ``name`` (default from config).
+
+    ``size`` is the length of the markup about to be parsed, used by
+    ``auto`` to keep ``html.parser`` for short snippets.
+    """
+    name = name or config.PARSER_BACKEND
+    available = available_backends()
+    if name == "auto":
+        if size is not None and size < AUTO_MIN_SIZE:
+            return "html.parser"
+        return next(b for b in _FASTEST_FIRST if b in available)
+    if name not in PARSER_BACKENDS:
+        raise ValueError(
+            f"Unknown parser backend {name!r}, expected one of "
+            f"{', '.join(PARSER_BACKENDS + ('auto',))}"
+        )
+    if name not in available:
+        raise ValueError(f"Parser backend {name!r} is not installed")
+    return name
+
+
+class SelectolaxTreeBuilder(HTMLTreeBuilder):
+    """Build a BeautifulSoup tree from a lexbor parse."""
+
+    NAME = "selectolax"
+    features = [NAME]
+
+    def feed(self, markup) -> None:
+        if isinstance(markup, bytes):
+            markup = markup.decode("utf-8", "replace")
+        if _DOCUMENT_TAGS.search(markup):
+            tree = LexborHTMLParser(markup)
+        else:
+            first = _FIRST_TAG.search(markup)
+            context = _FRAGMENT_CONTEXT.get(first.group(1).lower(), "div") if first else "div"
+            tree = LexborHTMLParser(markup, is_fragment=True, fragment_tag=context)
+        implied = set() if "<tbody" in markup.lower() else {"tbody"}
+        self._replay(tree.root, implied)
+
+    def _replay(self, node, implied) -> None:
+        """Emit start/data/end events for ``node`` and its following siblings.
+
+        Elements whose tag is in ``implied`` were added by the parser and
+        only their children are emitted.
+        """
+        soup = self.soup
+        stack = []
+        while node is not None:
+            if node.is_element_node:
+                emit = node.tag not in implied
+                if emit:
+                    attrs = {k: ("" if v is None else v) for k, v in node.attributes.items()}
+                    soup.handle_starttag(node.tag, None, None, attrs)
+                child = node.first_child
+                if child is not None:
+                    stack.append((node, emit))
+                    node = child
+                    continue
+                if emit:
+                    soup.handle_endtag(node.tag)
+            elif node.is_text_node:
+                soup.handle_data(node.text_content)
+            elif node.is_comment_node:
+                soup.endData()
+                soup.handle_data(node.comment_content)
+                soup.endData(Comment)
+            while node.next is None and stack:
+                node, emit = stack.pop()
+                if emit:
+                    soup.handle_endtag(node.tag)
+            node = node.next
+
+
+def _strip_implied_wrappers(soup: BeautifulSoup) -> None:
+    """Remove the ``html``/``head``/``body`` elements lxml adds to fragments."""
+    for name in ("head", "body", "html"):
+        tag = soup.find(name)
+        if tag is not None:
+            tag.unwrap()
+
+
+def make_soup(html: str, backend: Optional[str] = None) -> BeautifulSoup:
+    """Parse ``html`` with the requested backend."""
+    backend = resolve_backend(backend, len(html))
+    if backend == "selectolax":
+        return BeautifulSoup(html, builder=SelectolaxTreeBuilder())
+    soup = BeautifulSoup(html, backend)
+    if backend == "lxml" and not _DOCUMENT_TAGS.search(html):
+        _strip_implied_wrappers(soup)
+    return soup
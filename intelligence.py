@@ -1,5 +1,7 @@
 """Analyse d'une question en langage naturel."""
 
+from tracing import traced
+
 try:
     from transformers import pipeline
 except Exception:  # pragma: no cover - optional dependency
@@ -26,6 +28,7 @@ _KEYWORDS = {
 }
 
 
+@traced("intent.analyser_question")
 def analyser_question(question: str, debug: bool = True) -> str:
     """Return the most probable label for the question."""
     q = question.lower()
@@ -0,0 +1,203 @@
+"""Per-request work limits for the heuristic engines.
+
+A :class:`WorkLimits` bounds the input size, the number of elements, the
+nesting depth and the wall-clock time spent on one snippet. With
+``config.LIMIT_MODE = "truncate"`` an engine degrades when a limit is hit:
+the input is cut, the tree is pruned or the best selector found so far is
+returned. With ``"error"`` a :class:`LimitExceeded` is raised instead.
+Every time a limit fires it is counted (see :func:`limit_counters`) and
+:attr:`WorkLimits.fired` is set, so callers do not cache a degraded answer.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import config
+from bs4 import Tag
+
+LIMITS = ("bytes", "nodes", "depth", "time", "levels")
+LIMIT_MODES = ("truncate", "error")
+
+# Elements the engines score between two wall-clock checks
+TIME_CHECK_EVERY = 256
+
+# html/head/body/tbody elements a parser may add to a snippet
+_IMPLIED_ELEMENTS = 4
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][^\s/>]*)")
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+def estimate_shape(html: str) -> Tuple[int, int]:
+    """Return upper estimates of the element count and nesting depth of
+    ``html``, without building a tree.
+
+    End tags close the most recent open element of the same name, as
+    BeautifulSoup does, and unmatched end tags are ignored, so a tree
+    built from ``html`` is not deeper than the estimate. This lets
+    :meth:`WorkLimits.prune` skip its walk for inputs within the limits.
+    """
+    stack: List[str] = []
+    open_names: Dict[str, int] = {}
+    elements = depth = 0
+    for closing, name in _TAG_RE.findall(html):
+        name = name.lower()
+        if not closing:
+            elements += 1
+            if name in VOID_ELEMENTS:
+                continue
+            stack.append(name)
+            open_names[name] = open_names.get(name, 0) + 1
+            if len(stack) > depth:
+                depth = len(stack)
+        elif open_names.get(name):
+            while True:
+                top = stack.pop()
+                open_names[top] -= 1
+                if top == name:
+                    break
+    return elements + _IMPLIED_ELEMENTS, depth + _IMPLIED_ELEMENTS
+
+_counters: Dict[str, int] = {name: 0 for name in LIMITS}
+_counters_lock = threading.Lock()
+
+
+class LimitExceeded(ValueError):
+    """Raised when a snippet exceeds a work limit in ``"error"`` mode."""
+
+    def __init__(self, limit: str, value, maximum):
+        super().__init__(f"HTML exceeds the {limit} limit ({value} > {maximum})")
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+
+def record(limit: str) -> None:
+    """Count one firing of ``limit``."""
+    with _counters_lock:
+        _counters[limit] += 1
+
+
+def limit_counters() -> Dict[str, int]:
+    """Return how many times each limit fired."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def limits_version() -> str:
+    """Return the limit settings of :mod:`config`, for cache versions."""
+    return (f"{config.MAX_INPUT_BYTES}:{config.MAX_NODES}:{config.MAX_DEPTH}:"
+            f"{config.MAX_SECONDS}:{config.LIMIT_MODE}")
+
+
+def reset_limit_counters() -> None:
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
+
+
+@dataclass
+class WorkLimits:
+    """Bounds on the work done for one snippet (``None`` = unlimited)."""
+
+    max_bytes: Optional[int] = None
+    max_nodes: Optional[int] = None
+    max_depth: Optional[int] = None
+    max_seconds: Optional[float] = None
+    mode: str = "truncate"
+
+    def __post_init__(self):
+        if self.mode not in LIMIT_MODES:
+            raise ValueError(f"Unknown limit mode {self.mode!r}, expected one of {LIMIT_MODES}")
+        self.started = time.perf_counter()
+        # Set once any limit fired: the answer is truncated or best-so-far
+        self.fired = False
+        # (elements, depth) estimated from the markup by check_input
+        self.shape: Optional[Tuple[int, int]] = None
+
+    @classmethod
+    def from_config(cls) -> "WorkLimits":
+        """Return fresh limits from :mod:`config`; the clock starts now."""
+        return cls(
+            max_bytes=config.MAX_INPUT_BYTES,
+            max_nodes=config.MAX_NODES,
+            max_depth=config.MAX_DEPTH,
+            max_seconds=config.MAX_SECONDS,
+            mode=config.LIMIT_MODE,
+        )
+
+    def exceeded(self, limit: str, value, maximum) -> None:
+        """Count ``limit`` and raise in ``"error"`` mode."""
+        record(limit)
+        self.fired = True
+        if self.mode == "error":
+            raise LimitExceeded(limit, value, maximum)
+
+    def out_of_time(self) -> bool:
+        """Return True (after counting it) once ``max_seconds`` has elapsed."""
+        if self.max_seconds is None:
+            return False
+        elapsed = time.perf_counter() - self.started
+        if elapsed <= self.max_seconds:
+            return False
+        self.exceeded("time", round(elapsed, 3), self.max_seconds)
+        return True
+
+    def check_input(self, html: str) -> str:
+        """Return ``html``, cut to ``max_bytes`` UTF-8 bytes if needed."""
+        if self.max_bytes is not None and len(html) * 4 > self.max_bytes:
+            data = html.encode("utf-8")
+            if len(data) > self.max_bytes:
+                self.exceeded("bytes", len(data), self.max_bytes)
+                html = data[:self.max_bytes].decode("utf-8", "ignore")
+        self.shape = estimate_shape(html)
+        return html
+
+    def prune(self, soup) -> None:
+        """Drop the content below ``max_depth`` and the elements after the
+        first ``max_nodes``, in place."""
+        if self.shape is not None:
+            elements, depth = self.shape
+            if (self.max_nodes is None or elements <= self.max_nodes) and (
+                self.max_depth is None or depth <= self.max_depth
+            ):
+                return
+        count = 0
+        depth_hit = False
+        stack = [(child, 0) for child in reversed(soup.contents) if isinstance(child, Tag)]
+        while stack:
+            tag, depth = stack.pop()
+            count += 1
+            if self.max_nodes is not None and count > self.max_nodes:
+                self.exceeded("nodes", f">{self.max_nodes}", self.max_nodes)
+                _cut_from(tag)
+                break
+            if self.max_depth is not None and depth >= self.max_depth:
+                if tag.find(True) is not None:
+                    if not depth_hit:
+                        depth_hit = True
+                        self.exceeded("depth", f">{self.max_depth}", self.max_depth)
+                    tag.clear()
+                continue
+            stack.extend(
+                (child, depth + 1) for child in reversed(tag.contents) if isinstance(child, Tag)
+            )
+
+
+def _cut_from(tag) -> None:
+    """Remove ``tag`` and every element after it in document order."""
+    doomed = [tag]
+    node = tag
+    while node is not None and node.parent is not None:
+        doomed.extend(node.next_siblings)
+        node = node.parent
+    for node in doomed:
+        node.extract()
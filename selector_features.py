@@ -0,0 +1,282 @@
+"""Vectorized element features and scores for the heuristic selector engines.
+
+:func:`extract` turns a parsed page into a NumPy matrix with one row per
+element and one column per entry of :data:`FEATURES`. Tag names, ids and
+class names are classified once per distinct value and spread to the
+elements through index arrays, so the per-element Python work is reduced
+to reading attributes. Scoring every element is then one matrix-vector
+product with a weight vector, and :func:`top_k` picks the best rows with
+``argpartition`` instead of sorting the page.
+
+The built-in weights reproduce ``compute_score`` of
+:mod:`css_selector_generator` (:data:`CSS_WEIGHTS`) and of
+:mod:`detect_selector` (:data:`DETECT_WEIGHTS`). JSON files of
+``{feature: weight}`` set in ``config.CSS_SCORE_WEIGHTS_FILE`` and
+``config.DETECT_SCORE_WEIGHTS_FILE`` replace them (see
+:func:`engine_weights`); the streaming path keeps the built-in weights.
+"""
+
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from itertools import chain
+from operator import attrgetter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from css_selector_generator import (
+    INLINE_TAGS,
+    STRUCTURAL_TAGS,
+    has_keyword,
+    is_dynamic_id,
+    is_generic,
+)
+from limits import TIME_CHECK_EVERY
+
+FEATURES = (
+    "inline_tag",
+    "structural_tag",
+    "heading",  # h1 to h6
+    "stable_id",
+    "stable_id_keyword",
+    "dynamic_id",
+    "specific_classes",  # classes not in GENERIC_CLASSES
+    "generic_classes",
+    "keyword_classes",  # specific classes containing a positive keyword
+    "depth",
+    "text_over_15",  # more than 15 characters of text
+    "text_over_40",
+    "density_over_10",  # characters of text per element below
+    "density_over_30",
+    "log_text_length",
+    "log_descendants",
+)
+_COLUMN = {name: i for i, name in enumerate(FEATURES)}
+
+# Columns that need the tree statistics of detect_selector.annotate_tree
+STRUCTURE_FEATURES = (
+    "depth", "text_over_15", "text_over_40", "density_over_10", "density_over_30",
+    "log_text_length", "log_descendants",
+)
+
+CSS_WEIGHTS = {
+    "inline_tag": -3, "structural_tag": 2,
+    "stable_id": 5, "stable_id_keyword": 1, "dynamic_id": -1,
+    "specific_classes": 3, "generic_classes": -2, "keyword_classes": 1,
+}
+DETECT_WEIGHTS = {
+    **CSS_WEIGHTS,
+    "heading": 2, "depth": -1,
+    "text_over_15": 1, "text_over_40": 1, "density_over_10": 1, "density_over_30": 1,
+}
+
+
+def weight_vector(weights: Dict[str, float]) -> np.ndarray:
+    """Return ``weights`` as a vector in :data:`FEATURES` order (0 when missing)."""
+    unknown = set(weights) - set(FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+    vector = np.zeros(len(FEATURES))
+    for name, value in weights.items():
+        vector[_COLUMN[name]] = float(value)
+    return vector
+
+
+def load_weights(path: Path) -> np.ndarray:
+    """Read a JSON object of ``{feature: weight}``."""
+    with open(path, encoding="utf-8") as f:
+        return weight_vector(json.load(f))
+
+
+def save_weights(path: Path, weights: np.ndarray) -> None:
+    data = {name: float(w) for name, w in zip(FEATURES, weights) if w}
+    Path(path).write_text(json.dumps(data, indent=1), encoding="utf-8")
+
+
+_BUILTIN = {"css": CSS_WEIGHTS, "detect": DETECT_WEIGHTS}
+_loaded: Dict[Tuple[str, Optional[str], Optional[Tuple[int, int]]], np.ndarray] = {}
+_lock = threading.Lock()
+
+
+def engine_weights(engine: str) -> np.ndarray:
+    """Return the weights of ``engine`` (``"css"`` or ``"detect"``): the
+    configured file when set, else the built-in ones."""
+    path = config.CSS_SCORE_WEIGHTS_FILE if engine == "css" else config.DETECT_SCORE_WEIGHTS_FILE
+    st = Path(path).stat() if path else None
+    key = (engine, str(path) if path else None, (st.st_mtime_ns, st.st_size) if st else None)
+    with _lock:
+        if key not in _loaded:
+            _loaded[key] = load_weights(path) if path else weight_vector(_BUILTIN[engine])
+        return _loaded[key]
+
+
+def weights_version(engine: str) -> str:
+    """Return ``"builtin"`` or a hash of the weight file ``engine`` uses,
+    for cache keys of the answers scored with it."""
+    path = config.CSS_SCORE_WEIGHTS_FILE if engine == "css" else config.DETECT_SCORE_WEIGHTS_FILE
+    if not path:
+        return "builtin"
+    st = Path(path).stat()
+    return _file_hash(str(path), st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=32)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()[:12]
+
+
+def _is_heading(name: str) -> bool:
+    return name.startswith("h") and len(name) == 2 and name[1].isdigit()
+
+
+def _name_table(names: Sequence[str]) -> np.ndarray:
+    rows = []
+    for name in names:
+        name = name.lower()
+        rows.append((name in INLINE_TAGS, name in STRUCTURAL_TAGS, _is_heading(name)))
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _id_table(ids: Sequence[str]) -> np.ndarray:
+    rows = []
+    for value in ids:
+        if not value:
+            rows.append((0, 0, 0))
+        elif is_dynamic_id(value):
+            rows.append((0, 0, 1))
+        else:
+            rows.append((1, has_keyword(value), 0))
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _class_table(classes: Sequence[str]) -> np.ndarray:
+    rows = []
+    for value in classes:
+        generic = is_generic(value)
+        rows.append((not generic, generic, not generic and has_keyword(value)))
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _codes(values: List[str]) -> Tuple[List[str], List[int]]:
+    """Return the distinct ``values`` and the index of each value among them."""
+    index = dict.fromkeys(values)
+    for i, value in enumerate(index):
+        index[value] = i
+    return list(index), list(map(index.__getitem__, values))
+
+
+def _read(soup, annotations, limits):
+    """Return the elements of ``soup`` with their tag names, attributes and
+    tree statistics, read ``TIME_CHECK_EVERY`` elements at a time and
+    stopping at the first chunk after ``limits`` runs out of time."""
+    found = soup.find_all(True)
+    elements: list = []
+    names: List[str] = []
+    attrs: List[dict] = []
+    stats: list = []
+    for start in range(0, len(found), TIME_CHECK_EVERY):
+        chunk = found[start:start + TIME_CHECK_EVERY]
+        elements += chunk
+        names += map(attrgetter("name"), chunk)
+        attrs += map(attrgetter("attrs"), chunk)
+        if annotations is not None:
+            stats += map(annotations.__getitem__, map(id, chunk))
+        if limits is not None and limits.out_of_time():
+            break
+    return elements, names, attrs, stats
+
+
+def extract(soup, annotations=None, limits=None):
+    """Return ``(elements, matrix)``: the elements of ``soup`` in document
+    order and their :data:`FEATURES`.
+
+    ``annotations`` (from :func:`detect_selector.annotate_tree`) fills the
+    structure columns, which are 0 otherwise. When ``limits`` runs out of
+    time only the elements read so far are returned.
+    """
+    elements, names, attrs, stats = _read(soup, annotations, limits)
+    n = len(elements)
+    matrix = np.zeros((n, len(FEATURES)))
+    if not n:
+        return elements, matrix
+
+    # Attributes are read column by column and each distinct tag name, id
+    # and class is classified once
+    distinct, codes = _codes(names)
+    matrix[:, _COLUMN["inline_tag"]:_COLUMN["heading"] + 1] = _name_table(distinct)[codes]
+    distinct, codes = _codes([a.get("id") or "" for a in attrs])
+    matrix[:, _COLUMN["stable_id"]:_COLUMN["dynamic_id"] + 1] = _id_table(distinct)[codes]
+    classes = [a.get("class") or () for a in attrs]
+    distinct, codes = _codes(list(chain.from_iterable(classes)))
+    if codes:
+        per_class = _class_table(distinct)[codes]
+        owner = np.repeat(np.arange(n), np.fromiter(map(len, classes), dtype=np.intp, count=n))
+        for j, name in enumerate(("specific_classes", "generic_classes", "keyword_classes")):
+            matrix[:, _COLUMN[name]] = np.bincount(owner, weights=per_class[:, j], minlength=n)
+
+    if annotations is not None:
+        depth, text, descendants = (
+            np.fromiter(map(attrgetter(field), stats), dtype=np.float64, count=n)
+            for field in ("depth", "text_length", "descendants")
+        )
+        density = text / (descendants + 1)
+        matrix[:, _COLUMN["depth"]] = depth
+        matrix[:, _COLUMN["text_over_15"]] = text > 15
+        matrix[:, _COLUMN["text_over_40"]] = text > 40
+        matrix[:, _COLUMN["density_over_10"]] = density > 10
+        matrix[:, _COLUMN["density_over_30"]] = density > 30
+        matrix[:, _COLUMN["log_text_length"]] = np.log1p(text)
+        matrix[:, _COLUMN["log_descendants"]] = np.log1p(descendants)
+    return elements, matrix
+
+
+def needs_structure(weights: np.ndarray) -> bool:
+    """Return True when ``weights`` use the tree statistics."""
+    return bool(np.any(weights[[_COLUMN[name] for name in STRUCTURE_FEATURES]]))
+
+
+def score_elements(soup, engine: str, annotations=None, limits=None):
+    """Return ``(elements, scores)`` for ``soup`` with the weights of ``engine``.
+
+    The tree statistics are computed only when the weights use them and
+    ``annotations`` is not given.
+    """
+    weights = engine_weights(engine)
+    if annotations is None and needs_structure(weights):
+        from detect_selector import annotate_tree
+
+        annotations = annotate_tree(soup)
+    elements, matrix = extract(soup, annotations, limits)
+    return elements, matrix @ weights
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the ``k`` best ``scores``, best first and in
+    ascending index order on ties (as a stable sort by decreasing score)."""
+    n = len(scores)
+    if k <= 0 or not n:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        kth = scores[np.argpartition(-scores, k - 1)[:k]].min()
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def ranked(scores: np.ndarray, start: int = 8):
+    """Yield indices by decreasing score (ties in index order), selecting
+    ``start`` then four times more at each step, so callers that stop after
+    a few elements do not sort the whole page."""
+    k, done = start, 0
+    while done < len(scores):
+        order = top_k(scores, k)
+        yield from order[done:].tolist()
+        done = len(order)
+        k *= 4
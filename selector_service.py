@@ -0,0 +1,229 @@
+"""Selector predictions for the web services.
+
+:func:`select_batch` answers a batch of snippets (optionally with
+questions) with one of four engines: the cached heuristic, the
+heuristic/model cascade, the models alone, whose forward passes are
+batched over the whole request, or the candidate ranker
+(:mod:`src.selector_ranker`), which reads the HTML only. Each result carries the chosen selector,
+the ranked candidates and its timings; a failing item reports its error
+without failing the others.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import css_selector_generator
+import html_parsing
+import selector_features
+import tracing
+from cascade import get_cascade, heuristic_candidates, softmax
+from css_selector_generator import generate_selector
+from limits import WorkLimits, limit_counters, limits_version
+from src.memoire_generale import ajouter_interaction
+from src.prediction_cache import Uncached, cache, directory_fingerprint, source_version
+import config
+
+ENGINES = ("heuristic", "cascade", "model", "ranker")
+MAX_TOP_K = 20
+
+
+class BatchError(ValueError):
+    """A batch request the API rejects, with the HTTP status to answer."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_batch(payload: Any, max_items: Optional[int] = None
+                ) -> Tuple[List[str], List[Optional[str]], str, int]:
+    """Validate an API payload and return ``(htmls, questions, engine, top_k)``.
+
+    The payload is ``{"items": [...], "engine": ..., "top_k": ...}`` where
+    each item is an HTML string or ``{"html": ..., "question": ...}``.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+        raise BatchError('expected a JSON object with an "items" list')
+    items = payload["items"]
+    if max_items is not None and len(items) > max_items:
+        raise BatchError(f"at most {max_items} items per request", 413)
+    engine = payload.get("engine", config.API_DEFAULT_ENGINE)
+    if engine not in ENGINES:
+        raise BatchError(f"engine must be one of {', '.join(ENGINES)}")
+    top_k = payload.get("top_k", config.CASCADE_TOP_K)
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+        raise BatchError(f"top_k must be an integer between 1 and {MAX_TOP_K}")
+    htmls: List[str] = []
+    questions: List[Optional[str]] = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"html": item}
+        if not isinstance(item, dict) or not isinstance(item.get("html"), str):
+            raise BatchError(f'item {i} must be a string or an object with an "html" string')
+        question = item.get("question")
+        if question is not None and not isinstance(question, str):
+            raise BatchError(f'item {i}: "question" must be a string')
+        htmls.append(item["html"])
+        questions.append(question)
+    return htmls, questions, engine, top_k
+
+
+def _heuristic_version() -> str:
+    """Return the cache version of the heuristic answers: its source, the
+    element weights and the work limits in use."""
+    version = source_version(css_selector_generator, html_parsing, selector_features)
+    return f"{version}:{selector_features.weights_version('css')}:{limits_version()}"
+
+
+def _limited(compute):
+    """Call ``compute(limits)``; an answer degraded by a limit is not cached."""
+    limits = WorkLimits.from_config()
+    value = compute(limits)
+    return Uncached(value) if limits.fired else value
+
+
+def heuristic_selector(html: str) -> str:
+    """Return the cached :func:`generate_selector` answer for ``html``."""
+    version = _heuristic_version()
+    backend = html_parsing.resolve_backend(None, len(html))
+    return cache.get_or_compute(
+        "generate_selector", html, "", f"{version}:{backend}",
+        lambda: _limited(lambda limits: generate_selector(html, backend, limits)),
+    )
+
+
+def _candidates(pairs) -> List[Dict[str, Any]]:
+    return [{"selector": s, "probability": round(p, 6)} for s, p in pairs]
+
+
+def _heuristic(html: str, question: Optional[str], top_k: int) -> Dict[str, Any]:
+    if question:
+        # The question-aware heuristic proposes a single selector;
+        # select_batch logs it with the other items
+        from detecteur import proposer_selecteur
+
+        selector = proposer_selecteur(html, question)
+        return {"selector": selector, "candidates": _candidates([(selector, 1.0)] if selector else [])}
+    version = _heuristic_version()
+    backend = html_parsing.resolve_backend(None, len(html))
+    scored = cache.get_or_compute(
+        "heuristic_candidates", html, "", f"{version}:{backend}:{top_k}",
+        lambda: _limited(lambda limits: heuristic_candidates(html, top_k, backend, limits)),
+    )
+    selectors = [s for s, _ in scored]
+    # Same temperature as the cascade so probabilities are comparable
+    probs = softmax([score for _, score in scored], get_cascade().temperature)
+    return {
+        "selector": selectors[0] if selectors else "",
+        "candidates": _candidates(zip(selectors, probs)),
+    }
+
+
+def _cascade(html: str, question: Optional[str], top_k: int) -> Dict[str, Any]:
+    cascade = get_cascade()
+    result = cascade.predict(html, question)
+    return {
+        "selector": result.selector,
+        "candidates": _candidates(result.selectors[:top_k]),
+        "stage": result.stage,
+    }
+
+
+def _ranker(html: str, question: Optional[str], top_k: int) -> Dict[str, Any]:
+    from src import selector_ranker
+
+    version = source_version(css_selector_generator, html_parsing, selector_ranker)
+    model = directory_fingerprint(config.RANKER_MODEL_DIR)
+    ranked = cache.get_or_compute(
+        "selector_ranker", html, "", f"{version}:{model}:{top_k}",
+        lambda: selector_ranker.rank_selectors(html, top_k),
+    )
+    return {"selector": ranked[0][0] if ranked else "", "candidates": _candidates(ranked)}
+
+
+def _model(htmls: Sequence[str], questions: Sequence[Optional[str]], top_k: int,
+           results: List[Dict[str, Any]]) -> None:
+    """Fill ``results`` with model predictions, one batched call per model."""
+    from src import html_only_predictor, html_selector
+
+    groups = {
+        "html_only_selector": [i for i, q in enumerate(questions) if not q],
+        "html_selector": [i for i, q in enumerate(questions) if q],
+    }
+    for name, indices in groups.items():
+        if not indices:
+            continue
+        started = time.perf_counter()
+        try:
+            if name == "html_selector":
+                ranked = html_selector.predict_topk(
+                    [questions[i] for i in indices], [htmls[i] for i in indices], top_k
+                )
+            else:
+                ranked = html_only_predictor.predict_topk([htmls[i] for i in indices], top_k)
+        except Exception as e:
+            for i in indices:
+                results[i] = {"error": str(e), "error_type": type(e).__name__}
+            continue
+        batch_ms = round((time.perf_counter() - started) * 1000, 3)
+        for i, pairs in zip(indices, ranked):
+            results[i] = {
+                "selector": pairs[0][0] if pairs else "",
+                "candidates": _candidates(pairs),
+                "model": name,
+                "timings": {"batch_ms": batch_ms, "batch_size": len(indices)},
+            }
+
+
+def select_batch(
+    htmls: Sequence[str],
+    questions: Optional[Sequence[Optional[str]]] = None,
+    engine: str = "heuristic",
+    top_k: int = 3,
+) -> List[Dict[str, Any]]:
+    """Return one result per snippet, in input order."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    questions = list(questions) if questions is not None else [None] * len(htmls)
+    results: List[Dict[str, Any]] = [{} for _ in htmls]
+    if engine == "model":
+        _model(htmls, questions, top_k, results)
+    else:
+        predict = {"heuristic": _heuristic, "cascade": _cascade, "ranker": _ranker}[engine]
+        for i, (html, question) in enumerate(zip(htmls, questions)):
+            started = time.perf_counter()
+            try:
+                results[i] = predict(html, question, top_k)
+            except Exception as e:
+                results[i] = {"error": str(e), "error_type": type(e).__name__}
+            results[i]["timings"] = {"total_ms": round((time.perf_counter() - started) * 1000, 3)}
+    for html, question, result in zip(htmls, questions, results):
+        contenu = {"html": html, "reponse": result.get("selector", "")}
+        if question:
+            contenu["question"] = question
+        try:
+            if "error" in result:
+                ajouter_interaction("erreur", {"exception": result["error"]})
+            else:
+                ajouter_interaction("prediction", contenu)
+        except Exception:
+            pass
+    return results
+
+
+def metrics_lines() -> List[str]:
+    """Return the stage histograms, limit and cache counters as Prometheus lines."""
+    stats = cache.stats()
+    lines = [tracing.prometheus_text().rstrip("\n")]
+    lines += tracing.counter_lines(
+        "selector_limit_hits_total", "Work limits fired, by limit.",
+        limit_counters().items(), "limit",
+    )
+    lines += tracing.counter_lines(
+        "selector_prediction_cache_total", "Prediction cache lookups and evictions.",
+        [("hit", stats["hits"]), ("disk_hit", stats["disk_hits"]),
+         ("miss", stats["misses"]), ("eviction", stats["evictions"]),
+         ("disk_eviction", stats["disk_evictions"])],
+        "outcome",
+    )
+    return lines
@@ -0,0 +1,175 @@
+"""Prefork production server for the web interface.
+
+:func:`serve_prefork` binds the listening socket and loads the trained
+models once in the parent, then forks ``workers`` processes that share the
+socket and the model weights (copy-on-write). Each worker runs one
+forward pass per model before it starts accepting connections and only
+then reports ready on ``/readyz``; connections arriving meanwhile wait in
+the listen backlog. The parent restarts workers that die and stops them
+all on SIGTERM or SIGINT.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.memoire_generale import flush_interactions
+
+WARMUP_HTML = (
+    "<div class='product'><h2 class='title'>Produit</h2>"
+    "<span class='price'>9,99 €</span></div>"
+)
+
+# Seconds to wait for workers to exit before killing them
+STOP_TIMEOUT = 10.0
+
+
+def load_models() -> List[str]:
+    """Load every trained model into the registry; return their names."""
+    from pathlib import Path
+
+    from src.model_registry import registry
+
+    loaded = []
+    for name, path in registry.paths.items():
+        if Path(path).exists():
+            registry.get(name)
+            loaded.append(name)
+    return loaded
+
+
+def warmup(models: List[str]) -> None:
+    """Run the heuristic and one forward pass per loaded model."""
+    from css_selector_generator import generate_selector
+
+    generate_selector(WARMUP_HTML)
+    if models:
+        from src.model_registry import registry
+
+        for name in models:
+            registry.get(name).logits([WARMUP_HTML])
+
+
+def _worker(sock: socket.socket, app, ready: threading.Event, host: str, port: int,
+            models: List[str], threads: Optional[int]) -> None:
+    from werkzeug.serving import make_server
+
+    # The parent handles Ctrl-C; SIGTERM stops this worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+    warmup(models)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        ready.clear()
+        # shutdown() waits for serve_forever, so it cannot run in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    ready.set()
+    server.serve_forever()
+    server.server_close()
+
+
+def _spawn(sock, app, ready, host, port, models, threads) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        _worker(sock, app, ready, host, port, models, threads)
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        status = 1
+    finally:
+        try:
+            flush_interactions()
+        finally:
+            # Skip the parent's atexit handlers and open resources
+            os._exit(status)
+
+
+def serve_prefork(
+    app,
+    ready: threading.Event,
+    host: str = "127.0.0.1",
+    port: int = 5000,
+    workers: int = 2,
+    threads: Optional[int] = None,
+) -> None:
+    """Serve ``app`` from ``workers`` forked processes until SIGTERM/SIGINT.
+
+    ``ready`` is the event behind the readiness probe; each worker sets
+    its own copy once warmed up. ``threads`` caps the PyTorch threads of
+    each worker.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
+    models = load_models()
+    flush_interactions()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    children: Dict[int, int] = {}
+    try:
+        for slot in range(workers):
+            children[_spawn(sock, app, ready, host, port, models, threads)] = slot
+        print(f"Serving on http://{host}:{sock.getsockname()[1]} with {workers} worker(s)",
+              file=sys.stderr, flush=True)
+        while not stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in children:
+                slot = children.pop(pid)
+                print(f"Worker {pid} exited ({status}), restarting", file=sys.stderr, flush=True)
+                # Avoid a tight loop when workers die at start-up
+                time.sleep(0.5)
+                if not stopping:
+                    children[_spawn(sock, app, ready, host, port, models, threads)] = slot
+                continue
+            time.sleep(0.2)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        sock.close()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,334 @@
+"""Distillation of a trained model into a small student for CPU serving.
+
+:func:`distill` trains a DistilBERT with fewer, narrower layers to match
+the logits of a trained model (the teacher) on the task's dataset, mixed
+with the usual cross-entropy on the labels. The student keeps the
+teacher's label map and is saved in the same directory format, so the
+predictors and the model registry load it unchanged.
+
+Most of the weights of the multilingual base model are its 119k-token
+embedding matrix. With ``prune_vocab`` the student's vocabulary only keeps
+the tokens the teacher's tokenizer produces on the training split, plus
+the Latin single characters so unseen words still split into pieces;
+training texts tokenize to the same pieces as before. The student's
+embeddings start from a projection of the teacher's on their principal
+components.
+
+:func:`compare` measures the teacher and the student side by side (size,
+latency, accuracy, agreement) for ``python cli.py distill``.
+"""
+from __future__ import annotations
+
+import inspect
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import config
+from src import ingestion
+from src.model_registry import LoadedModel
+from src.training import TASKS, TaskSpec, _supported, _training_arguments
+
+# Single characters kept by vocabulary pruning (Basic Latin to Latin Extended-B)
+_KEPT_CHARS = range(0x20, 0x250)
+
+
+def _spec(task: Union[TaskSpec, str]) -> TaskSpec:
+    return TASKS[task] if isinstance(task, str) else task
+
+
+def load_rows(spec: TaskSpec, label2id: Dict[str, int]) -> Dict[str, Tuple[List[str], List[int]]]:
+    """Return the texts and label ids of the train and test splits of
+    ``spec``'s dataset, keeping the rows whose label is in ``label2id``."""
+    from datasets import load_dataset
+
+    if not Path(spec.data_file).is_file():
+        raise FileNotFoundError(f"Dataset not found at {spec.data_file}")
+    dataset = load_dataset(spec.data_format, data_files=str(spec.data_file), split="train")
+    splits: Dict[str, Tuple[List[str], List[int]]] = {"train": ([], []), "test": ([], [])}
+    for start in range(0, len(dataset), 1000):
+        batch = dataset[start:start + 1000]
+        for text, label in zip(spec.texts(batch), batch[spec.label_column]):
+            if label not in label2id:
+                continue
+            texts, labels = splits["test" if ingestion.is_test(text, spec.test_size) else "train"]
+            texts.append(text)
+            labels.append(label2id[label])
+    return splits
+
+
+def pruned_vocab(tokenizer, texts: Sequence[str]) -> List[int]:
+    """Return the sorted ids of the tokens kept for a student trained on ``texts``."""
+    kept = set(tokenizer.all_special_ids)
+    for start in range(0, len(texts), 1000):
+        for ids in tokenizer(list(texts[start:start + 1000]), add_special_tokens=False)["input_ids"]:
+            kept.update(ids)
+    for token, i in tokenizer.get_vocab().items():
+        char = token[2:] if token.startswith("##") else token
+        if len(char) == 1 and ord(char) in _KEPT_CHARS:
+            kept.add(i)
+    return sorted(kept)
+
+
+def student_tokenizer(teacher, kept_ids: Sequence[int]):
+    """Return a tokenizer with the vocabulary ``kept_ids`` of ``teacher``,
+    normalizing text the same way."""
+    from transformers import DistilBertTokenizerFast
+
+    tokens = teacher.convert_ids_to_tokens(list(kept_ids))
+    settings = {
+        key: teacher.init_kwargs[key]
+        for key in ("do_lower_case", "strip_accents", "tokenize_chinese_chars")
+        if key in teacher.init_kwargs
+    }
+    settings["model_max_length"] = teacher.model_max_length
+    if "vocab_file" not in inspect.signature(DistilBertTokenizerFast.__init__).parameters:
+        # transformers 5 takes the vocabulary itself
+        return DistilBertTokenizerFast(vocab={token: i for i, token in enumerate(tokens)}, **settings)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocab_file = Path(tmp) / "vocab.txt"
+        vocab_file.write_text("\n".join(tokens), encoding="utf-8")
+        return DistilBertTokenizerFast(vocab_file=str(vocab_file), **settings)
+
+
+def _project(weight, dim: int, basis=None):
+    """Return ``weight`` projected on its first ``dim`` principal directions
+    (or on ``basis``) and the basis used. Missing components are left at 0."""
+    import torch
+
+    if basis is None:
+        _, _, v = torch.linalg.svd(weight - weight.mean(dim=0), full_matrices=False)
+        basis = v[:dim]
+    projected = torch.zeros(weight.shape[0], dim)
+    projected[:, :basis.shape[0]] = weight @ basis.T
+    return projected, basis
+
+
+def build_student(teacher, kept_ids: Optional[Sequence[int]] = None, *, layers: int, dim: int,
+                  hidden_dim: int, heads: int):
+    """Return an untrained student of ``teacher`` with ``layers`` layers of
+    width ``dim``, on the vocabulary ``kept_ids`` (default the teacher's)."""
+    import torch
+    from transformers import DistilBertConfig, DistilBertForSequenceClassification
+
+    cfg = teacher.config
+    vocab_size = len(kept_ids) if kept_ids is not None else cfg.vocab_size
+    student_cfg = DistilBertConfig(
+        vocab_size=vocab_size,
+        max_position_embeddings=cfg.max_position_embeddings,
+        n_layers=layers,
+        n_heads=heads,
+        dim=dim,
+        hidden_dim=hidden_dim,
+        num_labels=cfg.num_labels,
+        id2label=dict(cfg.id2label),
+        label2id=dict(cfg.label2id),
+        pad_token_id=0,
+    )
+    student = DistilBertForSequenceClassification(student_cfg)
+    embeddings = teacher.get_input_embeddings().weight.detach()
+    if kept_ids is not None:
+        embeddings = embeddings[torch.tensor(list(kept_ids))]
+    with torch.no_grad():
+        words, basis = _project(embeddings, dim)
+        student.get_input_embeddings().weight.copy_(words)
+        positions = getattr(teacher.base_model.embeddings, "position_embeddings", None)
+        if positions is not None:
+            student.base_model.embeddings.position_embeddings.weight.copy_(
+                _project(positions.weight.detach(), dim, basis)[0]
+            )
+    return student
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature: float, alpha: float):
+    """``alpha`` * soft-target KL divergence (scaled by temperature²) +
+    (1 - ``alpha``) * cross-entropy on the labels."""
+    import torch.nn.functional as F
+
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=-1),
+        F.softmax(teacher_logits / temperature, dim=-1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    return alpha * soft + (1 - alpha) * F.cross_entropy(student_logits, labels)
+
+
+def distill(
+    task: Union[TaskSpec, str],
+    progress_cb=None,
+    stop_event=None,
+    *,
+    teacher_dir: Optional[Path] = None,
+    output_dir: Optional[Path] = None,
+    layers: Optional[int] = None,
+    dim: Optional[int] = None,
+    hidden_dim: Optional[int] = None,
+    heads: Optional[int] = None,
+    prune_vocab: Optional[bool] = None,
+    epochs: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_steps: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Train a student of the saved model of ``task`` and save it in
+    ``output_dir`` (default ``<model dir>_student``).
+
+    Unset architecture options come from ``config.DISTILL_*``. Return the
+    paths, the vocabulary sizes, the test texts and labels (for
+    :func:`compare`) and the training throughput.
+    """
+    from datasets import Dataset
+    from transformers import (
+        AutoModelForSequenceClassification,
+        DataCollatorWithPadding,
+        DistilBertTokenizerFast,
+        Trainer,
+    )
+
+    spec = _spec(task)
+    teacher_dir = Path(teacher_dir or spec.output_dir)
+    if not teacher_dir.exists():
+        raise FileNotFoundError(
+            f"No trained model in {teacher_dir}: train it once with 'python cli.py train {spec.name}'"
+        )
+    output_dir = Path(output_dir or teacher_dir.with_name(teacher_dir.name + "_student"))
+    prune_vocab = config.DISTILL_PRUNE_VOCAB if prune_vocab is None else prune_vocab
+    temperature, alpha = config.DISTILL_TEMPERATURE, config.DISTILL_ALPHA
+
+    start = time.perf_counter()
+    tokenizer = DistilBertTokenizerFast.from_pretrained(teacher_dir)
+    teacher = AutoModelForSequenceClassification.from_pretrained(teacher_dir)
+    label2id = {label: int(i) for label, i in teacher.config.label2id.items()}
+    splits = load_rows(spec, label2id)
+    train_texts, train_labels = splits["train"]
+    if not train_texts:
+        raise ValueError(f"No rows of {spec.data_file} match the labels of {teacher_dir}")
+    max_length = min(tokenizer.model_max_length, spec.max_length)
+
+    # Only the training split: the test texts must not shape the student
+    kept_ids = pruned_vocab(tokenizer, train_texts) if prune_vocab else None
+    student_tok = student_tokenizer(tokenizer, kept_ids) if prune_vocab else tokenizer
+    student = build_student(
+        teacher, kept_ids,
+        layers=layers or config.DISTILL_LAYERS,
+        dim=dim or config.DISTILL_DIM,
+        hidden_dim=hidden_dim or config.DISTILL_HIDDEN_DIM,
+        heads=heads or config.DISTILL_HEADS,
+    )
+    targets = LoadedModel("teacher", teacher_dir, tokenizer, teacher.eval(),
+                          teacher.config.id2label).logits(train_texts).tolist()
+    del teacher
+    encodings = student_tok(train_texts, truncation=True, max_length=max_length, return_length=True)
+    train_dataset = Dataset.from_dict({
+        "input_ids": encodings["input_ids"],
+        "attention_mask": encodings["attention_mask"],
+        "length": encodings["length"],
+        "labels": train_labels,
+        "teacher_logits": targets,
+    })
+    prepare_seconds = time.perf_counter() - start
+
+    class DistillationTrainer(Trainer):
+        def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+            inputs.pop("length", None)
+            soft_targets = inputs.pop("teacher_logits")
+            labels = inputs.pop("labels")
+            outputs = model(**inputs)
+            loss = distillation_loss(outputs.logits, soft_targets, labels, temperature, alpha)
+            return (loss, outputs) if return_outputs else loss
+
+    args = _training_arguments(
+        True,
+        output_dir=str(output_dir / "checkpoints"),
+        num_train_epochs=epochs or config.DISTILL_EPOCHS,
+        max_steps=max_steps if max_steps is not None else -1,
+        per_device_train_batch_size=batch_size or config.TRAIN_BATCH_SIZE,
+        learning_rate=config.DISTILL_LEARNING_RATE,
+        logging_steps=10,
+        save_strategy="no",
+        length_column_name="length",
+        # teacher_logits is not a model input and must reach compute_loss
+        remove_unused_columns=False,
+    )
+    callbacks = []
+    if progress_cb or stop_event:
+        from src.training import ProgressCallback
+
+        callbacks.append(ProgressCallback(progress_cb, stop_event))
+    trainer = DistillationTrainer(
+        model=student,
+        args=args,
+        train_dataset=train_dataset,
+        data_collator=DataCollatorWithPadding(student_tok),
+        callbacks=callbacks,
+        **_supported(Trainer, {"processing_class": student_tok, "tokenizer": student_tok}),
+    )
+    result = trainer.train()
+    trainer.save_model(str(output_dir))
+    student_tok.model_max_length = max_length
+    student_tok.save_pretrained(str(output_dir))
+    shutil.rmtree(output_dir / "checkpoints", ignore_errors=True)
+
+    return {
+        "task": spec.name,
+        "teacher_dir": teacher_dir,
+        "output_dir": output_dir,
+        "vocab_size": {"teacher": tokenizer.vocab_size, "student": student.config.vocab_size},
+        "train_rows": len(train_texts),
+        "test": splits["test"],
+        "prepare_seconds": round(prepare_seconds, 3),
+        "samples_per_second": result.metrics.get("train_samples_per_second"),
+    }
+
+
+def _latency_ms(model, texts: Sequence[str], calls: int) -> float:
+    times = []
+    for text in (list(texts) * calls)[:calls]:
+        start = time.perf_counter()
+        model.logits([text])
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _size_bytes(model_dir: Path) -> int:
+    return sum(
+        path.stat().st_size for path in Path(model_dir).iterdir()
+        if path.is_file() and path.suffix in (".safetensors", ".bin")
+    )
+
+
+def compare(models: Dict[str, Path], texts: Sequence[str], labels: Sequence[int],
+            calls: int = 50, batch_size: int = 32) -> List[Dict[str, Any]]:
+    """Measure each model of ``models`` (name -> directory) on ``texts``.
+
+    Each row holds the parameter count, the size of the weights on disk,
+    the median latency of a one-text call, the batched throughput, the
+    accuracy on ``labels`` and the agreement with the first model.
+    """
+    from src.model_registry import ModelRegistry
+
+    rows = []
+    reference = None
+    for name, path in models.items():
+        loaded = ModelRegistry({name: path}).get(name)
+        if texts:
+            loaded.logits(list(texts[:4]))  # warm up
+        start = time.perf_counter()
+        predictions = loaded.logits(list(texts), batch_size).argmax(dim=1).tolist() if texts else []
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = predictions
+        rows.append({
+            "model": name,
+            "params": sum(p.numel() for p in loaded.model.parameters()),
+            "size_bytes": _size_bytes(path),
+            "latency_ms": _latency_ms(loaded, texts, calls) if texts else None,
+            "texts_per_second": len(texts) / seconds if texts else None,
+            "accuracy": (sum(p == l for p, l in zip(predictions, labels)) / len(labels)
+                         if labels else None),
+            "agreement": (sum(p == r for p, r in zip(predictions, reference)) / len(reference)
+                          if reference else None),
+        })
+    return rows
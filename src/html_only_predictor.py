@@ -2,45 +2,76 @@
 
 import argparse
 import sys
-from pathlib import Path
+import threading
+from typing import List, Sequence, Tuple
 
 import torch
-from transformers import (
-    AutoModelForSequenceClassification,
-    DistilBertTokenizerFast,
-)
 
 import config
 from src.memoire_generale import ajouter_interaction
+from src.micro_batcher import MicroBatcher
+from src.model_registry import registry
+from src.prediction_cache import cache, model_version
+from tracing import span
 
+MODEL_NAME = "html_only_selector"
 MODEL_DIR = config.HTML_ONLY_SELECTOR_MODEL_DIR
-if not MODEL_DIR.exists():
-    raise FileNotFoundError(
-        f"Trained model directory not found: {MODEL_DIR}"
-    )
+DEFAULT_BATCH_SIZE = 32
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _predict(htmls: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> List[str]:
+    loaded = registry.get(MODEL_NAME)
+    pred_ids = loaded.logits(htmls, batch_size).argmax(dim=1).tolist()
+    return [loaded.id2label[i] for i in pred_ids]
 
-_tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_DIR)
-_model = AutoModelForSequenceClassification.from_pretrained(MODEL_DIR)
-_model.eval()
 
-_id2label = {int(k): v for k, v in _model.config.id2label.items()}
+def get_batcher() -> MicroBatcher:
+    """Return the shared micro-batcher serving :func:`predict_selector`."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                lambda htmls: _predict(htmls, len(htmls)),
+                max_batch_size=config.MICRO_BATCH_MAX_SIZE,
+                max_wait_ms=config.MICRO_BATCH_WAIT_MS,
+                name=MODEL_NAME,
+            )
+        return _batcher
+
+
+def _predict_one(html: str) -> str:
+    if config.MICRO_BATCHING:
+        return get_batcher()(html)
+    loaded = registry.get(MODEL_NAME)
+    with span("model.tokenize", model=MODEL_NAME):
+        inputs = loaded.tokenizer(
+            html,
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+        )
+    with torch.no_grad(), span("model.forward", model=MODEL_NAME, batch=1):
+        logits = loaded.model(**inputs).logits
+        pred_id = logits.argmax(dim=1).item()
+    return loaded.id2label[pred_id]
 
 
 def predict_selector(html: str) -> str:
-    """Return predicted CSS selector for given HTML snippet."""
+    """Return predicted CSS selector for given HTML snippet.
+
+    With ``config.MICRO_BATCHING`` concurrent calls are grouped into one
+    forward pass by :func:`get_batcher`. Results are cached by
+    :mod:`src.prediction_cache`.
+    """
     html = html.strip()
     if not html:
         raise ValueError("Input HTML is empty")
-    inputs = _tokenizer(
-        html,
-        return_tensors="pt",
-        truncation=True,
-        padding=True,
+    selector = cache.get_or_compute(
+        MODEL_NAME, html, "", model_version(MODEL_NAME), lambda: _predict_one(html)
     )
-    with torch.no_grad():
-        logits = _model(**inputs).logits
-        pred_id = logits.argmax(dim=1).item()
-    selector = _id2label[pred_id]
     try:
         ajouter_interaction(
             "prediction",
@@ -51,6 +82,40 @@ def predict_selector(html: str) -> str:
     return selector
 
 
+def predict_selectors(htmls: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE) -> List[str]:
+    """Return predicted CSS selectors for many HTML snippets, in input order.
+
+    Snippets are sorted by token length and each batch is padded only to
+    its own longest snippet (see :meth:`LoadedModel.logits`). Only the
+    snippets missing from the prediction cache are run through the model.
+    """
+    htmls = [html.strip() for html in htmls]
+    for i, html in enumerate(htmls):
+        if not html:
+            raise ValueError(f"Input HTML #{i} is empty")
+    if not htmls:
+        return []
+    selectors = cache.get_or_compute_many(
+        MODEL_NAME, htmls, [""] * len(htmls), model_version(MODEL_NAME),
+        lambda missing: _predict([htmls[i] for i in missing], batch_size),
+    )
+    for html, selector in zip(htmls, selectors):
+        try:
+            ajouter_interaction(
+                "prediction",
+                {"html": html, "reponse": selector},
+            )
+        except Exception:
+            pass
+    return selectors
+
+
+def predict_topk(htmls: Sequence[str], k: int = 3, batch_size: int = DEFAULT_BATCH_SIZE) -> List[List[Tuple[str, float]]]:
+    """Return the ``k`` most likely selectors of each snippet with their
+    probabilities. Predictions are not recorded in the history."""
+    return registry.get(MODEL_NAME).topk([html.strip() for html in htmls], k, batch_size)
+
+
 def main(argv=None) -> None:
     """Run the predictor from the command line."""
     parser = argparse.ArgumentParser(
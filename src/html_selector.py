@@ -1,30 +1,89 @@
 """Prediction utility for HTML selector model."""
-from pathlib import Path
+import threading
+from typing import List, Sequence, Tuple
+
 import config
 
 import torch
-from transformers import AutoModelForSequenceClassification, DistilBertTokenizerFast
 from src.memoire_generale import ajouter_interaction
+from src.micro_batcher import MicroBatcher
+from src.model_registry import registry
+from src.prediction_cache import cache, model_version
+from tracing import span
 
+MODEL_NAME = "html_selector"
 MODEL_DIR = config.HTML_SELECTOR_MODEL_DIR
-if not MODEL_DIR.exists():
-    raise FileNotFoundError(f"Trained model directory not found: {MODEL_DIR}")
 
-_tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_DIR)
-_model = AutoModelForSequenceClassification.from_pretrained(MODEL_DIR)
-_model.eval()
+_batcher = None
+_batcher_lock = threading.Lock()
 
-_id2label = {int(k): v for k, v in _model.config.id2label.items()}
 
+def format_input(question: str, html: str) -> str:
+    """Return the model input text for a question and an HTML snippet."""
+    return f"[QUESTION] {question.strip()} [HTML] {html.strip()}"
 
-def predire_selecteur(question: str, html: str) -> str:
-    """Return predicted CSS selector for given question and HTML."""
-    text = f"[QUESTION] {question.strip()} [HTML] {html.strip()}"
-    inputs = _tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        logits = _model(**inputs).logits
+
+def _predict_texts(texts: List[str], batch_size: int = 32) -> List[str]:
+    loaded = registry.get(MODEL_NAME)
+    pred_ids = loaded.logits(texts, batch_size).argmax(dim=1).tolist()
+    return [loaded.id2label[i] for i in pred_ids]
+
+
+def get_batcher() -> MicroBatcher:
+    """Return the shared micro-batcher serving :func:`predire_selecteur`."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                lambda texts: _predict_texts(texts, len(texts)),
+                max_batch_size=config.MICRO_BATCH_MAX_SIZE,
+                max_wait_ms=config.MICRO_BATCH_WAIT_MS,
+                name=MODEL_NAME,
+            )
+        return _batcher
+
+
+def predire_selecteurs(questions: Sequence[str], htmls: Sequence[str], batch_size: int = 32) -> List[str]:
+    """Return predicted CSS selectors for many (question, HTML) pairs."""
+    return cache.get_or_compute_many(
+        MODEL_NAME, htmls, questions, model_version(MODEL_NAME),
+        lambda missing: _predict_texts(
+            [format_input(questions[i], htmls[i]) for i in missing], batch_size
+        ),
+    )
+
+
+def predict_topk(questions: Sequence[str], htmls: Sequence[str], k: int = 3,
+                 batch_size: int = 32) -> List[List[Tuple[str, float]]]:
+    """Return the ``k`` most likely selectors of each (question, HTML) pair
+    with their probabilities. Predictions are not recorded in the history."""
+    texts = [format_input(q, h) for q, h in zip(questions, htmls)]
+    return registry.get(MODEL_NAME).topk(texts, k, batch_size)
+
+
+def _predict_one(text: str) -> str:
+    if config.MICRO_BATCHING:
+        return get_batcher()(text)
+    loaded = registry.get(MODEL_NAME)
+    with span("model.tokenize", model=MODEL_NAME):
+        inputs = loaded.tokenizer(text, return_tensors="pt", truncation=True, padding=True)
+    with torch.no_grad(), span("model.forward", model=MODEL_NAME, batch=1):
+        logits = loaded.model(**inputs).logits
         pred_id = logits.argmax(dim=1).item()
-    selector = _id2label[pred_id]
+    return loaded.id2label[pred_id]
+
+
+def predire_selecteur(question: str, html: str) -> str:
+    """Return predicted CSS selector for given question and HTML.
+
+    With ``config.MICRO_BATCHING`` concurrent calls are grouped into one
+    forward pass by :func:`get_batcher`. Results are cached by
+    :mod:`src.prediction_cache`.
+    """
+    selector = cache.get_or_compute(
+        MODEL_NAME, html, question, model_version(MODEL_NAME),
+        lambda: _predict_one(format_input(question, html)),
+    )
     try:
         ajouter_interaction(
             "prediction",
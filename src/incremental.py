@@ -0,0 +1,327 @@
+"""Incremental fine-tuning of the selector models from the interaction history.
+
+:func:`train_incremental` continues training the saved checkpoint of a
+task instead of starting from the base model. The new rows are the
+``label`` interactions logged since the previous round: selectors a user
+confirmed or corrected for a snippet, recorded with :func:`record_label`
+(``python cli.py label``). The ``prediction`` entries are never used, since
+they hold the model's own answers and training on them would only
+reinforce its errors. Selectors the model has never seen are appended to
+its label map, keeping the trained weights of the known ones
+(:func:`grow_label_map`). To avoid forgetting,
+each round also replays a random sample of older rows, from the task's
+dataset and from earlier history (``config.INCREMENTAL_REPLAY_RATIO`` old
+rows per new row).
+
+Rounds are recorded in ``incremental.json`` in the model directory; the
+next round starts where the previous one stopped. The updated model
+replaces the checkpoint only once it is saved, and the previous one is
+kept in ``<model dir>.prev``; a stopped round changes neither.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import random
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import config
+from src import ingestion
+from src.memoire_generale import ajouter_interaction, iter_historique
+from src.training import TASKS, TaskSpec, _compute_metrics, _supported, _training_arguments
+
+STATE_FILE = "incremental.json"
+
+# Interaction type of the confirmed or corrected selectors
+LABEL_TYPE = "label"
+
+# Tasks whose rows can be rebuilt from the logged predictions
+INCREMENTAL_TASKS = ("html_selector", "html_only_selector")
+
+
+def _columns(spec: TaskSpec) -> List[str]:
+    return (["question"] if spec.name == "html_selector" else []) + ["html", spec.label_column]
+
+
+def _text(spec: TaskSpec, row: Dict[str, Any]) -> str:
+    return spec.texts({column: [row[column]] for column in _columns(spec)})[0]
+
+
+def _spec(task: Union[TaskSpec, str]) -> TaskSpec:
+    spec = TASKS[task] if isinstance(task, str) else task
+    if spec.name not in INCREMENTAL_TASKS:
+        raise ValueError(f"Incremental training supports {', '.join(INCREMENTAL_TASKS)}, not {spec.name!r}")
+    return spec
+
+
+def record_label(html: str, selector: str, question: Optional[str] = None,
+                 predicted: Optional[str] = None) -> None:
+    """Log ``selector`` as the right answer for ``html`` (and ``question``).
+
+    ``predicted`` is the answer that was shown, kept for reference; the
+    entry is a training row whether it confirms or corrects it.
+    """
+    if not html or not selector:
+        raise ValueError("A label needs the HTML and its selector")
+    contenu = {"html": html, "reponse": selector}
+    if question:
+        contenu["question"] = question
+    if predicted is not None:
+        contenu["prediction"] = predicted
+    ajouter_interaction(LABEL_TYPE, contenu)
+
+
+def history_rows(spec: TaskSpec, since: Optional[str] = None,
+                 until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield the labels logged in ``[since, until)`` as rows of ``spec``'s dataset.
+
+    ``html_selector`` takes the labels given for a question,
+    ``html_only_selector`` those given for the HTML alone.
+    """
+    with_question = spec.name == "html_selector"
+    for entry in iter_historique(type=LABEL_TYPE, since=since, until=until):
+        contenu = entry.get("contenu") or {}
+        html, selector = contenu.get("html"), contenu.get("reponse")
+        question = contenu.get("question")
+        if not html or not selector or bool(question) != with_question:
+            continue
+        row = {"html": html, spec.label_column: selector}
+        if with_question:
+            row["question"] = question
+        yield row
+
+
+def load_state(model_dir: Path) -> Dict[str, Any]:
+    try:
+        return json.loads((Path(model_dir) / STATE_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {"last_timestamp": None, "rounds": []}
+
+
+def _dataset_rows(spec: TaskSpec) -> Iterator[Dict[str, Any]]:
+    if not Path(spec.data_file).is_file():
+        return iter(())
+    from datasets import load_dataset
+
+    return iter(load_dataset(spec.data_format, data_files=str(spec.data_file), split="train",
+                             streaming=True))
+
+
+def replay_sample(rows: Iterable[Dict[str, Any]], size: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Return a uniform sample of ``size`` rows, reading ``rows`` once."""
+    rng = random.Random(seed)
+    sample: List[Dict[str, Any]] = []
+    for seen, row in enumerate(rows, 1):
+        if len(sample) < size:
+            sample.append(row)
+        else:
+            j = rng.randrange(seen)
+            if j < size:
+                sample[j] = row
+    return sample
+
+
+def grow_label_map(model, labels: Iterable[Any]) -> List[Any]:
+    """Append the unknown ``labels`` to the classification head of ``model``.
+
+    The rows of the known labels are copied unchanged and their ids kept;
+    the new rows are initialized like a fresh head. Return the labels
+    added.
+    """
+    import torch
+
+    cfg = model.config
+    label2id = {label: int(i) for label, i in cfg.label2id.items()}
+    added = [label for label in dict.fromkeys(labels) if label not in label2id]
+    if not added:
+        return []
+    old = model.classifier
+    if not isinstance(old, torch.nn.Linear):
+        raise TypeError(f"Cannot grow a {type(old).__name__} classification head")
+    head = torch.nn.Linear(old.in_features, old.out_features + len(added), bias=old.bias is not None)
+    with torch.no_grad():
+        head.weight.normal_(mean=0.0, std=getattr(cfg, "initializer_range", 0.02))
+        head.weight[:old.out_features] = old.weight
+        if old.bias is not None:
+            head.bias.zero_()
+            head.bias[:old.out_features] = old.bias
+    model.classifier = head
+    for label in added:
+        label2id[label] = len(label2id)
+    cfg.label2id = label2id
+    cfg.id2label = {i: label for label, i in label2id.items()}
+    cfg.num_labels = len(label2id)
+    model.num_labels = len(label2id)
+    return added
+
+
+def _replace_dir(source: Path, target: Path) -> None:
+    """Move ``source`` to ``target``, keeping the former ``target`` as ``.prev``."""
+    previous = target.with_name(target.name + ".prev")
+    if target.exists():
+        shutil.rmtree(previous, ignore_errors=True)
+        target.rename(previous)
+    source.rename(target)
+
+
+def _accuracy(trainer, eval_sets) -> Dict[str, Optional[float]]:
+    accuracy = {}
+    for name, data in eval_sets.items():
+        metrics = trainer.evaluate(data, metric_key_prefix=name)
+        accuracy[name] = metrics.get(f"{name}_accuracy")
+    return accuracy
+
+
+def train_incremental(
+    task: Union[TaskSpec, str],
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    stop_event=None,
+    *,
+    since: Optional[str] = None,
+    model_dir: Optional[Path] = None,
+    epochs: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    replay_ratio: Optional[float] = None,
+    max_steps: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Fine-tune the saved model of ``task`` on the history logged since the
+    last round (or ``since``) plus replayed older rows.
+
+    Return the round's figures; ``status`` is ``"up to date"`` when there
+    were no new rows and ``"stopped"`` when ``stop_event`` ended the round,
+    in which case the model and the round state are left unchanged.
+    """
+    from transformers import (
+        AutoModelForSequenceClassification,
+        DataCollatorWithPadding,
+        DistilBertTokenizerFast,
+        Trainer,
+    )
+    from datasets import Dataset
+
+    spec = _spec(task)
+    model_dir = Path(model_dir or spec.output_dir)
+    if not model_dir.exists():
+        raise FileNotFoundError(
+            f"No trained model in {model_dir}: train it once with 'python cli.py train {spec.name}'"
+        )
+    state = load_state(model_dir)
+    since = since or state["last_timestamp"]
+    # Entries logged while this round trains go to the next one
+    until = datetime.utcnow().isoformat()
+
+    start = time.perf_counter()
+    new_rows: Dict[str, Dict[str, Any]] = {}
+    for row in history_rows(spec, since, until):
+        # The latest answer for an input wins
+        new_rows[_text(spec, row)] = row
+    if not new_rows:
+        return {"task": spec.name, "status": "up to date", "since": since, "new_rows": 0}
+
+    ratio = config.INCREMENTAL_REPLAY_RATIO if replay_ratio is None else replay_ratio
+    replay_size = int(len(new_rows) * ratio)
+    old_rows = _dataset_rows(spec)
+    if since is not None:
+        old_rows = itertools.chain(old_rows, history_rows(spec, until=since))
+    replay = replay_sample(old_rows, replay_size) if replay_size else []
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    added = grow_label_map(
+        model, (row[spec.label_column] for row in itertools.chain(new_rows.values(), replay))
+    )
+    label2id = {label: int(i) for label, i in model.config.label2id.items()}
+    max_length = min(tokenizer.model_max_length, spec.max_length)
+    columns = _columns(spec)
+
+    def tokenize(batch):
+        enc = tokenizer(spec.texts(batch), truncation=True, max_length=max_length,
+                        return_length=True)
+        enc["labels"] = [label2id[l] for l in batch[spec.label_column]]
+        return enc
+
+    def dataset(rows):
+        return Dataset.from_list([{c: row[c] for c in columns} for row in rows]).map(
+            tokenize, batched=True, remove_columns=columns
+        )
+
+    # Every new row is trained on; replayed rows of the hash-selected test
+    # split are held out to measure forgetting, before and after the round.
+    # Learning is the accuracy on the new rows before and after.
+    train_rows = list(new_rows.values())
+    held_out = []
+    for row in replay:
+        (held_out if ingestion.is_test(_text(spec, row), spec.test_size) else train_rows).append(row)
+    eval_sets = {"new": dataset(new_rows.values())}
+    if held_out:
+        eval_sets["replay"] = dataset(held_out)
+    prepare_seconds = time.perf_counter() - start
+
+    work_dir = model_dir.with_name(model_dir.name + ".new")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    args = _training_arguments(
+        True,
+        output_dir=str(work_dir / "checkpoints"),
+        num_train_epochs=epochs or config.INCREMENTAL_EPOCHS,
+        max_steps=max_steps if max_steps is not None else -1,
+        per_device_train_batch_size=batch_size or config.TRAIN_BATCH_SIZE,
+        learning_rate=config.INCREMENTAL_LEARNING_RATE,
+        logging_steps=10,
+        save_strategy="no",
+        length_column_name="length",
+    )
+    callbacks = []
+    if progress_cb or stop_event:
+        from src.training import ProgressCallback
+
+        callbacks.append(ProgressCallback(progress_cb, stop_event))
+    trainer = Trainer(
+        model=model,
+        args=args,
+        train_dataset=dataset(train_rows),
+        eval_dataset=eval_sets or None,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        compute_metrics=_compute_metrics,
+        callbacks=callbacks,
+        **_supported(Trainer, {"processing_class": tokenizer, "tokenizer": tokenizer}),
+    )
+    accuracy_before = _accuracy(trainer, eval_sets)
+    result = trainer.train()
+    if stop_event is not None and stop_event.is_set():
+        # The rows stay after last_timestamp for the next round
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return {"task": spec.name, "status": "stopped", "since": since,
+                "new_rows": len(new_rows), "steps": result.global_step}
+    accuracy = _accuracy(trainer, eval_sets)
+
+    trainer.save_model(str(work_dir))
+    tokenizer.save_pretrained(str(work_dir))
+    shutil.rmtree(work_dir / "checkpoints", ignore_errors=True)
+    summary = {
+        "since": since,
+        "until": until,
+        "new_rows": len(new_rows),
+        "replay_rows": len(replay),
+        "train_rows": len(train_rows),
+        "added_labels": len(added),
+        "labels": len(label2id),
+        "accuracy_before": accuracy_before,
+        "accuracy": accuracy,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    state["last_timestamp"] = until
+    state["rounds"].append(summary)
+    (work_dir / STATE_FILE).write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+    _replace_dir(work_dir, model_dir)
+
+    return {
+        "task": spec.name,
+        "status": "trained",
+        **summary,
+        "prepare_seconds": round(prepare_seconds, 3),
+        "samples_per_second": result.metrics.get("train_samples_per_second"),
+    }
@@ -0,0 +1,109 @@
+"""Dataset ingestion helpers for training on large corpora.
+
+Rows are assigned to the train or test split from a hash of their model
+input text (:func:`is_test`), so the split is deterministic, needs no
+shuffled copy of the data and keeps duplicated texts on the same side.
+:func:`scan` makes one streaming pass over a dataset to collect what
+training needs up front (labels, split sizes, a sample of texts) in
+bounded memory, for datasets read with ``streaming=True``.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+
+_HASH_SPACE = float(1 << 64)
+
+
+def num_workers() -> int:
+    """Return the processes available for tokenization (``config.TRAIN_NUM_PROC``
+    or every core this process may run on)."""
+    if config.TRAIN_NUM_PROC:
+        return max(1, int(config.TRAIN_NUM_PROC))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # pragma: no cover - not Linux
+        return max(1, os.cpu_count() or 1)
+
+
+def num_proc_for(rows: int) -> Optional[int]:
+    """Return the ``num_proc`` to map ``rows`` rows with, ``None`` for one process.
+
+    Small datasets stay in-process: starting workers costs more than
+    tokenizing them.
+    """
+    procs = min(num_workers(), rows // max(1, config.TRAIN_ROWS_PER_PROC))
+    return procs if procs > 1 else None
+
+
+def split_fraction(text: str) -> float:
+    """Return a number in ``[0, 1)`` derived from ``text`` only."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / _HASH_SPACE
+
+
+def is_test(text: str, test_size: float) -> bool:
+    """Return True when the row with input ``text`` belongs to the test split."""
+    return split_fraction(text) < test_size
+
+
+def split_flags(texts: List[str], test_size: float) -> List[bool]:
+    return [is_test(text, test_size) for text in texts]
+
+
+@dataclass
+class ScanResult:
+    """What one pass over a streamed dataset found."""
+
+    labels: List[Any]
+    train_rows: int
+    test_rows: int
+    columns: List[str]
+    # Reservoir sample of the train texts, for the max_length percentile
+    sample: List[str] = field(default_factory=list)
+
+
+def scan(rows, texts: Callable[[Dict[str, List[Any]]], List[str]], label_column: str,
+         test_size: float, sample_size: int, batch_size: int = 1000) -> ScanResult:
+    """Read ``rows`` (an iterable of dicts) once and return a :class:`ScanResult`.
+
+    Memory holds the label set, a batch of rows and ``sample_size`` texts.
+    """
+    labels = set()
+    train_rows = test_rows = 0
+    columns: List[str] = []
+    sample: List[str] = []
+    rng = random.Random(0)
+    batch: List[Dict[str, Any]] = []
+
+    def consume(batch):
+        nonlocal train_rows, test_rows
+        columnar = {name: [row[name] for row in batch] for name in batch[0]}
+        for text, label in zip(texts(columnar), columnar[label_column]):
+            labels.add(label)
+            if is_test(text, test_size):
+                test_rows += 1
+                continue
+            train_rows += 1
+            if len(sample) < sample_size:
+                sample.append(text)
+            else:
+                j = rng.randrange(train_rows)
+                if j < sample_size:
+                    sample[j] = text
+
+    for row in rows:
+        if not columns:
+            columns = list(row)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            consume(batch)
+            batch = []
+    if batch:
+        consume(batch)
+    return ScanResult(sorted(labels), train_rows, test_rows, columns, sample)
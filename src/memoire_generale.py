@@ -1,37 +1,365 @@
+"""Interaction history stored as JSON lines in ``data/historique.jsonl``.
+
+With ``config.HISTORY_ASYNC`` (the default) :func:`ajouter_interaction` only
+serializes the entry and queues it; a background thread appends queued
+entries in batches, when ``config.HISTORY_BATCH_SIZE`` entries are waiting
+or ``config.HISTORY_FLUSH_INTERVAL`` seconds after the first one, and at
+interpreter exit. Each batch is a single ``write`` on an ``O_APPEND``
+descriptor under an exclusive ``flock``, so several processes (Flask
+workers) can share the file without interleaving lines.
+
+``config.HISTORY_DURABILITY`` chooses what happens after each batch:
+``"none"`` leaves it in the OS page cache, ``"flush"`` forces the file data
+to disk (``fdatasync``) and ``"fsync"`` forces data and metadata.
+
+The file is rotated once it reaches ``config.HISTORY_SEGMENT_MAX_BYTES`` or
+holds entries of a previous day (``config.HISTORY_ROTATE_DAILY``): it is
+moved, gzip-compressed with ``config.HISTORY_COMPRESS_SEGMENTS``, into
+``data/historique/`` and described in ``data/historique/manifest.json``
+(time range, entry count per type). :func:`iter_historique` uses the
+manifest to open only the segments that can match.
+"""
 from __future__ import annotations
 
+import atexit
+import gzip
 import json
-from datetime import datetime
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Union
+
+import config
+from tracing import span
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
 
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 
+DURABILITY_MODES = ("none", "flush", "fsync")
+
+SEGMENT_MANIFEST = "manifest.json"
+
+# Entries are written by json.dumps with "type" then "timestamp" first
+_HEAD_RE = re.compile(rb'\{"type": "((?:[^"\\]|\\.)*)", "timestamp": "([^"]*)"')
+
+
+def segment_dir(path: Path) -> Path:
+    """Return the directory holding the closed segments of ``path``."""
+    return path.with_suffix("")
+
+
+def _timestamp(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def _head(line: bytes):
+    """Return ``(type, timestamp)`` of a serialized entry without parsing it all."""
+    match = _HEAD_RE.match(line)
+    if match:
+        return match.group(1).decode("utf-8"), match.group(2).decode("ascii")
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None, None
+    return entry.get("type"), entry.get("timestamp")
+
+
+def _needs_rotation(fd: int) -> bool:
+    size = os.fstat(fd).st_size
+    if not size:
+        return False
+    max_bytes = config.HISTORY_SEGMENT_MAX_BYTES
+    if max_bytes is not None and size >= max_bytes:
+        return True
+    if config.HISTORY_ROTATE_DAILY:
+        _, first = _head(os.pread(fd, 512, 0))
+        today = datetime.utcnow().date().isoformat()
+        return first is not None and first[:10] != today
+    return False
+
+
+def _load_manifest(directory: Path) -> List[Dict[str, Any]]:
+    try:
+        with (directory / SEGMENT_MANIFEST).open("r", encoding="utf-8") as f:
+            return json.load(f)["segments"]
+    except FileNotFoundError:
+        return []
+
+
+def _rotate(path: Path) -> None:
+    """Close the active file ``path`` as a segment and record it in the manifest.
+
+    Called with the active file locked, so no other process appends to it.
+    """
+    directory = segment_dir(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    lock_fd = os.open(directory / ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        segments = _load_manifest(directory)
+        compress = config.HISTORY_COMPRESS_SEGMENTS
+        with path.open("rb") as f:
+            _, first = _head(f.readline())
+        stamp = (first or datetime.utcnow().isoformat())[:19].replace("-", "").replace(":", "")
+        name = f"{path.stem}-{stamp}-{len(segments):05d}.jsonl" + (".gz" if compress else "")
+        target = directory / name
+        info = {"file": name, "first": None, "last": None, "count": 0, "types": {}}
+        tmp = target.with_name(name + ".tmp")
+        with path.open("rb") as src, (gzip.open(tmp, "wb") if compress else tmp.open("wb")) as dst:
+            for line in src:
+                dst.write(line)
+                kind, ts = _head(line)
+                if ts is None:
+                    continue
+                info["count"] += 1
+                info["types"][kind] = info["types"].get(kind, 0) + 1
+                info["first"] = ts if info["first"] is None else min(info["first"], ts)
+                info["last"] = ts if info["last"] is None else max(info["last"], ts)
+        info["bytes"] = tmp.stat().st_size
+        os.replace(tmp, target)
+        os.unlink(path)
+        segments.append(info)
+        manifest_tmp = directory / (SEGMENT_MANIFEST + ".tmp")
+        with manifest_tmp.open("w", encoding="utf-8") as f:
+            json.dump({"segments": segments}, f, ensure_ascii=False, indent=1)
+        os.replace(manifest_tmp, directory / SEGMENT_MANIFEST)
+    finally:
+        os.close(lock_fd)
+
+
+def _append(path: Path, data: bytes, durability: str = "none") -> None:
+    """Append ``data`` to ``path`` atomically with respect to other writers.
+
+    The file is first closed as a segment when it is over the size limit
+    or holds entries of a previous day.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        # Read access lets _needs_rotation look at the first entry
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # Another process may have rotated the file while we waited
+            try:
+                current = os.stat(path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                continue
+            if _needs_rotation(fd):
+                _rotate(path)
+                continue
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            if durability == "fsync":
+                os.fsync(fd)
+            elif durability == "flush":
+                getattr(os, "fdatasync", os.fsync)(fd)
+            return
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+
+class HistoryWriter:
+    """Append serialized entries to their files from a background thread."""
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        flush_interval: float = 0.5,
+        durability: str = "none",
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"Unknown durability {durability!r}, expected one of {DURABILITY_MODES}"
+            )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._pending: Dict[Path, List[bytes]] = {}
+        self._count = 0
+        self._first_queued: Optional[float] = None
+        self._cond = threading.Condition()
+        # Held while a batch is written so flush() returns after the write
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.batches = 0
+        self.entries = 0
+
+    def submit(self, path: Path, line: bytes) -> None:
+        """Queue ``line`` for appending to ``path``."""
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(
+                    target=self._run, name="history-writer", daemon=True
+                )
+                self._thread.start()
+            self._pending.setdefault(path, []).append(line)
+            self._count += 1
+            if self._first_queued is None:
+                self._first_queued = time.monotonic()
+            if self._count >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self) -> None:
+        """Write every queued entry now."""
+        with self._write_lock:
+            with self._cond:
+                pending = self._take()
+            self._write(pending)
+
+    def close(self) -> None:
+        """Flush and stop the background thread."""
+        with self._cond:
+            self._stopping = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _reset_after_fork(self) -> None:
+        # The parent flushed before forking; its thread does not exist here
+        self._pending = {}
+        self._count = 0
+        self._first_queued = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    def _take(self) -> Dict[Path, List[bytes]]:
+        pending, self._pending = self._pending, {}
+        self._count = 0
+        self._first_queued = None
+        return pending
+
+    def _write(self, pending: Dict[Path, List[bytes]]) -> None:
+        for path, lines in pending.items():
+            with span("history.write", entries=len(lines)):
+                _append(path, b"".join(lines), self.durability)
+            self.batches += 1
+            self.entries += len(lines)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._count >= self.batch_size:
+                        break
+                    if self._first_queued is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._first_queued + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except OSError:
+                # History is best effort; keep serving later entries
+                pass
+
+
+_writer = HistoryWriter(
+    batch_size=config.HISTORY_BATCH_SIZE,
+    flush_interval=config.HISTORY_FLUSH_INTERVAL,
+    durability=config.HISTORY_DURABILITY,
+)
+atexit.register(_writer.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_writer.flush, after_in_child=_writer._reset_after_fork)
+
+
+def flush_interactions() -> None:
+    """Write the interactions still queued by :func:`ajouter_interaction`."""
+    _writer.flush()
+
 
 def ajouter_interaction(type: str, contenu: Dict[str, Any], fichier: str = "data/historique.jsonl") -> None:
     """Ajoute une interaction dans le fichier JSONL."""
-    entry = {"type": type, "timestamp": datetime.utcnow().isoformat(), "contenu": contenu}
-    path = BASE_DIR / fichier
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        json.dump(entry, f, ensure_ascii=False)
-        f.write("\n")
+    with span("history.append"):
+        entry = {"type": type, "timestamp": datetime.utcnow().isoformat(), "contenu": contenu}
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        path = BASE_DIR / fichier
+        if config.HISTORY_ASYNC:
+            _writer.submit(path, line)
+        else:
+            _append(path, line, config.HISTORY_DURABILITY)
 
 
-def charger_historique(fichier: str = "data/historique.jsonl") -> List[Dict[str, Any]]:
-    """Charge toutes les interactions du fichier JSONL."""
-    path = BASE_DIR / fichier
-    if not path.is_file():
-        return []
-    interactions = []
-    with path.open("r", encoding="utf-8") as f:
+def _read_segment(path: Path, type: Optional[str], since: Optional[str],
+                  until: Optional[str]) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            if not line.strip():
                 continue
+            if type is not None or since is not None or until is not None:
+                kind, ts = _head(line)
+                if type is not None and kind != type:
+                    continue
+                if ts is not None and (
+                    (since is not None and ts < since) or (until is not None and ts >= until)
+                ):
+                    continue
             try:
-                interactions.append(json.loads(line))
+                yield json.loads(line)
             except json.JSONDecodeError:
                 continue
-    return interactions
+
+
+def iter_historique(
+    type: Optional[str] = None,
+    since: Union[datetime, str, None] = None,
+    until: Union[datetime, str, None] = None,
+    fichier: str = "data/historique.jsonl",
+) -> Iterator[Dict[str, Any]]:
+    """Yield the interactions of type ``type`` logged in ``[since, until)``.
+
+    Closed segments are skipped from their manifest entry when they hold
+    no such interaction; the others are read one line at a time, so the
+    history never has to fit in memory. Datetimes are compared in UTC.
+    """
+    flush_interactions()
+    since, until = _timestamp(since), _timestamp(until)
+    path = BASE_DIR / fichier
+    directory = segment_dir(path)
+    for segment in _load_manifest(directory):
+        if type is not None and type not in segment["types"]:
+            continue
+        if since is not None and segment["last"] is not None and segment["last"] < since:
+            continue
+        if until is not None and segment["first"] is not None and segment["first"] >= until:
+            continue
+        file = directory / segment["file"]
+        if file.is_file():
+            yield from _read_segment(file, type, since, until)
+    if path.is_file():
+        yield from _read_segment(path, type, since, until)
+
+
+def charger_historique(fichier: str = "data/historique.jsonl") -> List[Dict[str, Any]]:
+    """Charge toutes les interactions du fichier JSONL et de ses segments."""
+    return list(iter_historique(fichier=fichier))
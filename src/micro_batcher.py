@@ -0,0 +1,157 @@
+"""In-process micro-batching of concurrent prediction requests.
+
+Threads calling a :class:`MicroBatcher` (for example Flask request threads)
+get a :class:`concurrent.futures.Future` each. A single worker thread waits
+up to ``max_wait_ms`` after the first queued request, or until
+``max_batch_size`` requests are queued, then runs one batched call and
+resolves every future. One forward pass then serves many callers instead
+of each caller competing for torch's intra-op threads.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+
+class MicroBatcher:
+    """Group concurrent single calls into calls of ``batch_fn``.
+
+    ``batch_fn`` receives a list of items and must return one result per
+    item, in the same order.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._metrics = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "max_batch_size": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "total_batch_seconds": 0.0,
+        }
+        self._batch_sizes: Dict[int, int] = {}
+
+    # ------------------------------------------------------------------
+    def submit(self, item: Any) -> Future:
+        """Queue ``item`` and return a future resolved with its result."""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+            self._metrics["requests"] += 1
+            self._queue.put((item, future, time.perf_counter()))
+            depth = self._queue.qsize()
+            if depth > self._metrics["max_queue_depth"]:
+                self._metrics["max_queue_depth"] = depth
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Submit ``item`` and wait for its result."""
+        return self.submit(item).result()
+
+    def close(self) -> None:
+        """Stop the worker after the queued requests are served."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return queue depth, batch size and wait time statistics."""
+        with self._lock:
+            m = dict(self._metrics)
+            sizes = dict(self._batch_sizes)
+        requests_done = sum(size * count for size, count in sizes.items())
+        m["queue_depth"] = self._queue.qsize()
+        m["batch_sizes"] = sizes
+        m["mean_batch_size"] = requests_done / m["batches"] if m["batches"] else 0.0
+        m["mean_wait_seconds"] = m["total_wait_seconds"] / requests_done if requests_done else 0.0
+        return m
+
+    # ------------------------------------------------------------------
+    def _collect(self) -> List[tuple] | None:
+        """Block for a first request then gather more until full or late."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Serve what we have, then stop on the next collect
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            error = None
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch function returned {len(results)} "
+                        f"results for {len(items)} items"
+                    )
+            except Exception as e:
+                error = e
+            self._record(batch, started, error is not None)
+            for i, (_, future, _) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+
+    def _record(self, batch: List[tuple], started: float, failed: bool) -> None:
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            m = self._metrics
+            m["batches"] += 1
+            m["errors"] += int(failed)
+            m["total_batch_seconds"] += elapsed
+            m["max_batch_size"] = max(m["max_batch_size"], len(batch))
+            for _, _, queued in batch:
+                wait = started - queued
+                m["total_wait_seconds"] += wait
+                m["max_wait_seconds"] = max(m["max_wait_seconds"], wait)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
@@ -0,0 +1,297 @@
+"""Lazy, shared loading of the trained sequence classification models.
+
+Models are loaded on first use instead of at import time, so importing a
+predictor (or a CLI command using one) costs nothing until a prediction is
+made. Concurrent first calls for the same model wait for a single load.
+Model directories saved from the same base checkpoint carry identical
+tokenizer files; they share one tokenizer instance. The registry can be
+bounded by a number of models and/or a parameter memory budget, in which
+case the least recently used models are unloaded.
+
+Models run through PyTorch by default, or through ONNX Runtime graphs
+written by :func:`src.onnx_backend.export_onnx` when the registry backend
+is ``"onnx"`` or ``"onnx-int8"``.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import config
+from tracing import span
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+# Files describing a tokenizer; identical contents mean an identical tokenizer
+TOKENIZER_FILES = (
+    "tokenizer.json",
+    "tokenizer_config.json",
+    "vocab.txt",
+    "special_tokens_map.json",
+)
+
+
+@dataclass
+class LoadedModel:
+    """A model, its tokenizer and load statistics."""
+
+    name: str
+    path: Path
+    tokenizer: Any
+    model: Any
+    id2label: Dict[int, str]
+    load_seconds: float = 0.0
+    param_bytes: int = 0
+    rss_bytes: int = 0
+    loaded_at: float = field(default_factory=time.time)
+    # model_fingerprint of the directory when it was loaded
+    fingerprint: str = ""
+
+    def logits(self, texts: Sequence[str], batch_size: int = 32):
+        """Return the logits for ``texts`` as a tensor, in input order.
+
+        Texts are tokenized once, sorted by token length and run
+        ``batch_size`` at a time, each batch padded only to its own
+        longest text.
+        """
+        import torch
+
+        if not texts:
+            return torch.empty((0, len(self.id2label)))
+        with span("model.tokenize", model=self.name):
+            encodings = self.tokenizer(list(texts), truncation=True)
+        features = [
+            {"input_ids": ids, "attention_mask": mask}
+            for ids, mask in zip(encodings["input_ids"], encodings["attention_mask"])
+        ]
+        order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+        result: List[Any] = [None] * len(features)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                bucket = order[start:start + batch_size]
+                inputs = self.tokenizer.pad(
+                    [features[i] for i in bucket], padding=True, return_tensors="pt"
+                )
+                with span("model.forward", model=self.name, batch=len(bucket)):
+                    logits = self.model(**inputs).logits
+                for i, row in zip(bucket, logits):
+                    result[i] = row
+        return torch.stack(result)
+
+    def topk(self, texts: Sequence[str], k: int = 3, batch_size: int = 32) -> List[List[Tuple[str, float]]]:
+        """Return the ``k`` most likely labels of each text with their
+        softmax probabilities, most likely first."""
+        logits = self.logits(texts, batch_size)
+        if not len(logits):
+            return []
+        probs, ids = logits.softmax(dim=1).topk(min(k, logits.shape[1]), dim=1)
+        return [
+            [(self.id2label[i], p) for i, p in zip(row_ids, row_probs)]
+            for row_ids, row_probs in zip(ids.tolist(), probs.tolist())
+        ]
+
+
+def _rss() -> int:
+    return psutil.Process().memory_info().rss if psutil is not None else 0
+
+
+def tokenizer_fingerprint(path: Path) -> str:
+    """Return a hash of the tokenizer files found in ``path``."""
+    digest = hashlib.sha1()
+    for name in TOKENIZER_FILES:
+        file = path / name
+        if file.is_file():
+            digest.update(name.encode())
+            digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def model_fingerprint(path: Path) -> str:
+    """Return a hash of the names, sizes and modification times of the
+    files saved in ``path``, leaving out its subdirectories (exported
+    graphs, checkpoints), so it changes whenever the model is saved again."""
+    digest = hashlib.sha1()
+    for file in sorted(p for p in Path(path).iterdir() if p.is_file()):
+        st = file.stat()
+        digest.update(f"{file.name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Load models by name on first use and keep them within a budget."""
+
+    def __init__(
+        self,
+        paths: Dict[str, Path],
+        max_models: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        backend: str = "torch",
+    ):
+        from src.onnx_backend import BACKENDS
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.paths = dict(paths)
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._tokenizers: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+        self.loads: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get(self, name: str) -> LoadedModel:
+        """Return the model registered as ``name``, loading it if needed."""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                self._models.move_to_end(name)
+                return entry
+            if name not in self.paths:
+                raise KeyError(f"Unknown model {name!r}")
+            lock = self._loading.setdefault(name, threading.Lock())
+        with lock:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    self._models.move_to_end(name)
+                    return entry
+            entry = self._load(name, Path(self.paths[name]))
+            with self._lock:
+                self._models[name] = entry
+                self.loads[name] = self.loads.get(name, 0) + 1
+                self._evict(keep=name)
+        return entry
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def unload(self, name: str) -> None:
+        """Drop ``name`` from memory; it is reloaded on next use."""
+        with self._lock:
+            self._models.pop(name, None)
+
+    def clear(self) -> None:
+        """Unload every model."""
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return load time and memory figures of every registered model."""
+        with self._lock:
+            result = {}
+            for name, path in self.paths.items():
+                entry = self._models.get(name)
+                result[name] = {
+                    "path": str(path),
+                    "backend": self.backend,
+                    "loaded": entry is not None,
+                    "loads": self.loads.get(name, 0),
+                    "load_seconds": entry.load_seconds if entry else None,
+                    "param_bytes": entry.param_bytes if entry else None,
+                    "rss_bytes": entry.rss_bytes if entry else None,
+                }
+            return result
+
+    # ------------------------------------------------------------------
+    def _tokenizer(self, path: Path):
+        from transformers import DistilBertTokenizerFast
+
+        key = tokenizer_fingerprint(path)
+        tokenizer = self._tokenizers.get(key)
+        if tokenizer is None:
+            tokenizer = DistilBertTokenizerFast.from_pretrained(path)
+            self._tokenizers[key] = tokenizer
+        return tokenizer
+
+    def _load(self, name: str, path: Path) -> LoadedModel:
+        if not path.exists():
+            raise FileNotFoundError(f"Trained model directory not found: {path}")
+        from transformers import AutoConfig, AutoModelForSequenceClassification
+
+        rss_before = _rss()
+        start = time.perf_counter()
+        # Taken before reading the files, so a save during the load gives a
+        # fingerprint that no longer matches the directory rather than one
+        # that matches weights which were not loaded
+        fingerprint = model_fingerprint(path)
+        tokenizer = self._tokenizer(path)
+        if self.backend == "torch":
+            model = AutoModelForSequenceClassification.from_pretrained(path)
+            model.eval()
+            model_config = model.config
+            param_bytes = sum(
+                t.numel() * t.element_size()
+                for t in list(model.parameters()) + list(model.buffers())
+            )
+        else:
+            from src.onnx_backend import OnnxSequenceClassifier, graph_source, onnx_path
+
+            graph = onnx_path(path, quantized=self.backend == "onnx-int8")
+            if not graph.is_file():
+                raise FileNotFoundError(
+                    f"ONNX graph not found: {graph} (run 'python cli.py export-onnx')"
+                )
+            # A graph exported before the model was saved again would pair
+            # old weights with the new label map
+            if graph_source(graph) != fingerprint:
+                raise FileNotFoundError(
+                    f"ONNX graph {graph} was exported from an older save of {path} "
+                    "(run 'python cli.py export-onnx' again)"
+                )
+            model = OnnxSequenceClassifier(graph)
+            model_config = AutoConfig.from_pretrained(path)
+            param_bytes = graph.stat().st_size
+        elapsed = time.perf_counter() - start
+        return LoadedModel(
+            name=name,
+            path=path,
+            tokenizer=tokenizer,
+            model=model,
+            id2label={int(k): v for k, v in model_config.id2label.items()},
+            load_seconds=elapsed,
+            param_bytes=param_bytes,
+            rss_bytes=max(_rss() - rss_before, 0),
+            fingerprint=fingerprint,
+        )
+
+    def _evict(self, keep: str) -> None:
+        """Unload least recently used models until within budget."""
+
+        def over_budget() -> bool:
+            if self.max_models is not None and len(self._models) > self.max_models:
+                return True
+            if self.max_bytes is not None:
+                return sum(m.param_bytes for m in self._models.values()) > self.max_bytes
+            return False
+
+        while over_budget():
+            oldest = next((n for n in self._models if n != keep), None)
+            if oldest is None:
+                break
+            del self._models[oldest]
+            self.evictions += 1
+
+
+registry = ModelRegistry(
+    {
+        "classifier": config.CLASSIFIER_MODEL_DIR,
+        "html_selector": config.HTML_SELECTOR_MODEL_DIR,
+        "html_only_selector": config.HTML_ONLY_SELECTOR_MODEL_DIR,
+    },
+    max_models=config.MODEL_REGISTRY_MAX_MODELS,
+    max_bytes=config.MODEL_REGISTRY_MAX_BYTES,
+    backend=config.INFERENCE_BACKEND,
+)
@@ -0,0 +1,185 @@
+"""ONNX Runtime inference path for the trained models.
+
+``export_onnx`` writes ``onnx/model.onnx`` (and optionally a dynamically
+int8-quantized ``onnx/model.int8.onnx``) next to a saved model. The
+registry loads these instead of the PyTorch weights when
+``config.INFERENCE_BACKEND`` is ``"onnx"`` or ``"onnx-int8"``; the
+tokenizer and label map still come from the model directory, so the
+predictors do not change.
+
+``onnx/source.json`` records the fingerprint of the model files each graph
+was exported from; the registry refuses a graph whose model has been
+saved again since.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+
+import config
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+SOURCE_FILE = "source.json"
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_INPUT_NAMES = ("input_ids", "attention_mask")
+
+
+def onnx_path(model_dir: Path, quantized: bool = False) -> Path:
+    """Return where the ONNX graph of ``model_dir`` is stored."""
+    return Path(model_dir) / ONNX_SUBDIR / (QUANTIZED_FILE if quantized else ONNX_FILE)
+
+
+def graph_source(graph: Path) -> Optional[str]:
+    """Return the fingerprint of the model ``graph`` was exported from."""
+    sources = Path(graph).parent / SOURCE_FILE
+    if not sources.is_file():
+        return None
+    return json.loads(sources.read_text(encoding="utf-8")).get(Path(graph).name)
+
+
+def _record_source(model_dir: Path, graphs: Sequence[Path]) -> None:
+    from src.model_registry import model_fingerprint
+
+    path = Path(model_dir) / ONNX_SUBDIR / SOURCE_FILE
+    sources = json.loads(path.read_text(encoding="utf-8")) if path.is_file() else {}
+    fingerprint = model_fingerprint(model_dir)
+    sources.update({Path(graph).name: fingerprint for graph in graphs})
+    path.write_text(json.dumps(sources, indent=1), encoding="utf-8")
+
+
+class OnnxSequenceClassifier:
+    """Run an exported graph with the call signature of a HF model."""
+
+    def __init__(self, path: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = Path(path)
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **_):
+        import numpy as np
+        import torch
+
+        feeds = {
+            "input_ids": np.asarray(input_ids, dtype=np.int64),
+            "attention_mask": np.asarray(attention_mask, dtype=np.int64),
+        }
+        (logits,) = self.session.run(["logits"], feeds)
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def export_onnx(model_dir: Path, quantize: bool = False) -> Dict[str, Path]:
+    """Export ``model_dir`` to ONNX, optionally with an int8 copy."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, DistilBertTokenizerFast
+
+    model_dir = Path(model_dir)
+    if not model_dir.exists():
+        raise FileNotFoundError(f"Trained model directory not found: {model_dir}")
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    tokenizer = DistilBertTokenizerFast.from_pretrained(model_dir)
+
+    class _LogitsOnly(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    # Two examples of different lengths so no dimension is specialised
+    sample = tokenizer(["<a href='/'>x</a>", "<div class='a'><p>texte</p></div>"],
+                       padding=True, return_tensors="pt")
+    batch = torch.export.Dim("batch")
+    sequence = torch.export.Dim("sequence")
+    out = onnx_path(model_dir)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        _LogitsOnly(model).eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        str(out),
+        input_names=list(_INPUT_NAMES),
+        output_names=["logits"],
+        dynamic_shapes={name: {0: batch, 1: sequence} for name in _INPUT_NAMES},
+        dynamo=True,
+    )
+    written = {"onnx": out}
+    if quantize:
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # The exporter records intermediate shapes traced from the sample;
+        # drop them so the quantizer re-infers them symbolically
+        graph = onnx.load(str(out))
+        del graph.graph.value_info[:]
+        stripped = out.with_suffix(".shapeless.onnx")
+        onnx.save(graph, str(stripped))
+        quantized = onnx_path(model_dir, quantized=True)
+        try:
+            quantize_dynamic(str(stripped), str(quantized), weight_type=QuantType.QInt8)
+        finally:
+            stripped.unlink()
+        written["onnx-int8"] = quantized
+    _record_source(model_dir, list(written.values()))
+    return written
+
+
+def check_parity(model_dir: Path, texts: Sequence[str], backend: str = "onnx",
+                 batch_size: int = 32) -> Dict[str, float]:
+    """Compare the logits of an exported graph with the PyTorch model.
+
+    Returns the largest absolute logit difference and the share of
+    ``texts`` for which both predict the same label.
+    """
+    from src.model_registry import ModelRegistry
+
+    reference = ModelRegistry({"m": model_dir}, backend="torch").get("m")
+    candidate = ModelRegistry({"m": model_dir}, backend=backend).get("m")
+    expected = reference.logits(texts, batch_size)
+    actual = candidate.logits(texts, batch_size)
+    agreement = (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item()
+    return {
+        "max_abs_diff": (expected - actual).abs().max().item() if len(texts) else 0.0,
+        "agreement": agreement if len(texts) else 1.0,
+    }
+
+
+def sample_texts(name: str, limit: int = 200) -> List[str]:
+    """Return up to ``limit`` model inputs from the training data of ``name``."""
+    texts: List[str] = []
+    if name == "html_only_selector":
+        with open(config.HTML_ONLY_SELECTOR_FILE, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                texts.append(row["html"])
+                if len(texts) >= limit:
+                    break
+        return texts
+    from src.html_selector import format_input
+
+    path = config.INTENTS_FILE if name == "classifier" else config.HTML_SELECTOR_FILE
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if name == "classifier":
+                texts.append(row["text"])
+            else:
+                texts.append(format_input(row["question"], row["html"]))
+            if len(texts) >= limit:
+                break
+    return texts
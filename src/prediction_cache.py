@@ -0,0 +1,286 @@
+"""Content-addressed cache of selector and intent predictions.
+
+Entries are keyed by a hash of the normalized HTML, the question and a
+version string identifying what produced the answer: the model loaded in
+memory (see :func:`model_version`) or the source of the heuristic modules
+(see :func:`source_version`). Reloading a retrained model or editing a
+heuristic therefore changes the key, and stale entries are simply never
+read again.
+
+The cache has an in-memory LRU tier and an optional SQLite tier shared by
+processes and kept across restarts (``config.PREDICTION_CACHE_PATH``),
+which keeps the ``config.PREDICTION_CACHE_DISK_SIZE`` latest entries.
+"""
+from __future__ import annotations
+
+import hashlib
+import html as html_lib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import config
+
+
+class _Normalizer(HTMLParser):
+    """Re-serialize HTML with sorted attributes and stripped text."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+
+    def _tag(self, tag, attrs, close=""):
+        rendered = "".join(
+            f" {name}" if value is None else f' {name}="{html_lib.escape(value)}"'
+            for name, value in sorted(attrs)
+        )
+        self.parts.append(f"<{tag}{rendered}{close}>")
+
+    def handle_starttag(self, tag, attrs):
+        self._tag(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self._tag(tag, attrs, "/")
+
+    def handle_endtag(self, tag):
+        self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        # Leading/trailing whitespace of a string never changes the text
+        # the engines measure (get_text(strip=True)) or the selectors
+        data = data.strip()
+        if data:
+            self.parts.append(html_lib.escape(data, quote=False))
+
+    def handle_comment(self, data):
+        self.parts.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.parts.append(f"<!{decl}>")
+
+
+def normalize_html(html: str) -> str:
+    """Return ``html`` with attributes sorted and text nodes stripped.
+
+    Tag and attribute names are lowercased and whitespace-only text
+    between tags is dropped, so snippets differing only in formatting or
+    attribute order normalize to the same string.
+    """
+    normalizer = _Normalizer()
+    normalizer.feed(html)
+    normalizer.close()
+    return "".join(normalizer.parts)
+
+
+def make_key(namespace: str, html: str, question: str, version: str) -> str:
+    """Return the cache key of a prediction."""
+    digest = hashlib.sha256()
+    for part in (namespace, version, question.strip(), normalize_html(html)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def directory_fingerprint(path: Path) -> str:
+    """Return a hash of the names, sizes and modification times below ``path``."""
+    path = Path(path)
+    if not path.exists():
+        return "missing"
+    digest = hashlib.sha1()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        st = file.stat()
+        digest.update(f"{file.relative_to(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def model_version(name: str) -> str:
+    """Return the version string of a registered model.
+
+    The version is the fingerprint the registry took when it loaded the
+    model (loading it if needed), so answers are stored under the weights
+    that produced them even after a new training run rewrites the directory.
+    """
+    from src.model_registry import registry
+
+    return f"{name}:{registry.backend}:{registry.get(name).fingerprint}"
+
+
+@lru_cache(maxsize=None)
+def _source_hash(filename: str) -> str:
+    return hashlib.sha1(Path(filename).read_bytes()).hexdigest()
+
+
+def source_version(*modules) -> str:
+    """Return a version string from the source files of ``modules``."""
+    return ":".join(_source_hash(module.__file__)[:12] for module in modules)
+
+
+_MISSING = object()
+
+
+class Uncached:
+    """A computed value to return without storing it, such as an answer
+    cut short by a work limit."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class PredictionCache:
+    """In-memory LRU of predictions backed by an optional SQLite file."""
+
+    def __init__(self, max_entries: int = 1024, path: Optional[Path] = None,
+                 max_disk_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.path is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value stored for ``key`` or ``default``."""
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if self.path is not None:
+                row = self._db().execute(
+                    "SELECT value FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable ``value`` under ``key``."""
+        with self._lock:
+            self._remember(key, value)
+            if self.path is not None:
+                db = self._db()
+                cursor = db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+                if self.max_disk_entries is not None:
+                    # Rowids grow with each insert (a replaced key gets a new
+                    # one), so this keeps the latest max_disk_entries rows
+                    self.disk_evictions += db.execute(
+                        "DELETE FROM predictions WHERE rowid <= ?",
+                        (cursor.lastrowid - self.max_disk_entries,),
+                    ).rowcount
+                db.commit()
+
+    def get_or_compute(self, namespace: str, html: str, question: str, version: str,
+                       compute: Callable[[], Any]) -> Any:
+        """Return the cached prediction, calling ``compute`` on a miss.
+
+        A value ``compute`` wraps in :class:`Uncached` is returned unwrapped
+        and not stored.
+        """
+        if not self.enabled:
+            value = compute()
+            return value.value if isinstance(value, Uncached) else value
+        key = make_key(namespace, html, question, version)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            if isinstance(value, Uncached):
+                return value.value
+            self.put(key, value)
+        return value
+
+    def get_or_compute_many(self, namespace: str, htmls: Sequence[str], questions: Sequence[str],
+                            version: str, compute: Callable[[List[int]], Sequence[Any]]) -> List[Any]:
+        """Return the predictions of many items, in input order.
+
+        ``compute`` receives the indices of the items missing from the
+        cache and returns their predictions in the same order.
+        """
+        if not self.enabled:
+            return list(compute(list(range(len(htmls)))))
+        keys = [make_key(namespace, h, q, version) for h, q in zip(htmls, questions)]
+        values = [self.get(key, _MISSING) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is _MISSING]
+        if missing:
+            for i, value in zip(missing, compute(missing)):
+                values[i] = value
+                self.put(keys[i], value)
+        return values
+
+    def clear(self) -> None:
+        """Drop every entry, on disk too, and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                db = self._db()
+                db.execute("DELETE FROM predictions")
+                db.commit()
+            self.hits = self.disk_hits = self.misses = self.evictions = self.disk_evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "path": str(self.path) if self.path else None,
+            }
+
+    # ------------------------------------------------------------------
+    def _remember(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _db(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so each process opens its own
+        if self._conn is None or self._conn_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+
+cache = PredictionCache(
+    config.PREDICTION_CACHE_SIZE, config.PREDICTION_CACHE_PATH, config.PREDICTION_CACHE_DISK_SIZE
+)
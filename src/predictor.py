@@ -1,32 +1,42 @@
 """Utilities for loading the trained intent classifier and predicting labels."""
 
-from pathlib import Path
 import config
 
 import torch
-from transformers import AutoModelForSequenceClassification, DistilBertTokenizerFast
 from src.memoire_generale import ajouter_interaction
+from src.model_registry import registry
+from src.prediction_cache import cache, model_version
+from tracing import span
 
+MODEL_NAME = "classifier"
 MODEL_DIR = config.CLASSIFIER_MODEL_DIR
-if not MODEL_DIR.exists():
-    raise FileNotFoundError(f"Trained model directory not found: {MODEL_DIR}")
 
-tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_DIR)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_DIR)
-model.eval()
 
-id2label = {int(k): v for k, v in model.config.id2label.items()}
+def __getattr__(name):
+    # ``tokenizer``, ``model`` and ``id2label`` used to be loaded at import
+    # time; they are now resolved from the registry on first access.
+    if name in {"tokenizer", "model", "id2label"}:
+        return getattr(registry.get(MODEL_NAME), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _predict(text: str) -> str:
+    loaded = registry.get(MODEL_NAME)
+    with span("model.tokenize", model=MODEL_NAME):
+        inputs = loaded.tokenizer(text, return_tensors="pt", truncation=True, padding=True)
+    with torch.no_grad(), span("model.forward", model=MODEL_NAME, batch=1):
+        outputs = loaded.model(**inputs)
+        pred_id = outputs.logits.argmax(dim=1).item()
+    return loaded.id2label[pred_id]
 
 
 def predict_intent(text: str) -> str:
     text = text.strip()
     if not text:
         raise ValueError("Input text is empty")
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        pred_id = outputs.logits.argmax(dim=1).item()
-    label = id2label[pred_id]
+    label = cache.get_or_compute(
+        MODEL_NAME, "", text, model_version(MODEL_NAME), lambda: _predict(text)
+    )
     try:
         ajouter_interaction(
             "prediction",
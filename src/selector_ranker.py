@@ -0,0 +1,325 @@
+"""Candidate ranking model for selectors predicted from HTML alone.
+
+The ``html_only_selector`` classifier has one output per selector string
+of its dataset: its head grows with the data and it can never answer a
+selector it has not seen. The ranker instead scores the selectors the
+heuristic proposes for the snippet itself: the best elements by
+:func:`~css_selector_generator.compute_score` (``config.RANKER_MAX_ELEMENTS``
+of them), each refined and turned into its :func:`build_selector` answer
+and its :func:`generate_selector_candidates`. Every (snippet, candidate)
+pair is described by a few numeric features and scored by a logistic
+regression; the model is a weight vector of constant size and a
+prediction costs one parse and a few operations per candidate.
+
+A candidate counts as correct when it equals the dataset selector or
+selects the same elements of the snippet. Training needs scikit-learn;
+the trained ranker is saved as JSON in ``config.RANKER_MODEL_DIR`` and
+scoring only needs NumPy.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import config
+from css_selector_generator import (
+    _CLASS_RE,
+    _score_candidate,
+    build_selector,
+    compute_score,
+    generate_selector_candidates,
+    has_keyword,
+    is_generic,
+    refine_candidate,
+)
+from html_parsing import make_soup
+from limits import WorkLimits
+from src import ingestion
+
+RANKER_FILE = "ranker.json"
+
+FEATURES = (
+    "id",  # the selector is an id
+    "starts_with_tag",
+    "classes",
+    "generic_classes",
+    "keyword_classes",
+    "depth",  # descendant combinators
+    "length",  # characters / 10
+    "log_matches",  # log(1 + elements the selector matches in the snippet)
+    "unique",  # the selector matches a single element
+    "element_score",  # compute_score of the candidate's element
+    "element_rank",  # 1 / (1 + rank of the element by score)
+    "built",  # the build_selector answer for the element
+    "anchor",
+    "has_text",
+    "heuristic",  # _score_candidate / 10
+)
+
+
+class Candidate:
+    """A selector proposed for a snippet and the element it was built for."""
+
+    __slots__ = ("selector", "element", "rank", "built")
+
+    def __init__(self, selector: str, element, rank: int, built: bool):
+        self.selector = selector
+        self.element = element
+        self.rank = rank
+        self.built = built
+
+
+def parse(html: str, parser: Optional[str] = None):
+    limits = WorkLimits.from_config()
+    soup = make_soup(limits.check_input(html), parser)
+    limits.prune(soup)
+    return soup
+
+
+def candidates(soup, max_elements: Optional[int] = None) -> List[Candidate]:
+    """Return the distinct candidate selectors of ``soup``, best elements first."""
+    max_elements = max_elements or config.RANKER_MAX_ELEMENTS
+    elements = sorted(soup.find_all(True), key=compute_score, reverse=True)[:max_elements]
+    found: Dict[str, Candidate] = {}
+    for rank, element in enumerate(elements):
+        target = refine_candidate(element)
+        built = build_selector(target)
+        for selector in [built] + generate_selector_candidates(target):
+            if selector and selector not in found:
+                found[selector] = Candidate(selector, target, rank, selector == built)
+    return list(found.values())
+
+
+def _select(soup, selector: str) -> list:
+    try:
+        return soup.select(selector)
+    except Exception:  # soupsieve rejects some class names
+        return []
+
+
+def features(soup, candidate: Candidate) -> List[float]:
+    """Return the values of :data:`FEATURES` for ``candidate``."""
+    selector = candidate.selector
+    classes = _CLASS_RE.findall(selector)
+    matches = len(_select(soup, selector))
+    element = candidate.element
+    return [
+        float(selector.startswith("#")),
+        float(selector[:1].isalpha()),
+        float(len(classes)),
+        float(sum(is_generic(c) for c in classes)),
+        float(sum(has_keyword(c) for c in classes)),
+        float(selector.count(" ")),
+        len(selector) / 10,
+        math.log1p(matches),
+        float(matches == 1),
+        float(compute_score(element)),
+        1 / (1 + candidate.rank),
+        float(candidate.built),
+        float(element.name == "a"),
+        float(bool(element.get_text(strip=True))),
+        _score_candidate(selector) / 10,
+    ]
+
+
+def is_correct(soup, selector: str, gold: str, gold_matches: Optional[list] = None) -> bool:
+    """Return True when ``selector`` is ``gold`` or selects the same elements."""
+    if selector == gold:
+        return True
+    if gold_matches is None:
+        gold_matches = _select(soup, gold)
+    if not gold_matches:
+        return False
+    matches = _select(soup, selector)
+    return len(matches) == len(gold_matches) and all(a is b for a, b in zip(matches, gold_matches))
+
+
+class Ranker:
+    """A trained linear scorer over :data:`FEATURES`."""
+
+    def __init__(self, mean: Sequence[float], scale: Sequence[float], coef: Sequence[float],
+                 intercept: float, info: Optional[Dict[str, Any]] = None):
+        import numpy as np
+
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.info = info or {}
+
+    def scores(self, rows: Sequence[Sequence[float]]):
+        import numpy as np
+
+        x = (np.asarray(rows, dtype=np.float64).reshape(-1, len(self.coef)) - self.mean) / self.scale
+        return x @ self.coef + self.intercept
+
+    def rank(self, html: str, top_k: int = 3, parser: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return the ``top_k`` best candidates of ``html`` with their
+        probabilities among all the candidates, best first."""
+        import numpy as np
+
+        soup = parse(html, parser)
+        found = candidates(soup)
+        if not found:
+            return []
+        scores = self.scores([features(soup, c) for c in found])
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(found[i].selector, float(probs[i])) for i in order]
+
+    def save(self, directory: Path) -> Path:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / RANKER_FILE
+        path.write_text(json.dumps({
+            "features": list(FEATURES),
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "coef": self.coef.tolist(),
+            "intercept": self.intercept,
+            "info": self.info,
+        }, indent=1), encoding="utf-8")
+        return path
+
+    @classmethod
+    def load(cls, directory: Path) -> "Ranker":
+        path = Path(directory) / RANKER_FILE
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"No ranker in {directory}: train it with 'python cli.py train-ranker'"
+            )
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data["features"] != list(FEATURES):
+            raise ValueError(f"{path} was trained on other features; train the ranker again")
+        return cls(data["mean"], data["scale"], data["coef"], data["intercept"], data.get("info"))
+
+
+_loaded: Dict[Path, Tuple[float, Ranker]] = {}
+_lock = threading.Lock()
+
+
+def get_ranker(directory: Optional[Path] = None) -> Ranker:
+    """Return the ranker saved in ``directory``, loaded once per version of its file."""
+    directory = Path(directory or config.RANKER_MODEL_DIR)
+    mtime = (directory / RANKER_FILE).stat().st_mtime if (directory / RANKER_FILE).is_file() else 0.0
+    with _lock:
+        cached = _loaded.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, Ranker.load(directory))
+            _loaded[directory] = cached
+        return cached[1]
+
+
+def rank_selectors(html: str, top_k: int = 3) -> List[Tuple[str, float]]:
+    html = html.strip()
+    if not html:
+        raise ValueError("Input HTML is empty")
+    return get_ranker().rank(html, top_k)
+
+
+def predict_selector(html: str) -> str:
+    """Return the best ranked selector for ``html``."""
+    ranked = rank_selectors(html, 1)
+    return ranked[0][0] if ranked else ""
+
+
+def read_rows(data_file: Path, max_rows: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Yield the ``(html, selector)`` rows of an ``html_only_selector`` CSV file."""
+    with open(data_file, newline="", encoding="utf-8") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            if max_rows is not None and i >= max_rows:
+                break
+            if row.get("html") and row.get("selector"):
+                yield row["html"], row["selector"]
+
+
+def build_examples(rows: Iterable[Tuple[str, str]], test_size: float):
+    """Turn ``rows`` into candidate features and labels.
+
+    Return ``{"train": (X, y), "test": [...]}``, the test split keeping one
+    entry per snippet (its candidate features, correctness flags and
+    whether the heuristic answer is correct), and the count of snippets
+    for which no candidate was correct.
+    """
+    train_x: List[List[float]] = []
+    train_y: List[int] = []
+    test: List[Tuple[List[List[float]], List[bool], bool]] = []
+    uncovered = 0
+    for html, gold in rows:
+        soup = parse(html)
+        found = candidates(soup)
+        gold_matches = _select(soup, gold)
+        correct = [is_correct(soup, c.selector, gold, gold_matches) for c in found]
+        if not any(correct):
+            uncovered += 1
+            continue
+        rows_x = [features(soup, c) for c in found]
+        if ingestion.is_test(html, test_size):
+            heuristic = next((c for c in found if c.built), None)
+            test.append((rows_x, correct, bool(heuristic and correct[found.index(heuristic)])))
+        else:
+            train_x.extend(rows_x)
+            train_y.extend(int(flag) for flag in correct)
+    return {"train": (train_x, train_y), "test": test}, uncovered
+
+
+def top1_accuracy(ranker: Ranker, test) -> float:
+    hits = 0
+    for rows_x, correct, _ in test:
+        hits += correct[int(ranker.scores(rows_x).argmax())]
+    return hits / len(test) if test else 0.0
+
+
+def train_ranker(
+    data_file: Optional[Path] = None,
+    output_dir: Optional[Path] = None,
+    *,
+    max_rows: Optional[int] = None,
+    test_size: float = 0.1,
+) -> Dict[str, Any]:
+    """Train the ranker on an ``html_only_selector`` CSV file and save it.
+
+    Return the rows used, the snippets none of whose candidates is correct
+    (``uncovered``) and the top-1 accuracy of the ranker and of the
+    heuristic on the test snippets.
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+
+    data_file = Path(data_file or config.HTML_ONLY_SELECTOR_FILE)
+    if not data_file.is_file():
+        raise FileNotFoundError(f"Dataset not found at {data_file}")
+    start = time.perf_counter()
+    examples, uncovered = build_examples(read_rows(data_file, max_rows), test_size)
+    train_x, train_y = examples["train"]
+    if len(set(train_y)) < 2:
+        raise ValueError(f"{data_file} gives no correct and incorrect candidates to learn from")
+    prepare_seconds = time.perf_counter() - start
+
+    # Constant features get a scale of 1
+    scaler = StandardScaler().fit(train_x)
+    classifier = LogisticRegression(max_iter=1000, class_weight="balanced")
+    classifier.fit(scaler.transform(train_x), train_y)
+    test = examples["test"]
+    info = {
+        "data_file": str(data_file),
+        "train_candidates": len(train_y),
+        "test_snippets": len(test),
+        "uncovered": uncovered,
+    }
+    ranker = Ranker(scaler.mean_, scaler.scale_, classifier.coef_[0], classifier.intercept_[0], info)
+    info["accuracy"] = top1_accuracy(ranker, test)
+    info["heuristic_accuracy"] = sum(h for _, _, h in test) / len(test) if test else 0.0
+    path = ranker.save(output_dir or config.RANKER_MODEL_DIR)
+    return {
+        **info,
+        "path": path,
+        "prepare_seconds": round(prepare_seconds, 3),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
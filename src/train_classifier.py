@@ -3,9 +3,9 @@
 from src import training
 
 
-def main() -> None:
+def main(resume: bool = False) -> None:
     """Run the classifier training using :mod:`src.training`."""
-    training.train_classifier()
+    training.train_classifier(resume=resume)
 
 
 if __name__ == "__main__":
@@ -3,9 +3,9 @@
 from src import training
 
 
-def main() -> None:
+def main(resume: bool = False) -> None:
     """Run the HTML-only selector training."""
-    training.train_html_only_selector()
+    training.train_html_only_selector(resume=resume)
 
 
 if __name__ == "__main__":
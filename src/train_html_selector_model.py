@@ -3,9 +3,9 @@
 from src import training
 
 
-def main() -> None:
+def main(resume: bool = False) -> None:
     """Run the selector model training using :mod:`src.training`."""
-    training.train_html_selector()
+    training.train_html_selector(resume=resume)
 
 
 if __name__ == "__main__":
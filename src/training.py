@@ -1,20 +1,63 @@
-"""Utility training functions for CLI and GUI."""
+"""Utility training functions for CLI and GUI.
+
+The three models are trained by :func:`train` from a :class:`TaskSpec`
+describing their dataset. Examples are tokenized without padding and each
+batch is padded to its own longest example by a data collator, with the
+training sampler grouping examples of similar length so batches carry
+little padding. ``max_length`` is taken from a percentile of the token
+lengths of the training set (``config.TRAIN_LENGTH_PERCENTILE``), capped by
+the task's maximum, and saved with the tokenizer so inference truncates
+the same way. Tokenized datasets are cached on disk between runs (see
+:func:`prepare_dataset`).
+
+Checkpoints go to ``<output dir>/checkpoints``. The model is evaluated at
+each checkpoint; training stops early once ``config.TRAIN_BEST_METRIC``
+has not improved for ``config.TRAIN_EARLY_STOPPING_PATIENCE`` evaluations,
+and the best checkpoint is the model saved at the end. A stopped or killed
+run is continued from its last checkpoint with ``resume=True``.
+"""
 from __future__ import annotations
 
+import hashlib
+import inspect
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Dict, Optional, Any
+from typing import Any, Callable, Dict, List, Optional, Sequence
 import config
 
-from datasets import load_dataset
+from datasets import DatasetDict, load_dataset, load_from_disk
 from transformers import (
     AutoModelForSequenceClassification,
+    DataCollatorWithPadding,
     DistilBertTokenizerFast,
+    EarlyStoppingCallback,
     Trainer,
     TrainingArguments,
     TrainerCallback,
 )
+from transformers.trainer_utils import get_last_checkpoint
 from sklearn.metrics import accuracy_score
 
+from src import ingestion
+
+# Shortest max_length chosen from the data
+MIN_MAX_LENGTH = 8
+
+CACHE_META = "meta.json"
+
+# Temporary column telling test rows from train rows
+SPLIT_COLUMN = "is_test"
+
+# Subdirectory of the output directory holding the checkpoints
+CHECKPOINT_DIR = "checkpoints"
+
 
 class ProgressCallback(TrainerCallback):
     """Report training progress through a callback."""
@@ -26,203 +69,516 @@ class ProgressCallback(TrainerCallback):
     def on_log(self, args, state, control, logs=None, **kwargs):
         if logs and self.callback:
             self.callback(logs)
+
+    def on_step_end(self, args, state, control, **kwargs):
         if self.stop_event and self.stop_event.is_set():
             control.should_training_stop = True
-
-
-def train_classifier(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
-                     stop_event=None) -> None:
-    """Train the intent classifier."""
-    data_path = config.INTENTS_FILE
-    if not data_path.is_file():
-        raise FileNotFoundError(f"Dataset not found at {data_path}")
-    dataset = load_dataset("json", data_files=str(data_path))
-    dataset = dataset["train"].train_test_split(test_size=0.2, seed=42)
-
-    labels = sorted(set(dataset["train"]["label"]))
-    label2id = {l: i for i, l in enumerate(labels)}
-    id2label = {i: l for l, i in label2id.items()}
-
-    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-multilingual-cased")
-
+            # Keep the progress for a resumed run
+            control.should_save = args.save_strategy != "no"
+
+
+def _question_html(batch: Dict[str, List[Any]]) -> List[str]:
+    from src.html_selector import format_input
+
+    return [format_input(q, h) for q, h in zip(batch["question"], batch["html"])]
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    """How to train one model: its dataset, inputs, labels and defaults."""
+
+    name: str
+    data_file: Path
+    data_format: str  # "json" or "csv"
+    label_column: str
+    # Returns the model input texts of a batch of dataset rows
+    texts: Callable[[Dict[str, List[Any]]], List[str]]
+    output_dir: Path
+    # Upper bound for the max_length chosen from the data
+    max_length: int
+    epochs: Optional[int] = None  # None = config.TRAIN_EPOCHS
+    test_size: float = 0.1
+    save_steps: int = 100
+
+
+TASKS: Dict[str, TaskSpec] = {
+    "classifier": TaskSpec(
+        name="classifier",
+        data_file=config.INTENTS_FILE,
+        data_format="json",
+        label_column="label",
+        texts=lambda batch: batch["text"],
+        output_dir=config.CLASSIFIER_MODEL_DIR,
+        max_length=32,
+        test_size=0.2,
+        save_steps=50,
+    ),
+    "html_selector": TaskSpec(
+        name="html_selector",
+        data_file=config.HTML_SELECTOR_FILE,
+        data_format="json",
+        label_column="label",
+        texts=_question_html,
+        output_dir=config.HTML_SELECTOR_MODEL_DIR,
+        max_length=128,
+        epochs=3,
+    ),
+    "html_only_selector": TaskSpec(
+        name="html_only_selector",
+        data_file=config.HTML_ONLY_SELECTOR_FILE,
+        data_format="csv",
+        label_column="selector",
+        texts=lambda batch: batch["html"],
+        output_dir=config.HTML_ONLY_SELECTOR_MODEL_DIR,
+        max_length=128,
+        epochs=3,
+    ),
+}
+
+
+def length_percentile(lengths: Sequence[int], percentile: float, cap: int) -> int:
+    """Return the ``percentile`` of ``lengths``, clipped to ``[MIN_MAX_LENGTH, cap]``."""
+    if not lengths:
+        return cap
+    ordered = sorted(lengths)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return max(MIN_MAX_LENGTH, min(cap, ordered[rank]))
+
+
+def _supported(cls, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the keyword arguments ``cls`` does not accept (transformers renamed
+    several training options between major versions)."""
+    params = inspect.signature(cls.__init__).parameters
+    return {k: v for k, v in kwargs.items() if k in params}
+
+
+def _training_arguments(group_by_length: bool, **kwargs) -> TrainingArguments:
+    params = inspect.signature(TrainingArguments.__init__).parameters
+    if "eval_strategy" not in params and "eval_strategy" in kwargs:
+        kwargs["evaluation_strategy"] = kwargs.pop("eval_strategy")
+    if "group_by_length" in params:
+        kwargs["group_by_length"] = group_by_length
+    elif group_by_length:
+        kwargs["train_sampling_strategy"] = "group_by_length"
+    return TrainingArguments(**_supported(TrainingArguments, kwargs))
+
+
+def file_hash(path: Path) -> str:
+    """Return the SHA-256 of the contents of ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tokenizer_identity(tokenizer) -> str:
+    """Return a hash of the vocabulary and rules of a fast tokenizer."""
+    state = json.loads(tokenizer.backend_tokenizer.to_str())
+    # Truncation and padding are set per call, not part of the identity
+    state.pop("truncation", None)
+    state.pop("padding", None)
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(spec: TaskSpec, tokenizer, max_length: Optional[int], dynamic_padding: bool) -> str:
+    """Return the key of the tokenized dataset of ``spec`` in the cache."""
+    from src import html_selector
+    from src.prediction_cache import source_version
+
+    parts = {
+        "task": spec.name,
+        "data": file_hash(spec.data_file),
+        "format": spec.data_format,
+        "label": spec.label_column,
+        "test_size": spec.test_size,
+        "tokenizer": tokenizer_identity(tokenizer),
+        "max_length": max_length or f"p{config.TRAIN_LENGTH_PERCENTILE}<={spec.max_length}",
+        "dynamic_padding": dynamic_padding,
+        # The code turning rows into texts and tokens
+        "source": source_version(sys.modules[__name__], html_selector),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def _tokenize_fn(spec: TaskSpec, tokenizer, label2id: Dict[Any, int], max_length: int,
+                 dynamic_padding: bool, with_split: bool = False):
     def tokenize(batch):
-        enc = tokenizer(batch["text"], truncation=True, padding="max_length", max_length=32)
-        enc["labels"] = [label2id[l] for l in batch["label"]]
+        texts = spec.texts(batch)
+        enc = tokenizer(
+            texts,
+            truncation=True,
+            max_length=max_length,
+            padding=False if dynamic_padding else "max_length",
+            return_length=True,
+        )
+        enc["labels"] = [label2id[l] for l in batch[spec.label_column]]
+        if with_split:
+            enc[SPLIT_COLUMN] = ingestion.split_flags(texts, spec.test_size)
         return enc
 
-    tokenized = dataset.map(tokenize, batched=True, remove_columns=["text", "label"])
+    return tokenize
 
-    model = AutoModelForSequenceClassification.from_pretrained(
-        "distilbert-base-multilingual-cased", num_labels=len(labels), id2label=id2label, label2id=label2id
-    )
 
-    args = TrainingArguments(
-        output_dir=str(config.CLASSIFIER_MODEL_DIR),
-        num_train_epochs=config.TRAIN_EPOCHS,
-        per_device_train_batch_size=config.TRAIN_BATCH_SIZE,
-        learning_rate=config.LEARNING_RATE,
-        logging_dir="logs",
-        logging_steps=10,
-        save_steps=50,
-        save_total_limit=1,
-        do_train=True,
-    )
+def _percentile_max_length(spec: TaskSpec, tokenizer, texts: List[str]) -> int:
+    lengths = tokenizer(
+        texts, truncation=True, max_length=spec.max_length, return_length=True,
+    )["length"]
+    return length_percentile(lengths, config.TRAIN_LENGTH_PERCENTILE, spec.max_length)
 
-    def compute_metrics(eval_pred):
-        logits, labels = eval_pred
-        preds = logits.argmax(-1)
-        acc = accuracy_score(labels, preds)
-        return {"accuracy": acc}
 
-    callbacks = []
-    if progress_cb:
-        callbacks.append(ProgressCallback(progress_cb, stop_event))
+def _build_dataset(spec: TaskSpec, tokenizer, max_length: Optional[int], dynamic_padding: bool):
+    # Arrow files on disk, memory-mapped: the rows never all sit in memory
+    dataset = load_dataset(spec.data_format, data_files=str(spec.data_file), split="train")
 
-    trainer = Trainer(
-        model=model,
-        args=args,
-        train_dataset=tokenized["train"],
-        eval_dataset=tokenized["test"],
-        tokenizer=tokenizer,
-        compute_metrics=compute_metrics,
-        callbacks=callbacks,
-    )
-
-    trainer.train()
-    trainer.save_model(args.output_dir)
-    tokenizer.save_pretrained(args.output_dir)
+    labels = sorted(dataset.unique(spec.label_column))
+    label2id = {l: i for i, l in enumerate(labels)}
 
+    if max_length is None:
+        step = max(1, len(dataset) // config.TRAIN_LENGTH_SAMPLE)
+        sample = dataset.select(range(0, len(dataset), step))
+        max_length = _percentile_max_length(spec, tokenizer, spec.texts(sample[:]))
 
-def train_html_selector(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
-                        stop_event=None) -> None:
-    """Train the HTML selector model."""
-    data_path = config.HTML_SELECTOR_FILE
-    if not data_path.is_file():
-        raise FileNotFoundError(f"Dataset not found at {data_path}")
-    dataset = load_dataset("json", data_files=str(data_path))
-    dataset = dataset["train"].train_test_split(test_size=0.1, seed=42)
+    num_proc = ingestion.num_proc_for(len(dataset))
+    tokenized = dataset.map(
+        _tokenize_fn(spec, tokenizer, label2id, max_length, dynamic_padding, with_split=True),
+        batched=True, num_proc=num_proc, remove_columns=dataset.column_names,
+    )
 
-    labels = sorted(set(dataset["train"]["label"]) | set(dataset["test"]["label"]))
+    def split(test: bool):
+        return tokenized.filter(
+            lambda flags: [flag == test for flag in flags],
+            input_columns=SPLIT_COLUMN, batched=True, num_proc=num_proc,
+        ).remove_columns(SPLIT_COLUMN)
+
+    return DatasetDict(train=split(False), test=split(True)), labels, max_length
+
+
+def _grouped_by_length(tokenize, batch_size: int, seed: int = 42):
+    """Wrap ``tokenize`` so each mapped window of rows comes out in chunks of
+    ``batch_size`` rows of similar length, the chunks in random order."""
+    rng = random.Random(seed)
+
+    def grouped(batch):
+        enc = tokenize(batch)
+        order = sorted(range(len(enc["length"])), key=enc["length"].__getitem__)
+        chunks = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        rng.shuffle(chunks)
+        order = [i for chunk in chunks for i in chunk]
+        return {name: [values[i] for i in order] for name, values in enc.items()}
+
+    return grouped
+
+
+def stream_dataset(spec: TaskSpec, tokenizer, max_length: Optional[int] = None,
+                   dynamic_padding: bool = True, batch_size: Optional[int] = None):
+    """Return ``(splits, labels, max_length, scan)`` reading ``spec`` as a stream.
+
+    The file is read once by :func:`src.ingestion.scan` for the labels,
+    split sizes and a sample of lengths, then again lazily while
+    training: rows are split by hash, shuffled in a bounded buffer
+    (``config.TRAIN_SHUFFLE_BUFFER``) and tokenized as batches are drawn,
+    so memory does not grow with the dataset. With ``batch_size``, each
+    window of ``config.TRAIN_STREAM_GROUP_ROWS`` train rows is reordered
+    into batches of similar length.
+    """
+    rows = load_dataset(spec.data_format, data_files=str(spec.data_file), split="train",
+                        streaming=True)
+    found = ingestion.scan(rows, spec.texts, spec.label_column, spec.test_size,
+                           config.TRAIN_LENGTH_SAMPLE)
+    label2id = {l: i for i, l in enumerate(found.labels)}
+    if max_length is None:
+        max_length = _percentile_max_length(spec, tokenizer, found.sample)
+    tokenize = _tokenize_fn(spec, tokenizer, label2id, max_length, dynamic_padding)
+
+    def split(test: bool):
+        part = rows.filter(
+            lambda batch: [flag == test for flag in
+                           ingestion.split_flags(spec.texts(batch), spec.test_size)],
+            batched=True,
+        )
+        if test:
+            return part.map(tokenize, batched=True, remove_columns=found.columns)
+        part = part.shuffle(seed=42, buffer_size=config.TRAIN_SHUFFLE_BUFFER)
+        if not batch_size:
+            return part.map(tokenize, batched=True, remove_columns=found.columns)
+        return part.map(
+            _grouped_by_length(tokenize, batch_size), batched=True,
+            batch_size=config.TRAIN_STREAM_GROUP_ROWS, remove_columns=found.columns,
+        )
+
+    return {"train": split(False), "test": split(True)}, found.labels, max_length, found
+
+
+def prepare_dataset(
+    spec: TaskSpec,
+    tokenizer,
+    max_length: Optional[int] = None,
+    dynamic_padding: bool = True,
+    rebuild: bool = False,
+    cache_dir: Optional[Path] = None,
+):
+    """Return ``(tokenized, labels, max_length, cache_info)`` for ``spec``.
+
+    The tokenized train/test splits are saved as Arrow files under
+    ``config.TOKENIZED_CACHE_DIR`` (``None`` disables the cache), keyed by
+    :func:`cache_key`, and memory-mapped on the next run with the same
+    data, tokenizer and parameters. ``rebuild`` ignores an existing entry.
+    ``cache_info`` tells whether the cache was used (``"hit"``, ``"miss"``,
+    ``"rebuilt"`` or ``"disabled"``), the seconds spent and, on a hit, the
+    seconds saved compared with the run that built the entry.
+    """
+    if cache_dir is None:
+        cache_dir = config.TOKENIZED_CACHE_DIR
+    start = time.perf_counter()
+    if cache_dir is None:
+        tokenized, labels, max_length = _build_dataset(spec, tokenizer, max_length, dynamic_padding)
+        return tokenized, labels, max_length, {
+            "status": "disabled", "seconds": time.perf_counter() - start,
+        }
+
+    entry = Path(cache_dir) / cache_key(spec, tokenizer, max_length, dynamic_padding)
+    meta_file = entry / CACHE_META
+    if meta_file.is_file() and not rebuild:
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        tokenized = load_from_disk(str(entry / "dataset"))
+        seconds = time.perf_counter() - start
+        return tokenized, meta["labels"], meta["max_length"], {
+            "status": "hit",
+            "path": str(entry),
+            "seconds": seconds,
+            "saved_seconds": max(0.0, meta["build_seconds"] - seconds),
+        }
+
+    tokenized, labels, max_length = _build_dataset(spec, tokenizer, max_length, dynamic_padding)
+    build_seconds = time.perf_counter() - start
+    tmp = entry.with_name(f"{entry.name}.tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tokenized.save_to_disk(str(tmp / "dataset"))
+    (tmp / CACHE_META).write_text(json.dumps({
+        "task": spec.name,
+        "data_file": str(spec.data_file),
+        "labels": labels,
+        "max_length": max_length,
+        "build_seconds": build_seconds,
+        "created": time.time(),
+    }, ensure_ascii=False), encoding="utf-8")
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    # Later epochs and runs read the saved copy, memory-mapped
+    tokenized = load_from_disk(str(entry / "dataset"))
+    return tokenized, labels, max_length, {
+        "status": "rebuilt" if rebuild else "miss",
+        "path": str(entry),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _compute_metrics(eval_pred):
+    logits, labels = eval_pred
+    preds = logits.argmax(-1)
+    return {"accuracy": accuracy_score(labels, preds)}
+
+
+def train(
+    task: TaskSpec | str,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    stop_event=None,
+    *,
+    base_model: Optional[str] = None,
+    output_dir: Optional[Path] = None,
+    epochs: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_length: Optional[int] = None,
+    dynamic_padding: bool = True,
+    group_by_length: bool = True,
+    max_steps: Optional[int] = None,
+    save: bool = True,
+    rebuild_cache: bool = False,
+    streaming: Optional[bool] = None,
+    resume: bool = False,
+    patience: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Train the model of ``task`` and return its training metrics.
+
+    ``dynamic_padding=False`` and ``group_by_length=False`` restore the
+    former behaviour (every example padded to ``max_length``, random
+    batches) for comparison. The metrics include ``samples_per_second``,
+    the ``max_length`` used, ``padding_ratio``, the share of padding
+    tokens in the training batches, and ``cache``, how the tokenized
+    dataset was obtained (see :func:`prepare_dataset`).
+
+    ``streaming`` reads the data with :func:`stream_dataset` instead of
+    converting it to Arrow files; by default only data files of at least
+    ``config.TRAIN_STREAMING_MIN_BYTES`` are streamed.
+
+    ``resume=True`` continues from the last checkpoint of an interrupted
+    run, if any. ``patience`` overrides
+    ``config.TRAIN_EARLY_STOPPING_PATIENCE`` (0 disables early stopping).
+    Setting ``stop_event`` saves a checkpoint and stops; the model is then
+    not saved and ``stopped`` is true in the metrics.
+    """
+    spec = TASKS[task] if isinstance(task, str) else task
+    if not Path(spec.data_file).is_file():
+        raise FileNotFoundError(f"Dataset not found at {spec.data_file}")
+    base_model = base_model or config.BASE_MODEL
+    output_dir = Path(output_dir or spec.output_dir)
+    checkpoint_dir = output_dir / CHECKPOINT_DIR
+    batch_size = batch_size or config.TRAIN_BATCH_SIZE
+
+    epochs = epochs or spec.epochs or config.TRAIN_EPOCHS
+    if streaming is None:
+        streaming = Path(spec.data_file).stat().st_size >= config.TRAIN_STREAMING_MIN_BYTES
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(base_model)
+    dataloader_workers = 0
+    if streaming:
+        start = time.perf_counter()
+        tokenized, labels, max_length, found = stream_dataset(
+            spec, tokenizer, max_length, dynamic_padding,
+            batch_size=batch_size if group_by_length else None,
+        )
+        cache_info = {"status": "streaming", "seconds": time.perf_counter() - start}
+        rows = {"train": found.train_rows, "test": found.test_rows}
+        if max_steps is None:
+            max_steps = max(1, math.ceil(found.train_rows / batch_size)) * epochs
+        # Grouping is done in the stream; the length sampler needs random access
+        sampler_grouping = False
+        # One loader process per file shard at most
+        dataloader_workers = min(ingestion.num_workers(), tokenized["train"].n_shards)
+        if dataloader_workers < 2:
+            dataloader_workers = 0
+    else:
+        sampler_grouping = group_by_length
+        tokenized, labels, max_length, cache_info = prepare_dataset(
+            spec, tokenizer, max_length, dynamic_padding, rebuild=rebuild_cache
+        )
+        rows = {"train": len(tokenized["train"]), "test": len(tokenized["test"])}
     label2id = {l: i for i, l in enumerate(labels)}
     id2label = {i: l for l, i in label2id.items()}
 
-    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-multilingual-cased")
-
-    def tokenize(batch):
-        texts = [f"[QUESTION] {q} [HTML] {h}" for q, h in zip(batch["question"], batch["html"])]
-        enc = tokenizer(texts, truncation=True, padding="max_length", max_length=128)
-        enc["labels"] = [label2id[l] for l in batch["label"]]
-        return enc
-
-    tokenized = dataset.map(tokenize, batched=True, remove_columns=["question", "html", "label"])
-
+    # The base may be a trained classifier with another label set
     model = AutoModelForSequenceClassification.from_pretrained(
-        "distilbert-base-multilingual-cased",
-        num_labels=len(labels),
-        id2label=id2label,
-        label2id=label2id,
+        base_model, num_labels=len(labels), id2label=id2label, label2id=label2id,
+        ignore_mismatched_sizes=True,
     )
 
-    args = TrainingArguments(
-        output_dir=str(config.HTML_SELECTOR_MODEL_DIR),
-        num_train_epochs=3,
-        per_device_train_batch_size=config.TRAIN_BATCH_SIZE,
+    patience = config.TRAIN_EARLY_STOPPING_PATIENCE if patience is None else patience
+    evaluate = rows["test"] > 0
+    args = _training_arguments(
+        sampler_grouping,
+        output_dir=str(checkpoint_dir),
+        num_train_epochs=epochs,
+        max_steps=max_steps if max_steps is not None else -1,
+        per_device_train_batch_size=batch_size,
         learning_rate=config.LEARNING_RATE,
         logging_dir="logs",
         logging_steps=10,
-        save_steps=100,
-        save_total_limit=1,
+        save_strategy="steps",
+        save_steps=spec.save_steps,
+        eval_strategy="steps" if evaluate else "no",
+        eval_steps=spec.save_steps,
+        # The best checkpoint is kept besides the last one
+        save_total_limit=2,
+        load_best_model_at_end=evaluate,
+        metric_for_best_model=config.TRAIN_BEST_METRIC,
         do_train=True,
-        do_eval=True,
+        do_eval=evaluate,
+        length_column_name="length",
+        dataloader_num_workers=dataloader_workers,
     )
 
-    def compute_metrics(eval_pred):
-        logits, labels = eval_pred
-        preds = logits.argmax(-1)
-        acc = accuracy_score(labels, preds)
-        return {"accuracy": acc}
-
     callbacks = []
-    if progress_cb:
+    if progress_cb or stop_event:
         callbacks.append(ProgressCallback(progress_cb, stop_event))
+    early_stopping = None
+    if evaluate and patience:
+        early_stopping = EarlyStoppingCallback(
+            early_stopping_patience=patience,
+            early_stopping_threshold=config.TRAIN_EARLY_STOPPING_THRESHOLD,
+        )
+        callbacks.append(early_stopping)
 
     trainer = Trainer(
         model=model,
         args=args,
         train_dataset=tokenized["train"],
         eval_dataset=tokenized["test"],
-        tokenizer=tokenizer,
-        compute_metrics=compute_metrics,
+        data_collator=DataCollatorWithPadding(tokenizer) if dynamic_padding else None,
+        compute_metrics=_compute_metrics,
         callbacks=callbacks,
+        **_supported(Trainer, {"processing_class": tokenizer, "tokenizer": tokenizer}),
     )
 
-    trainer.train()
-    trainer.save_model(args.output_dir)
-    tokenizer.save_pretrained(args.output_dir)
-
-
-def train_html_only_selector(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
-                             stop_event=None) -> None:
-    """Train a model to predict CSS selector from HTML only."""
-    data_path = config.HTML_ONLY_SELECTOR_FILE
-    if not data_path.is_file():
-        raise FileNotFoundError(f"Dataset not found at {data_path}")
-    dataset = load_dataset("csv", data_files=str(data_path))
-    dataset = dataset["train"].train_test_split(test_size=0.1, seed=42)
-
-    labels = sorted(set(dataset["train"]["selector"]) | set(dataset["test"]["selector"]))
-    label2id = {l: i for i, l in enumerate(labels)}
-    id2label = {i: l for l, i in label2id.items()}
-
-    tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-multilingual-cased")
-
-    def tokenize(batch):
-        enc = tokenizer(batch["html"], truncation=True, padding="max_length", max_length=128)
-        enc["labels"] = [label2id[s] for s in batch["selector"]]
-        return enc
+    last_checkpoint = None
+    if resume and checkpoint_dir.is_dir():
+        last_checkpoint = get_last_checkpoint(str(checkpoint_dir))
+    elif not resume:
+        # A fresh start: checkpoints of an older run must not be resumed later
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    result = trainer.train(resume_from_checkpoint=last_checkpoint)
+    stopped = bool(stop_event and stop_event.is_set())
+    state = trainer.state
+    if save and not stopped:
+        trainer.save_model(str(output_dir))
+        # Inference truncates at model_max_length, like training did
+        tokenizer.model_max_length = max_length
+        tokenizer.save_pretrained(str(output_dir))
+        # The saved model is the best checkpoint; the rest only served resuming
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    return {
+        "task": spec.name,
+        "max_length": max_length,
+        "samples_per_second": result.metrics.get("train_samples_per_second"),
+        "runtime": result.metrics.get("train_runtime"),
+        "loss": result.metrics.get("train_loss"),
+        "padding_ratio": _padding_ratio(trainer),
+        "dynamic_padding": dynamic_padding,
+        "group_by_length": group_by_length,
+        "streaming": streaming,
+        "rows": rows,
+        "cache": cache_info,
+        "steps": state.global_step,
+        "resumed_from": last_checkpoint,
+        "stopped": stopped,
+        "early_stopped": bool(
+            early_stopping and early_stopping.early_stopping_patience_counter >= patience
+        ),
+        "best_metric": state.best_metric,
+        "best_step": _checkpoint_step(state.best_model_checkpoint),
+    }
+
+
+def _checkpoint_step(path: Optional[str]) -> Optional[int]:
+    return int(path.rsplit("-", 1)[1]) if path else None
+
+
+def _padding_ratio(trainer: Trainer, max_batches: int = 50) -> float:
+    """Return the share of padding tokens in the first training batches."""
+    total = real = 0
+    for i, batch in enumerate(trainer.get_train_dataloader()):
+        if i >= max_batches:
+            break
+        mask = batch["attention_mask"]
+        total += mask.numel()
+        real += int(mask.sum())
+    return 1 - real / total if total else 0.0
 
-    tokenized = dataset.map(tokenize, batched=True, remove_columns=["html", "selector"])
 
-    model = AutoModelForSequenceClassification.from_pretrained(
-        "distilbert-base-multilingual-cased",
-        num_labels=len(labels),
-        id2label=id2label,
-        label2id=label2id,
-    )
-
-    args = TrainingArguments(
-        output_dir=str(config.HTML_ONLY_SELECTOR_MODEL_DIR),
-        num_train_epochs=3,
-        per_device_train_batch_size=config.TRAIN_BATCH_SIZE,
-        learning_rate=config.LEARNING_RATE,
-        logging_dir="logs",
-        logging_steps=10,
-        save_steps=100,
-        save_total_limit=1,
-        do_train=True,
-        do_eval=True,
-    )
+def train_classifier(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     stop_event=None, resume: bool = False) -> Dict[str, Any]:
+    """Train the intent classifier."""
+    return train("classifier", progress_cb, stop_event, resume=resume)
 
-    def compute_metrics(eval_pred):
-        logits, labels = eval_pred
-        preds = logits.argmax(-1)
-        acc = accuracy_score(labels, preds)
-        return {"accuracy": acc}
 
-    callbacks = []
-    if progress_cb:
-        callbacks.append(ProgressCallback(progress_cb, stop_event))
+def train_html_selector(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        stop_event=None, resume: bool = False) -> Dict[str, Any]:
+    """Train the HTML selector model."""
+    return train("html_selector", progress_cb, stop_event, resume=resume)
 
-    trainer = Trainer(
-        model=model,
-        args=args,
-        train_dataset=tokenized["train"],
-        eval_dataset=tokenized["test"],
-        tokenizer=tokenizer,
-        compute_metrics=compute_metrics,
-        callbacks=callbacks,
-    )
 
-    trainer.train()
-    trainer.save_model(args.output_dir)
-    tokenizer.save_pretrained(args.output_dir)
+def train_html_only_selector(progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+                             stop_event=None, resume: bool = False) -> Dict[str, Any]:
+    """Train a model to predict CSS selector from HTML only."""
+    return train("html_only_selector", progress_cb, stop_event, resume=resume)
@@ -0,0 +1,213 @@
+"""Bounded-memory element ranking for very large HTML files.
+
+The page is fed in chunks to an incremental :class:`html.parser.HTMLParser`
+and every element is scored when its end tag closes, using the same
+statistics :func:`detect_selector.annotate_tree` computes on a full tree.
+Only the open elements and a top-k heap of candidates (with their ancestor
+chains, needed to build selectors) stay in memory, so peak memory depends
+on nesting depth and ``limit`` rather than on page size.
+
+Closed elements are :class:`StreamNode` objects exposing the small part of
+the BeautifulSoup ``Tag`` API the engines use (``name``, ``parent``,
+``get`` and item access), so their ``compute_score`` and
+``build_selector`` functions work on them unchanged.
+"""
+
+import heapq
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, TextIO
+
+from detect_selector import NodeStats
+
+# Elements closed as soon as they open
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+# Text inside these is not part of the surrounding element's text
+STRING_CONTAINERS = {"script", "style", "template", "rt", "rp"}
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class StreamNode:
+    """A parsed element, shaped like a BeautifulSoup tag."""
+
+    __slots__ = ("name", "attrs", "parent", "index")
+
+    def __init__(self, name: str, attrs: Dict[str, object], parent=None, index: int = -1):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.index = index
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def __repr__(self) -> str:
+        return f"<StreamNode {self.name} {self.attrs}>"
+
+
+class _TopK:
+    """Keep the ``limit`` best nodes, one per selector."""
+
+    def __init__(self, limit: int, build: Callable):
+        self.limit = limit
+        self.build = build
+        self.heap: List[tuple] = []
+        self.by_selector: Dict[str, tuple] = {}
+
+    def offer(self, key: tuple, node: StreamNode) -> None:
+        if len(self.heap) >= self.limit and key <= self.heap[0][0]:
+            return
+        selector = self.build(node)
+        current = self.by_selector.get(selector)
+        if current is not None:
+            if key <= current[0]:
+                return
+            self.heap.remove(current)
+            heapq.heapify(self.heap)
+        entry = (key, selector, node)
+        self.by_selector[selector] = entry
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > self.limit:
+            _, dropped, _ = heapq.heappop(self.heap)
+            del self.by_selector[dropped]
+
+    def best(self) -> List[StreamNode]:
+        return [node for _, _, node in sorted(self.heap, key=lambda e: e[0], reverse=True)]
+
+
+class _StreamingParser(HTMLParser):
+    """Feed events into per-element statistics and report closed elements."""
+
+    def __init__(self, on_close: Callable[[StreamNode, NodeStats], None]):
+        super().__init__(convert_charrefs=True)
+        self.on_close = on_close
+        self.root = StreamNode("[document]", {})
+        # Open elements as (node, stats), the document at the bottom
+        self.stack = [(self.root, NodeStats(depth=-1))]
+        self.containers = 0
+        self.count = 0
+        self.text: List[str] = []
+
+    def _flush_text(self) -> None:
+        """Account buffered text as one string, like BeautifulSoup does."""
+        if not self.text:
+            return
+        length = len("".join(self.text).strip())
+        self.text = []
+        if not length:
+            return
+        if self.containers:
+            for node, stats in reversed(self.stack):
+                if node.name in STRING_CONTAINERS:
+                    stats.text_length += length
+                    break
+        else:
+            self.stack[-1][1].text_length += length
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        values: Dict[str, object] = {}
+        for key, value in attrs:
+            values[key] = "" if value is None else value
+        if "class" in values:
+            values["class"] = values["class"].split()
+        parent, parent_stats = self.stack[-1]
+        node = StreamNode(tag, values, parent, self.count)
+        self.count += 1
+        self.stack.append((node, NodeStats(depth=parent_stats.depth + 1)))
+        if tag in STRING_CONTAINERS:
+            self.containers += 1
+        if tag in VOID_ELEMENTS:
+            self._close()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self._close()
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        for pos in range(len(self.stack) - 1, 0, -1):
+            if self.stack[pos][0].name == tag:
+                while len(self.stack) > pos:
+                    self._close()
+                return
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_decl(self, decl):
+        self._flush_text()
+
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def _close(self) -> None:
+        self._flush_text()
+        node, stats = self.stack.pop()
+        parent_stats = self.stack[-1][1]
+        if node.name in STRING_CONTAINERS:
+            self.containers -= 1
+        else:
+            parent_stats.text_length += stats.text_length
+        parent_stats.descendants += stats.descendants + 1
+        parent_stats.anchors += stats.anchors
+        if node.name == "a":
+            parent_stats.anchors += 1
+            if parent_stats.first_anchor is None:
+                parent_stats.first_anchor = node
+        elif parent_stats.first_anchor is None and stats.first_anchor is not None:
+            parent_stats.first_anchor = stats.first_anchor
+        self.on_close(node, stats)
+
+    def close(self):
+        super().close()
+        while len(self.stack) > 1:
+            self._close()
+
+
+def stream_best_elements(
+    source: TextIO,
+    score: Callable[[StreamNode, NodeStats], int],
+    build: Callable[[StreamNode], str],
+    limit: int = 3,
+    keep: Optional[Callable[[str], bool]] = None,
+    refine: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[StreamNode]:
+    """Return the ``limit`` best elements of the HTML read from ``source``.
+
+    ``score`` rates an element from its node and statistics, ``build``
+    turns a node into the selector used to drop duplicates and ``keep``
+    filters elements by tag name. With ``refine`` an element containing a
+    single link is replaced by that link. Ties keep the element that opens
+    first, as a stable sort over the full tree would.
+    """
+    top = _TopK(limit, build)
+
+    def on_close(node: StreamNode, stats: NodeStats) -> None:
+        if keep is not None and not keep(node.name):
+            return
+        candidate = node
+        if refine and stats.anchors == 1:
+            candidate = stats.first_anchor
+        top.offer((score(node, stats), -node.index), candidate)
+
+    parser = _StreamingParser(on_close)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    parser.close()
+    return top.best()
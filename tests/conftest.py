@@ -0,0 +1,69 @@
+import inspect
+from pathlib import Path
+import string
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+
+def _tokenizer(cls, vocab_file: Path, vocab):
+    # transformers 5 ignores vocab_file and takes the vocabulary itself
+    if "vocab_file" in inspect.signature(cls.__init__).parameters:
+        return cls(vocab_file=str(vocab_file))
+    return cls(vocab={token: i for i, token in enumerate(vocab)})
+
+
+def _build_tiny_model(path: Path, labels, seed: int = 0) -> Path:
+    """Save a tiny DistilBERT classifier and tokenizer in ``path``."""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    path.mkdir(parents=True, exist_ok=True)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab += list(string.ascii_letters + string.digits + string.punctuation)
+    vocab += ["##" + c for c in string.ascii_letters + string.digits]
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(vocab), encoding="utf-8")
+    tokenizer = _tokenizer(transformers.DistilBertTokenizerFast, vocab_file, vocab)
+    torch.manual_seed(seed)
+    cfg = transformers.DistilBertConfig(
+        vocab_size=len(vocab),
+        dim=16,
+        n_layers=1,
+        n_heads=2,
+        hidden_dim=32,
+        max_position_embeddings=128,
+        num_labels=len(labels),
+        id2label=dict(enumerate(labels)),
+        label2id={label: i for i, label in enumerate(labels)},
+    )
+    model = transformers.DistilBertForSequenceClassification(cfg)
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+@pytest.fixture
+def tiny_model_factory(tmp_path):
+    """Return a function creating tiny model directories under ``tmp_path``."""
+
+    def factory(name="model", labels=("a", "#main", ".title"), seed=0):
+        return _build_tiny_model(tmp_path / name, list(labels), seed)
+
+    return factory
+
+
+@pytest.fixture
+def tokenizer_factory(tmp_path):
+    """Return a function building a WordPiece tokenizer from a token list."""
+    transformers = pytest.importorskip("transformers")
+
+    def factory(vocab):
+        vocab_file = tmp_path / "vocab.txt"
+        vocab_file.write_text("\n".join(vocab), encoding="utf-8")
+        return _tokenizer(transformers.DistilBertTokenizerFast, vocab_file, vocab)
+
+    return factory
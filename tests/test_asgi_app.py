@@ -0,0 +1,205 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import asgi_app
+import config
+import selector_service
+from css_selector_generator import generate_selector
+
+CARD = "<div class='card'><h2 class='title'>Titre</h2><span class='price'>9 €</span></div>"
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    monkeypatch.setattr(selector_service, "ajouter_interaction", lambda *a, **k: None)
+
+
+def make_app(**kwargs):
+    kwargs.setdefault("warmup", False)
+    return asgi_app.SelectorApp(**kwargs)
+
+
+async def call(app, method, path, payload=None, headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    received = False
+    messages = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": list(headers)}
+    await app(scope, receive, send)
+    data = b"".join(m.get("body", b"") for m in messages[1:])
+    return messages[0]["status"], data, messages
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_json_batch():
+    status, data, _ = run(call(make_app(), "POST", "/api/v1/selectors",
+                               {"items": [CARD, {"html": "<p class='x'>a</p>"}]}))
+    assert status == 200
+    body = json.loads(data)
+    assert [r["selector"] for r in body["results"]] == [
+        generate_selector(CARD), generate_selector("<p class='x'>a</p>")
+    ]
+    assert body["timings"]["total_ms"] >= 0
+
+
+def test_stream_ndjson(monkeypatch):
+    monkeypatch.setattr(config, "ASGI_STREAM_CHUNK", 16)
+    items = [f"<div class='c{i}'><span class='t'>{i}</span></div>" for i in range(40)]
+    status, data, messages = run(call(make_app(), "POST", "/api/v1/selectors/stream",
+                                      {"items": items}))
+    assert status == 200
+    assert dict(messages[0]["headers"])[b"content-type"] == b"application/x-ndjson"
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert [line["index"] for line in lines] == list(range(40))
+    assert lines[7]["selector"] == generate_selector(items[7])
+    # three chunks, then the end of the body
+    assert len(messages) == 1 + 3 + 1
+
+
+def test_errors():
+    app = make_app()
+    assert run(call(app, "POST", "/api/v1/selectors", {"items": 1}))[0] == 400
+    assert run(call(app, "GET", "/api/v1/selectors"))[0] == 405
+    assert run(call(app, "GET", "/nope"))[0] == 404
+
+
+@pytest.fixture
+def blocking(monkeypatch):
+    """Make select_batch wait until the returned event is set."""
+    release = threading.Event()
+
+    def slow(htmls, questions, engine, top_k):
+        release.wait(5)
+        return [{"selector": "p"} for _ in htmls]
+
+    monkeypatch.setattr(asgi_app, "select_batch", slow)
+    yield release
+    release.set()
+
+
+def test_full_queue_gets_429(blocking):
+    app = make_app(route_limits={"/api/v1/selectors": (1, 0), "/api/v1/selectors/stream": (1, 0)})
+
+    async def scenario():
+        first = asyncio.create_task(call(app, "POST", "/api/v1/selectors", {"items": [CARD]}))
+        while app.limiters["/api/v1/selectors"].active == 0:
+            await asyncio.sleep(0.01)
+        status, _, messages = await call(app, "POST", "/api/v1/selectors", {"items": [CARD]})
+        blocking.set()
+        return status, dict(messages[0]["headers"]), (await first)[0]
+
+    status, headers, first_status = run(scenario())
+    assert status == 429 and headers[b"retry-after"] == b"1"
+    assert first_status == 200
+    assert app.limiters["/api/v1/selectors"].queue_full == 1
+
+
+def test_full_queue_rejects_before_reading_the_body(blocking):
+    app = make_app(route_limits={"/api/v1/selectors": (1, 0), "/api/v1/selectors/stream": (1, 0)})
+    reads = []
+
+    async def receive():
+        reads.append(1)
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def scenario():
+        first = asyncio.create_task(call(app, "POST", "/api/v1/selectors", {"items": [CARD]}))
+        while app.limiters["/api/v1/selectors"].active == 0:
+            await asyncio.sleep(0.01)
+        scope = {"type": "http", "method": "POST", "path": "/api/v1/selectors", "headers": []}
+        await app(scope, receive, send)
+        blocking.set()
+        await first
+
+    messages = []
+    run(scenario())
+    assert messages[0]["status"] == 429 and reads == []
+
+
+def test_body_cap_per_route(monkeypatch):
+    monkeypatch.setattr(config, "ASGI_SELECTORS_MAX_BODY_BYTES", 100)
+    app = make_app()
+    payload = {"items": [CARD] * 2}
+    assert run(call(app, "POST", "/api/v1/selectors", payload))[0] == 413
+    assert run(call(app, "POST", "/api/v1/selectors/stream", payload))[0] == 200
+    assert app.limiters["/api/v1/selectors"].active == 0
+
+
+def test_deadline_while_queued_gets_503(blocking):
+    app = make_app(route_limits={"/api/v1/selectors": (1, 1), "/api/v1/selectors/stream": (1, 1)})
+
+    async def scenario():
+        first = asyncio.create_task(call(app, "POST", "/api/v1/selectors", {"items": [CARD]}))
+        while app.limiters["/api/v1/selectors"].active == 0:
+            await asyncio.sleep(0.01)
+        result = await call(app, "POST", "/api/v1/selectors", {"items": [CARD]},
+                            [(b"x-request-timeout", b"0.1")])
+        blocking.set()
+        await first
+        return result[0]
+
+    assert run(scenario()) == 503
+
+
+def test_deadline_while_computing_gets_504(blocking):
+    app = make_app()
+    started = time.perf_counter()
+    status = run(call(app, "POST", "/api/v1/selectors", {"items": [CARD]},
+                      [(b"x-request-timeout", b"0.1")]))[0]
+    assert status == 504 and time.perf_counter() - started < 2
+
+
+def test_stream_reports_deadline_per_item(blocking, monkeypatch):
+    monkeypatch.setattr(config, "ASGI_STREAM_CHUNK", 2)
+    status, data, _ = run(call(make_app(), "POST", "/api/v1/selectors/stream",
+                               {"items": [CARD] * 4}, [(b"x-request-timeout", b"0.1")]))
+    assert status == 200
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+    assert all(line["error_type"] == "TimeoutError" for line in lines)
+
+
+def test_lifespan_and_readiness():
+    app = make_app()
+
+    async def scenario():
+        queue = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+
+        lifespan = asyncio.create_task(app({"type": "lifespan"}, queue.get, send))
+        before = (await call(app, "GET", "/readyz"))[0]
+        await queue.put({"type": "lifespan.startup"})
+        while not sent:
+            await asyncio.sleep(0.01)
+        after = (await call(app, "GET", "/readyz"))[0]
+        await queue.put({"type": "lifespan.shutdown"})
+        await lifespan
+        return before, after, sent
+
+    before, after, sent = run(scenario())
+    assert (before, after) == (503, 200)
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert not app.ready
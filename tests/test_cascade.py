@@ -0,0 +1,73 @@
+import math
+
+from cascade import Cascade, heuristic_candidates, softmax
+from css_selector_generator import generate_selector
+
+CONFIDENT = "<div><section id='main'><p>texte</p></section><span>x</span></div>"
+TIED = "<ul><li>a</li><li>b</li></ul><ol><li>c</li></ol>"
+
+
+def test_softmax():
+    probs = softmax([3.0, 1.0, 1.0])
+    assert math.isclose(sum(probs), 1.0)
+    assert probs[0] > probs[1] == probs[2]
+    assert softmax([]) == []
+
+
+def test_first_candidate_is_generate_selector():
+    for html in (CONFIDENT, TIED, "<a href='/'>x</a>"):
+        assert heuristic_candidates(html)[0][0] == generate_selector(html)
+
+
+def test_confident_heuristic_is_not_routed():
+    cascade = Cascade(threshold=2.0, k=2)
+    result = cascade.predict(CONFIDENT)
+    assert result.stage == "heuristic"
+    assert result.selector == "#main"
+    assert len(result.selectors) == 2
+    assert math.isclose(sum(p for _, p in result.selectors), 1.0)
+    assert cascade.stats()["routing_rate"] == 0.0
+
+
+def test_low_margin_routes_to_model(tiny_model_factory, monkeypatch):
+    from src import html_only_predictor as hp
+    from src.model_registry import registry
+
+    monkeypatch.setitem(registry.paths, hp.MODEL_NAME, tiny_model_factory(labels=("a", "li", ".y", "ul")))
+    registry.unload(hp.MODEL_NAME)
+    cascade = Cascade(threshold=100.0, k=3)
+    try:
+        result = cascade.predict(TIED)
+    finally:
+        registry.unload(hp.MODEL_NAME)
+    assert result.stage == "model"
+    assert len(result.selectors) == 3
+    assert {s for s, _ in result.selectors} <= {"a", "li", ".y", "ul"}
+    stats = cascade.stats()
+    assert stats["routed"] == 1 and stats["model"]["calls"] == 1
+    assert [row["routing_rate"] for row in cascade.sweep([0.0, 100.0])] == [0.0, 1.0]
+
+
+def test_missing_model_falls_back_to_heuristic(tmp_path, monkeypatch):
+    from src import html_only_predictor as hp
+    from src.model_registry import registry
+
+    monkeypatch.setitem(registry.paths, hp.MODEL_NAME, tmp_path / "missing")
+    registry.unload(hp.MODEL_NAME)
+    cascade = Cascade(threshold=100.0)
+    result = cascade.predict(TIED)
+    assert result.stage == "heuristic"
+    assert result.selector == generate_selector(TIED)
+    assert cascade.stats()["fallbacks"] == 1
+
+
+def test_defaults_read_from_config_when_built(monkeypatch):
+    import cascade
+    import config
+
+    monkeypatch.setattr(config, "CASCADE_MARGIN", 7.5)
+    monkeypatch.setattr(config, "CASCADE_TOP_K", 5)
+    monkeypatch.setattr(cascade, "_default", None)
+    built = cascade.get_cascade()
+    assert (built.threshold, built.k) == (7.5, 5)
+    assert Cascade(threshold=0.0).threshold == 0.0
@@ -5,7 +5,17 @@ from bs4 import BeautifulSoup
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
 
-from css_selector_generator import is_dynamic_id, build_selector
+from css_selector_generator import (
+    POSITIVE_KEYWORDS,
+    build_selector,
+    clear_token_cache,
+    generate_selector,
+    generate_selectors,
+    has_keyword,
+    is_dynamic_id,
+    iter_html_sources,
+    token_cache_info,
+)
 
 
 def test_is_dynamic_id():
@@ -18,3 +28,52 @@ def test_build_selector_with_id():
     soup = BeautifulSoup(html, "html.parser")
     selector = build_selector(soup.div)
     assert selector == "#main"
+
+
+def test_generate_selectors_matches_single_calls():
+    snippets = ["<div id='main'><span>Text</span></div>", "<p class='intro'>Hi</p>"] * 20
+    expected = [generate_selector(h) for h in snippets]
+    ordered = [sel for _, sel in generate_selectors(snippets, workers=2, chunksize=4)]
+    assert ordered == expected
+    unordered = dict(generate_selectors(snippets, workers=2, ordered=False))
+    assert [unordered[i] for i in range(len(snippets))] == expected
+
+
+def test_generate_selectors_reads_input_by_window():
+    read = []
+
+    def snippets():
+        for i in range(100):
+            read.append(i)
+            yield f"<p class='c{i}'>x</p>"
+
+    results = generate_selectors(snippets(), workers=2, chunksize=2, window=10)
+    assert next(results) == (0, "p.c0")
+    assert len(read) == 10
+    assert [i for i, _ in results] == list(range(1, 100))
+
+
+def test_iter_html_sources(tmp_path):
+    (tmp_path / "a.html").write_text("<p>a</p>", encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("ignored", encoding="utf-8")
+    jsonl = tmp_path / "snippets.jsonl"
+    jsonl.write_text('{"html": "<b>x</b>"}\n', encoding="utf-8")
+    assert [h for _, h in iter_html_sources(str(tmp_path))] == ["<p>a</p>"]
+    assert list(iter_html_sources(str(jsonl))) == [(f"{jsonl}:1", "<b>x</b>")]
+    assert [h for _, h in iter_html_sources(str(tmp_path / "*.html"))] == ["<p>a</p>"]
+
+
+def test_has_keyword_matches_linear_scan():
+    for value in ["ProductTitle", "nav-bar", "price", "CARD", "x", "descr", ""]:
+        expected = any(k in value.lower() for k in POSITIVE_KEYWORDS)
+        assert has_keyword(value) == expected
+
+
+def test_token_cache_info_counts_hits():
+    clear_token_cache()
+    html = "<ul class='list'>" + "<li class='item row'>x</li>" * 10 + "</ul>"
+    generate_selector(html)
+    info = token_cache_info()["is_generic"]
+    assert info["misses"] == 3
+    assert info["hits"] > 0
+    assert 0 < info["hit_rate"] < 1
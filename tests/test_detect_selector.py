@@ -0,0 +1,30 @@
+from pathlib import Path
+import sys
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from detect_selector import annotate_tree, choose_best_elements, node_stats
+
+
+HTML = (
+    "<div class='card'><h2 class='title'>  Produit  </h2>"
+    "<p>Une description <b>assez</b> longue du produit.</p>"
+    "<script>var x = 1;</script><!-- commentaire -->"
+    "<ul class='nav'><li><a href='/a'>A</a></li><li>B</li></ul>"
+    "<template><p>cache</p></template></div><span id='solo'>x</span>"
+)
+
+
+def test_annotate_tree_matches_node_stats():
+    soup = BeautifulSoup(HTML, "html.parser")
+    annotations = annotate_tree(soup)
+    for tag in soup.find_all(True):
+        assert annotations[id(tag)] == node_stats(tag)
+
+
+def test_choose_best_elements_uses_single_anchor():
+    soup = BeautifulSoup(HTML, "html.parser")
+    names = [el.name for el in choose_best_elements(soup, limit=5)]
+    assert "a" in names
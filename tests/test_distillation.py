@@ -0,0 +1,72 @@
+import csv
+import dataclasses
+
+import pytest
+
+pytest.importorskip("accelerate")
+
+from src import distillation, training
+from src.model_registry import ModelRegistry
+
+
+def test_pruned_vocab_keeps_tokenization(tokenizer_factory):
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "hello", "world", "##s", "unused",
+             "ж", "h", "e", "##l", "##o"]
+    teacher = tokenizer_factory(vocab)
+    texts = ["hello worlds", "hell"]
+    kept = distillation.pruned_vocab(teacher, texts)
+    tokens = set(teacher.convert_ids_to_tokens(kept))
+    assert {"[PAD]", "[UNK]", "hello", "world", "##s", "h", "##l"} <= tokens
+    assert "unused" not in tokens and "ж" not in tokens
+
+    student = distillation.student_tokenizer(teacher, kept)
+    assert student.vocab_size == len(kept)
+    for text in texts:
+        assert (student.convert_ids_to_tokens(student(text)["input_ids"])
+                == teacher.convert_ids_to_tokens(teacher(text)["input_ids"]))
+
+
+def test_distillation_loss():
+    import torch
+    import torch.nn.functional as F
+
+    student = torch.tensor([[2.0, 0.0, -1.0]])
+    labels = torch.tensor([0])
+    assert torch.isclose(distillation.distillation_loss(student, student, labels, 2.0, 0.0),
+                         F.cross_entropy(student, labels))
+    assert distillation.distillation_loss(student, student, labels, 2.0, 1.0).abs() < 1e-6
+
+
+def test_distill(tmp_path, tiny_model_factory, monkeypatch):
+    data = tmp_path / "data.csv"
+    with data.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["html", "selector"])
+        for i in range(40):
+            writer.writerow([f"<div id='d{i % 3}'>{'<b>x</b>' * (i % 5)}</div>", f"#d{i % 3}"])
+    teacher = tiny_model_factory("teacher", labels=("#d0", "#d1", "#d2"))
+    spec = dataclasses.replace(training.TASKS["html_only_selector"], data_file=data,
+                               output_dir=teacher)
+    pruned = distillation.pruned_vocab
+    seen = []
+    monkeypatch.setattr(distillation, "pruned_vocab",
+                        lambda tok, texts: seen.extend(texts) or pruned(tok, texts))
+    result = distillation.distill(spec, layers=1, dim=8, hidden_dim=16, heads=2,
+                                  max_steps=2, batch_size=4)
+    # The vocabulary is pruned on the training split only
+    assert seen and not set(seen) & set(result["test"][0])
+    student_dir = result["output_dir"]
+    assert student_dir == tmp_path / "teacher_student"
+    assert not (student_dir / "checkpoints").exists()
+
+    student = ModelRegistry({"s": student_dir}).get("s")
+    assert student.id2label == {0: "#d0", 1: "#d1", 2: "#d2"}
+    assert student.model.config.n_layers == 1 and student.model.config.dim == 8
+
+    texts, labels = result["test"]
+    rows = distillation.compare({"teacher": teacher, "student": student_dir}, texts, labels, calls=3)
+    assert [row["model"] for row in rows] == ["teacher", "student"]
+    assert rows[1]["params"] < rows[0]["params"]
+    assert rows[1]["size_bytes"] < rows[0]["size_bytes"]
+    assert rows[0]["agreement"] == 1.0
+    assert 0 <= rows[1]["accuracy"] <= 1 and rows[1]["latency_ms"] > 0
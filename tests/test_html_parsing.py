@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+import detect_selector
+from css_selector_generator import generate_selector
+from html_parsing import available_backends, make_soup, resolve_backend
+
+
+def _snippets(per_file=500):
+    for name in ("html_blocks.jsonl", "dataset.jsonl"):
+        with open(ROOT / "data" / name, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if i >= per_file:
+                    break
+                yield json.loads(line)["html"]
+
+
+SNIPPETS = list(dict.fromkeys(_snippets()))
+
+
+def _detect(html, backend):
+    soup = make_soup(html, backend)
+    return [detect_selector.build_selector(el) for el in detect_selector.choose_best_elements(soup)]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_backends_choose_same_selectors(backend):
+    for html in SNIPPETS:
+        assert generate_selector(html, backend) == generate_selector(html, "html.parser"), html
+        assert _detect(html, backend) == _detect(html, "html.parser"), html
+
+
+def test_resolve_backend():
+    assert resolve_backend("html.parser") == "html.parser"
+    assert resolve_backend("auto") in available_backends()
+    with pytest.raises(ValueError):
+        resolve_backend("html5lib")
@@ -0,0 +1,125 @@
+import csv
+import dataclasses
+import json
+
+import pytest
+
+pytest.importorskip("accelerate")
+
+import config
+from src import incremental, memoire_generale, training
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "TOKENIZED_CACHE_DIR", tmp_path / "cache")
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(memoire_generale, "BASE_DIR", tmp_path)
+
+    def log(rows):
+        for html, selector in rows:
+            incremental.record_label(html, selector)
+        memoire_generale.flush_interactions()
+
+    return log
+
+
+@pytest.fixture
+def html_task(tmp_path):
+    data = tmp_path / "data.csv"
+    with data.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["html", "selector"])
+        for i in range(20):
+            writer.writerow([f"<div id='d{i % 2}'>{'<b>x</b>' * i}</div>", f"#d{i % 2}"])
+    return dataclasses.replace(
+        training.TASKS["html_only_selector"], data_file=data, output_dir=tmp_path / "model"
+    )
+
+
+def test_grow_label_map_keeps_known_labels(tiny_model_factory):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    model = AutoModelForSequenceClassification.from_pretrained(
+        tiny_model_factory("m", labels=("a", "b"))
+    )
+    weight = model.classifier.weight.detach().clone()
+    assert incremental.grow_label_map(model, ["b", "c", "a", "c"]) == ["c"]
+    assert model.config.label2id == {"a": 0, "b": 1, "c": 2}
+    assert model.config.id2label[2] == "c"
+    assert model.classifier.out_features == 3
+    assert torch.equal(model.classifier.weight[:2], weight)
+    assert incremental.grow_label_map(model, ["a"]) == []
+    assert model(input_ids=torch.tensor([[1, 2]])).logits.shape == (1, 3)
+
+
+def test_replay_sample():
+    assert incremental.replay_sample(range(3), 5) == [0, 1, 2]
+    sample = incremental.replay_sample(range(1000), 10)
+    assert len(sample) == 10 and len(set(sample)) == 10
+
+
+def test_incremental_round(html_task, history, tiny_model_factory):
+    from transformers import AutoConfig
+
+    training.train(html_task, base_model=str(tiny_model_factory("base", labels=("x",))),
+                   max_steps=1, batch_size=4)
+    model_dir = html_task.output_dir
+    history([(f"<p class='n{i}'>new</p>", ".n" + str(i % 3)) for i in range(12)]
+            + [("<p>question-less only</p>", "#d0")])
+    # The model's own answers are not labels
+    memoire_generale.ajouter_interaction("prediction", {"html": "<p>x</p>", "reponse": ".own"})
+    memoire_generale.flush_interactions()
+
+    summary = incremental.train_incremental(html_task, max_steps=2, batch_size=4)
+    assert summary["status"] == "trained"
+    assert summary["new_rows"] == 13 and summary["replay_rows"] == 13
+    # All new rows are trained on; only replayed rows are held out
+    assert 13 <= summary["train_rows"] < 26
+    assert set(summary["accuracy"]) == set(summary["accuracy_before"]) == {"new", "replay"}
+    assert summary["added_labels"] == 3
+    label2id = AutoConfig.from_pretrained(model_dir).label2id
+    assert label2id["#d0"] == 0 and label2id["#d1"] == 1 and set(label2id) >= {".n0", ".n1", ".n2"}
+    assert (model_dir.parent / "model.prev").is_dir()
+
+    state = json.loads((model_dir / incremental.STATE_FILE).read_text(encoding="utf-8"))
+    assert state["last_timestamp"] == summary["until"] and len(state["rounds"]) == 1
+    assert incremental.train_incremental(html_task, max_steps=2)["status"] == "up to date"
+
+    # The next round only sees what was logged after the first one
+    history([("<p class='late'>new</p>", ".late")])
+    summary = incremental.train_incremental(html_task, max_steps=1, batch_size=4)
+    assert summary["new_rows"] == 1 and summary["added_labels"] == 1
+
+
+def test_stopped_round_keeps_model_and_state(html_task, history, tiny_model_factory):
+    import threading
+
+    training.train(html_task, base_model=str(tiny_model_factory("base", labels=("x",))),
+                   max_steps=1, batch_size=4)
+    model_dir = html_task.output_dir
+    before = sorted(p.name for p in model_dir.iterdir())
+    history([(f"<p class='s{i}'>new</p>", ".s") for i in range(8)])
+    stop = threading.Event()
+    stop.set()
+    summary = incremental.train_incremental(html_task, stop_event=stop, max_steps=5, batch_size=2)
+    assert summary["status"] == "stopped" and summary["steps"] == 1
+    assert sorted(p.name for p in model_dir.iterdir()) == before
+    assert not model_dir.with_name(model_dir.name + ".new").exists()
+    assert incremental.load_state(model_dir)["last_timestamp"] is None
+    assert incremental.train_incremental(html_task, max_steps=1, batch_size=4)["new_rows"] == 8
+
+
+def test_record_label_needs_a_selector():
+    with pytest.raises(ValueError):
+        incremental.record_label("<p>x</p>", "")
+
+
+def test_unsupported_task():
+    with pytest.raises(ValueError):
+        incremental.train_incremental("classifier")
@@ -0,0 +1,37 @@
+import config
+from src import ingestion
+
+
+def texts(batch):
+    return batch["html"]
+
+
+def test_hash_split_is_deterministic():
+    rows = [f"<p id='r{i}'>{i}</p>" for i in range(2000)]
+    flags = ingestion.split_flags(rows, 0.1)
+    assert flags == ingestion.split_flags(rows, 0.1)
+    assert 0.07 < sum(flags) / len(flags) < 0.13
+    # A larger test split only moves rows from train to test
+    wider = ingestion.split_flags(rows, 0.2)
+    assert all(w for f, w in zip(flags, wider) if f)
+
+
+def test_scan_bounded_sample():
+    rows = [{"html": f"<p>{i}</p>", "selector": f"s{i % 7}"} for i in range(500)]
+    found = ingestion.scan(iter(rows), texts, "selector", 0.2, sample_size=50, batch_size=64)
+    flags = ingestion.split_flags([row["html"] for row in rows], 0.2)
+    assert found.test_rows == sum(flags) and found.train_rows == 500 - sum(flags)
+    assert found.labels == sorted({row["selector"] for row in rows})
+    assert found.columns == ["html", "selector"]
+    assert len(found.sample) == 50
+    train_texts = {row["html"] for row, flag in zip(rows, flags) if not flag}
+    assert set(found.sample) <= train_texts
+
+
+def test_num_proc(monkeypatch):
+    monkeypatch.setattr(config, "TRAIN_NUM_PROC", 4)
+    monkeypatch.setattr(config, "TRAIN_ROWS_PER_PROC", 1000)
+    assert ingestion.num_workers() == 4
+    assert ingestion.num_proc_for(500) is None
+    assert ingestion.num_proc_for(2500) == 2
+    assert ingestion.num_proc_for(10 ** 6) == 4
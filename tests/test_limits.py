@@ -0,0 +1,115 @@
+import pytest
+
+import css_selector_generator as csg
+import detect_selector as ds
+from html_parsing import make_soup
+from limits import LimitExceeded, WorkLimits, limit_counters, reset_limit_counters
+
+
+def deep(levels):
+    return "<div>" * levels + "<a class='x' href='/'>lien</a>" + "</div>" * levels
+
+
+def test_within_limits_unchanged():
+    html = "<div id='main'><p class='title'>x</p></div>"
+    assert csg.generate_selector(html, limits=WorkLimits(1000, 10, 10, 1.0)) == csg.generate_selector(html)
+
+
+def test_depth_is_truncated():
+    reset_limit_counters()
+    limits = WorkLimits(max_depth=50)
+    soup = make_soup(limits.check_input(deep(200)), "html.parser")
+    limits.prune(soup)
+    assert len(soup.find_all(True)) == 51
+    assert soup.find("a") is None
+    assert limit_counters()["depth"] == 1
+
+
+def test_nodes_are_truncated_in_document_order():
+    reset_limit_counters()
+    html = "".join(f"<p id='p{i}'>{i}</p>" for i in range(100))
+    limits = WorkLimits(max_nodes=10)
+    soup = make_soup(limits.check_input(html), "html.parser")
+    limits.prune(soup)
+    assert [p["id"] for p in soup.find_all("p")] == [f"p{i}" for i in range(10)]
+    assert limit_counters()["nodes"] == 1
+
+
+def test_bytes_truncated_or_error():
+    reset_limit_counters()
+    html = "<p class='a'>é</p>" * 100
+    assert len(WorkLimits(max_bytes=50).check_input(html).encode("utf-8")) <= 50
+    with pytest.raises(LimitExceeded) as info:
+        csg.generate_selector(html, limits=WorkLimits(max_bytes=50, mode="error"))
+    assert info.value.limit == "bytes"
+    assert isinstance(info.value, ValueError)
+    assert limit_counters()["bytes"] == 2
+
+
+def test_time_limit_returns_best_so_far():
+    reset_limit_counters()
+    html = "<span>x</span>" * 2000 + "<div id='late'>y</div>"
+    assert csg.generate_selector(html, limits=WorkLimits(max_seconds=0.0)) == "span"
+    assert limit_counters()["time"] == 1
+    soup = make_soup(html, "html.parser")
+    assert len(ds.choose_best_elements(soup, limits=WorkLimits(max_seconds=0.0))) >= 1
+    with pytest.raises(LimitExceeded):
+        csg.generate_selector(html, limits=WorkLimits(max_seconds=0.0, mode="error"))
+
+
+def test_build_selector_level_cap(monkeypatch):
+    reset_limit_counters()
+    monkeypatch.setattr(csg.config, "BUILD_SELECTOR_MAX_LEVELS", 3)
+    html = "<div class='top'>" + "<section class='s'>" * 10 + "<a>x</a>" + "</section>" * 10 + "</div>"
+    soup = make_soup(html, "html.parser")
+    assert csg.build_selector(soup.find("a")) == "section.s section.s a"
+    assert limit_counters()["levels"] == 1
+
+
+def test_estimate_shape_bounds_the_parsed_tree():
+    from limits import estimate_shape
+
+    for html in (deep(30), "<div></span>" * 10, "<p><b>x</p></b><br><img>", "<ul><li>a<li>b</ul>"):
+        soup = make_soup(html, "html.parser")
+        elements, depth = estimate_shape(html)
+        tags = soup.find_all(True)
+        assert len(tags) <= elements
+        assert max(len(list(t.parents)) for t in tags) <= depth
+
+
+@pytest.fixture
+def service(monkeypatch):
+    import config
+    import selector_service
+    from src.prediction_cache import PredictionCache
+
+    monkeypatch.setattr(selector_service, "cache", PredictionCache(16))
+    monkeypatch.setattr(selector_service, "ajouter_interaction", lambda *a, **k: None)
+    return config, selector_service
+
+
+def test_served_heuristics_apply_limits(service, monkeypatch):
+    from cascade import Cascade
+
+    config, selector_service = service
+    html = "<p class='a'>é</p>" * 500
+    monkeypatch.setattr(config, "MAX_INPUT_BYTES", 100)
+    monkeypatch.setattr(config, "LIMIT_MODE", "error")
+    (result,) = selector_service.select_batch([html])
+    assert result["error_type"] == "LimitExceeded"
+    with pytest.raises(LimitExceeded):
+        selector_service.heuristic_selector(html)
+    with pytest.raises(LimitExceeded):
+        Cascade().predict(html)
+
+
+def test_best_so_far_answers_are_not_cached(service, monkeypatch):
+    config, selector_service = service
+    html = "<span>x</span>" * 2000 + "<div id='late'>y</div>"
+    monkeypatch.setattr(config, "MAX_SECONDS", 0.0)
+    assert selector_service.heuristic_selector(html) == "span"
+    hurried = selector_service.select_batch([html])[0]["selector"]
+    monkeypatch.setattr(config, "MAX_SECONDS", 5.0)
+    assert selector_service.heuristic_selector(html) == "#late"
+    assert selector_service.select_batch([html])[0]["selector"] == "#late" != hurried
+    assert selector_service.cache.stats()["hits"] == 0
@@ -0,0 +1,131 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+
+from src import memoire_generale as mg
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_entries_are_batched_and_flushed(tmp_path):
+    path = tmp_path / "h.jsonl"
+    writer = mg.HistoryWriter(batch_size=10, flush_interval=60)
+    for i in range(10):
+        writer.submit(path, (json.dumps({"i": i}) + "\n").encode())
+    deadline = time.monotonic() + 5
+    while writer.entries < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.entries == 10
+    for i in range(10, 15):
+        writer.submit(path, (json.dumps({"i": i}) + "\n").encode())
+    time.sleep(0.05)
+    assert len(_read(path)) == 10
+    writer.close()
+    assert [e["i"] for e in _read(path)] == list(range(15))
+
+
+def test_time_threshold(tmp_path):
+    path = tmp_path / "h.jsonl"
+    writer = mg.HistoryWriter(batch_size=1000, flush_interval=0.05, durability="fsync")
+    writer.submit(path, b'{"i": 0}\n')
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _read(path) == [{"i": 0}]
+    writer.close()
+
+
+def test_charger_historique_sees_queued_entries(tmp_path):
+    fichier = str(tmp_path / "historique.jsonl")
+    mg.ajouter_interaction("prediction", {"reponse": "a"}, fichier=fichier)
+    mg.ajouter_interaction("reponse", {"texte": "a"}, fichier=fichier)
+    assert [e["type"] for e in mg.charger_historique(fichier)] == ["prediction", "reponse"]
+
+
+def test_unknown_durability():
+    with pytest.raises(ValueError):
+        mg.HistoryWriter(durability="sometimes")
+
+
+def _worker(path, n):
+    for i in range(n):
+        mg.ajouter_interaction("prediction", {"html": "<p>" + "x" * 500 + "</p>", "i": i}, fichier=path)
+    mg.flush_interactions()
+
+
+def test_concurrent_processes_do_not_interleave(tmp_path):
+    path = str(tmp_path / "historique.jsonl")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(path, 200)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    entries = _read(path)
+    assert len(entries) == 800
+    assert all(e["contenu"]["html"].endswith("</p>") for e in entries)
+
+
+def _small_segments(monkeypatch, max_bytes=2000, compress=True):
+    import config
+
+    monkeypatch.setattr(config, "HISTORY_SEGMENT_MAX_BYTES", max_bytes)
+    monkeypatch.setattr(config, "HISTORY_COMPRESS_SEGMENTS", compress)
+    monkeypatch.setattr(config, "HISTORY_ASYNC", False)
+
+
+def test_rotation_by_size_and_filtered_reads(tmp_path, monkeypatch):
+    _small_segments(monkeypatch)
+    fichier = str(tmp_path / "historique.jsonl")
+    for i in range(60):
+        mg.ajouter_interaction("prediction" if i % 3 else "erreur", {"i": i, "html": "x" * 50}, fichier=fichier)
+    segments = mg._load_manifest(tmp_path / "historique")
+    assert len(segments) > 1
+    assert all(s["file"].endswith(".jsonl.gz") for s in segments)
+    assert sum(s["count"] for s in segments) < 60
+    assert [e["contenu"]["i"] for e in mg.charger_historique(fichier)] == list(range(60))
+    erreurs = [e["contenu"]["i"] for e in mg.iter_historique(type="erreur", fichier=fichier)]
+    assert erreurs == list(range(0, 60, 3))
+
+
+def test_time_range_skips_segments(tmp_path, monkeypatch):
+    _small_segments(monkeypatch, max_bytes=1, compress=False)
+    fichier = tmp_path / "historique.jsonl"
+    days = ["2026-01-01", "2026-01-02", "2026-01-03"]
+    for day in days:
+        line = {"type": "prediction", "timestamp": f"{day}T12:00:00", "contenu": {"day": day}}
+        mg._append(fichier, (json.dumps(line) + "\n").encode())
+    opened = []
+    real = mg._read_segment
+    monkeypatch.setattr(mg, "_read_segment", lambda path, *a: (opened.append(path.name), real(path, *a))[1])
+    result = [e["contenu"]["day"] for e in mg.iter_historique(since="2026-01-02", until="2026-01-03", fichier=str(fichier))]
+    assert result == ["2026-01-02"]
+    assert len(opened) == 2  # the matching segment and the active file
+
+
+def test_daily_rotation(tmp_path, monkeypatch):
+    _small_segments(monkeypatch, max_bytes=None)
+    fichier = tmp_path / "historique.jsonl"
+    fichier.write_text(json.dumps({"type": "reponse", "timestamp": "2000-01-01T00:00:00", "contenu": {}}) + "\n")
+    mg.ajouter_interaction("reponse", {"texte": "x"}, fichier=str(fichier))
+    assert [s["first"] for s in mg._load_manifest(tmp_path / "historique")] == ["2000-01-01T00:00:00"]
+    assert len(mg.charger_historique(str(fichier))) == 2
+
+
+def test_concurrent_processes_with_rotation(tmp_path, monkeypatch):
+    _small_segments(monkeypatch, max_bytes=20000)
+    path = str(tmp_path / "historique.jsonl")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(path, 100)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    entries = mg.charger_historique(path)
+    assert len(entries) == 400
+    assert len(mg._load_manifest(tmp_path / "historique")) > 1
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from src.micro_batcher import MicroBatcher
+
+
+def test_groups_concurrent_calls():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    assert results == {i: i * 2 for i in range(8)}
+    assert len(calls) < 8
+    metrics = batcher.metrics()
+    assert metrics["requests"] == 8
+    assert metrics["batches"] == len(calls)
+    assert metrics["max_batch_size"] == max(len(c) for c in calls)
+    assert metrics["mean_wait_seconds"] >= 0
+
+
+def test_respects_max_batch_size_and_errors():
+    batcher = MicroBatcher(lambda items: [1 / i for i in items], max_batch_size=2, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in (1, 2, 0, 4)]
+    time.sleep(0.1)
+    assert futures[0].result() == 1.0
+    with pytest.raises(ZeroDivisionError):
+        futures[2].result()
+    batcher.close()
+    assert batcher.metrics()["max_batch_size"] <= 2
+    assert batcher.metrics()["errors"] >= 1
+
+
+def test_html_only_predictor_uses_batcher(tiny_model_factory, monkeypatch):
+    import config
+    from src import html_only_predictor as hp
+    from src.model_registry import registry
+    from src.prediction_cache import PredictionCache
+
+    monkeypatch.setitem(registry.paths, hp.MODEL_NAME, tiny_model_factory())
+    monkeypatch.setattr(hp, "ajouter_interaction", lambda *a, **k: None)
+    monkeypatch.setattr(hp, "_batcher", None)
+    monkeypatch.setattr(hp, "cache", PredictionCache(0))
+    registry.unload(hp.MODEL_NAME)
+    html = "<div class='card'><h2 class='title'>Titre</h2></div>"
+    try:
+        expected = hp.predict_selector(html)
+        monkeypatch.setattr(config, "MICRO_BATCHING", True)
+        assert hp.predict_selector(html) == expected
+        assert hp.get_batcher().metrics()["requests"] == 1
+        hp.get_batcher().close()
+    finally:
+        registry.unload(hp.MODEL_NAME)
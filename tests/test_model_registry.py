@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from src.model_registry import ModelRegistry
+from src.prediction_cache import PredictionCache
+
+
+def test_loads_lazily_and_once(tiny_model_factory):
+    registry = ModelRegistry({"m": tiny_model_factory()})
+    assert not registry.is_loaded("m")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("m"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert registry.loads["m"] == 1
+    assert all(r is results[0] for r in results)
+    stats = registry.stats()["m"]
+    assert stats["loaded"] and stats["param_bytes"] > 0 and stats["load_seconds"] >= 0
+
+
+def test_shares_identical_tokenizers(tiny_model_factory):
+    registry = ModelRegistry({
+        "a": tiny_model_factory("a", seed=1),
+        "b": tiny_model_factory("b", labels=("x", "y"), seed=2),
+    })
+    assert registry.get("a").tokenizer is registry.get("b").tokenizer
+    assert registry.get("a").model is not registry.get("b").model
+
+
+def test_evicts_least_recently_used(tiny_model_factory):
+    registry = ModelRegistry(
+        {name: tiny_model_factory(name) for name in ("a", "b", "c")}, max_models=2
+    )
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert registry.is_loaded("a") and registry.is_loaded("c")
+    assert not registry.is_loaded("b")
+    assert registry.evictions == 1
+
+
+def test_missing_directory(tmp_path):
+    registry = ModelRegistry({"m": tmp_path / "missing"})
+    with pytest.raises(FileNotFoundError):
+        registry.get("m")
+
+
+def test_predict_selectors_matches_single_predictions(tiny_model_factory, monkeypatch):
+    from src import html_only_predictor as hp
+    from src.model_registry import registry
+
+    monkeypatch.setitem(registry.paths, hp.MODEL_NAME, tiny_model_factory(labels=("a", "#x", ".y", "li")))
+    monkeypatch.setattr(hp, "ajouter_interaction", lambda *a, **k: None)
+    monkeypatch.setattr(hp, "cache", PredictionCache(0))
+    registry.unload(hp.MODEL_NAME)
+    htmls = [
+        "<a href='/'>x</a>",
+        "<div class='card'><h2 class='title'>Un titre bien plus long</h2><p>texte</p></div>",
+        "<li id='item5'>List item 5</li>",
+    ] * 3
+    try:
+        assert hp.predict_selectors(htmls, batch_size=2) == [hp.predict_selector(h) for h in htmls]
+    finally:
+        registry.unload(hp.MODEL_NAME)
+
+
+def test_model_version_follows_the_loaded_model(tiny_model_factory, monkeypatch):
+    from transformers import AutoModelForSequenceClassification
+
+    from src import model_registry
+    from src.prediction_cache import model_version
+
+    path = tiny_model_factory()
+    monkeypatch.setattr(model_registry, "registry", ModelRegistry({"m": path}))
+    before = model_version("m")
+    (path / "checkpoints").mkdir()
+    AutoModelForSequenceClassification.from_pretrained(path).save_pretrained(path)
+    # The old weights are still the ones answering
+    assert model_version("m") == before
+    model_registry.registry.unload("m")
+    assert model_version("m") != before
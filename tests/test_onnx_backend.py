@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnxscript")
+
+from src.model_registry import ModelRegistry
+from src.onnx_backend import check_parity, export_onnx
+
+TEXTS = ["<a href='/p/1'>produit</a>", "<div class='prix'>12 €</div>", "x", "<ul><li>a</li><li>b</li></ul>"]
+
+
+def test_export_matches_torch(tiny_model_factory):
+    path = tiny_model_factory()
+    written = export_onnx(path, quantize=True)
+    assert set(written) == {"onnx", "onnx-int8"}
+    parity = check_parity(path, TEXTS, "onnx", batch_size=3)
+    assert parity["max_abs_diff"] < 1e-4
+    assert parity["agreement"] == 1.0
+    assert check_parity(path, TEXTS, "onnx-int8")["max_abs_diff"] < 0.5
+
+
+def test_onnx_backend_needs_export(tiny_model_factory):
+    registry = ModelRegistry({"m": tiny_model_factory()}, backend="onnx")
+    with pytest.raises(FileNotFoundError):
+        registry.get("m")
+
+
+def test_onnx_backend_refuses_stale_graph(tiny_model_factory):
+    from transformers import AutoModelForSequenceClassification
+
+    path = tiny_model_factory()
+    export_onnx(path)
+    assert ModelRegistry({"m": path}, backend="onnx").get("m").id2label
+    # Saving the model again (as a new training run does) leaves the graph behind
+    AutoModelForSequenceClassification.from_pretrained(path).save_pretrained(path)
+    with pytest.raises(FileNotFoundError, match="export-onnx"):
+        ModelRegistry({"m": path}, backend="onnx").get("m")
+    export_onnx(path)
+    ModelRegistry({"m": path}, backend="onnx").get("m")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        ModelRegistry({}, backend="tensorrt")
@@ -0,0 +1,68 @@
+from src.prediction_cache import PredictionCache, directory_fingerprint, make_key, normalize_html
+
+
+def test_normalization_ignores_attribute_order_and_whitespace():
+    a = "<div  class='card' id=\"x\">\n  <a href='/p'> Lien </a>\n</div>"
+    b = '<DIV id="x" class="card"><a href="/p">Lien</a></DIV>'
+    assert normalize_html(a) == normalize_html(b)
+    assert normalize_html("<p>a b</p>") != normalize_html("<p>a  b</p>")
+    assert make_key("m", a, "q", "v1") == make_key("m", b, " q ", "v1")
+    assert make_key("m", a, "q", "v1") != make_key("m", a, "q", "v2")
+    assert make_key("m", a, "q", "v1") != make_key("other", a, "q", "v1")
+
+
+def test_lru_counters():
+    cache = PredictionCache(max_entries=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    for html in ("<a>1</a>", "<a>2</a>", "<a>1</a>", "<a>3</a>", "<a>2</a>"):
+        cache.get_or_compute("t", html, "", "v", lambda: compute(html))
+    assert calls == ["<a>1</a>", "<a>2</a>", "<a>3</a>", "<a>2</a>"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 2)
+
+
+def test_many_only_computes_missing():
+    cache = PredictionCache()
+    cache.get_or_compute("t", "<b>x</b>", "", "v", lambda: "cached")
+    seen = []
+
+    def compute(missing):
+        seen.append(missing)
+        return [f"new{i}" for i in missing]
+
+    assert cache.get_or_compute_many("t", ["<i>y</i>", "<b>x</b>"], ["", ""], "v", compute) == ["new0", "cached"]
+    assert seen == [[0]]
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    PredictionCache(path=path).get_or_compute("t", "<p>x</p>", "q", "v", lambda: {"sel": "p"})
+    reopened = PredictionCache(path=path)
+    assert reopened.get_or_compute("t", "<p>x</p>", "q", "v", lambda: None) == {"sel": "p"}
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_keeps_latest_entries(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = PredictionCache(max_entries=0, path=path, max_disk_entries=3)
+    for i in range(5):
+        cache.get_or_compute("t", f"<p>{i}</p>", "", "v", lambda: i)
+    # Storing a key again makes it the latest
+    cache.put(make_key("t", "<p>2</p>", "", "v"), 2)
+    cache.get_or_compute("t", "<p>5</p>", "", "v", lambda: 5)
+    assert cache.stats()["disk_evictions"] == 3
+    kept = [cache.get(make_key("t", f"<p>{i}</p>", "", "v")) for i in range(6)]
+    assert kept == [None, None, 2, None, 4, 5]
+
+
+def test_directory_fingerprint_changes_with_files(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    before = directory_fingerprint(tmp_path)
+    (tmp_path / "model.safetensors").write_bytes(b"weights")
+    assert directory_fingerprint(tmp_path) != before
+    assert directory_fingerprint(tmp_path / "missing") == "missing"
@@ -0,0 +1,143 @@
+from pathlib import Path
+import json
+import sys
+
+import numpy as np
+import pytest
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "benchmarks"))
+
+import config
+import css_selector_generator as csg
+import detect_selector as ds
+import selector_features as sf
+from bench_detect_selector import synthetic_page
+from cascade import heuristic_candidates
+
+
+PAGES = [
+    "<div class='card'><h2 class='title'>  Produit  </h2>"
+    "<p>Une description <b>assez</b> longue du produit.</p>"
+    "<script>var x = 1;</script><!-- commentaire -->"
+    "<ul class='nav'><li><a href='/a'>A</a></li><li>B</li></ul>"
+    "<template><p>cache</p></template></div><span id='solo'>x</span>",
+    "<section id='main-content'><div id='ember123' class='row col-6 product-price'>"
+    "<span class='price-tag btn'>12 EUR</span></div><img src='x.png'>"
+    "<article class='product-item'><h1>Titre d'un article assez long pour compter</h1></article></section>",
+    "<p>seul</p>",
+    synthetic_page(300, seed=3),
+]
+
+
+@pytest.fixture(autouse=True)
+def builtin_weights(monkeypatch):
+    monkeypatch.setattr(config, "CSS_SCORE_WEIGHTS_FILE", None)
+    monkeypatch.setattr(config, "DETECT_SCORE_WEIGHTS_FILE", None)
+
+
+@pytest.mark.parametrize("html", PAGES, ids=["card", "ids", "single", "synthetic"])
+def test_css_scores_match_compute_score(html):
+    soup = BeautifulSoup(html, "html.parser")
+    elements, scores = sf.score_elements(soup, "css")
+    assert elements == soup.find_all(True)
+    assert scores.tolist() == [csg.compute_score(el) for el in elements]
+
+
+@pytest.mark.parametrize("html", PAGES, ids=["card", "ids", "single", "synthetic"])
+def test_detect_scores_match_compute_score(html):
+    soup = BeautifulSoup(html, "html.parser")
+    annotations = ds.annotate_tree(soup)
+    elements, scores = sf.score_elements(soup, "detect", annotations)
+    assert scores.tolist() == [ds.compute_score(el, annotations[id(el)]) for el in elements]
+
+
+@pytest.mark.parametrize("html", PAGES, ids=["card", "ids", "single", "synthetic"])
+def test_choices_match_sorted_scores(html):
+    soup = BeautifulSoup(html, "html.parser")
+    elements = soup.find_all(True)
+    best = max(elements, key=csg.compute_score)  # first one on ties
+    assert csg.choose_best_element(soup) is best
+
+    annotations = ds.annotate_tree(soup)
+    expected = []
+    for el in sorted(elements, key=lambda e: ds.compute_score(e, annotations[id(e)]), reverse=True):
+        candidate = ds.refine_candidate(el, annotations.get(id(el)))
+        if all(ds.build_selector(c) != ds.build_selector(candidate) for c in expected):
+            expected.append(candidate)
+        if len(expected) == 4:
+            break
+    assert ds.choose_best_elements(soup, limit=4) == expected
+
+
+def test_choose_best_element_empty():
+    assert csg.choose_best_element(BeautifulSoup("texte", "html.parser")) is None
+    assert ds.choose_best_elements(BeautifulSoup("texte", "html.parser")) == []
+
+
+def test_heuristic_candidates_keep_scores():
+    selectors = heuristic_candidates(PAGES[1], limit=5)
+    assert selectors[0][0] == csg.generate_selector(PAGES[1])
+    assert [score for _, score in selectors] == sorted((s for _, s in selectors), reverse=True)
+
+
+def test_top_k_matches_stable_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(-3, 4, size=200).astype(float)
+    expected = sorted(range(len(scores)), key=lambda i: -scores[i])
+    for k in (1, 5, 37, 200, 500):
+        assert sf.top_k(scores, k).tolist() == expected[:k]
+    assert list(sf.ranked(scores, start=3)) == expected
+    assert sf.top_k(np.array([]), 3).tolist() == []
+
+
+def test_weights_round_trip(tmp_path):
+    path = tmp_path / "weights.json"
+    weights = sf.weight_vector(sf.DETECT_WEIGHTS)
+    sf.save_weights(path, weights)
+    assert np.array_equal(sf.load_weights(path), weights)
+    assert sf.needs_structure(weights)
+    assert not sf.needs_structure(sf.weight_vector(sf.CSS_WEIGHTS))
+    with pytest.raises(ValueError, match="colour"):
+        sf.weight_vector({"colour": 1})
+
+
+def test_weights_file_changes_the_choice(tmp_path, monkeypatch):
+    html = "<div class='card'><p>Un texte assez long pour la densite du noeud.</p></div>"
+    soup = BeautifulSoup(html, "html.parser")
+    assert csg.choose_best_element(soup).name == "div"
+
+    path = tmp_path / "css.json"
+    path.write_text(json.dumps({"text_over_15": 1, "log_descendants": -1}), encoding="utf-8")
+    monkeypatch.setattr(config, "CSS_SCORE_WEIGHTS_FILE", path)
+    assert csg.choose_best_element(soup).name == "p"
+
+
+def test_heuristic_cache_follows_the_weights(tmp_path, monkeypatch):
+    import selector_service
+    from src.prediction_cache import PredictionCache
+
+    monkeypatch.setattr(selector_service, "cache", PredictionCache(16))
+    html = "<div class='card'><p>Un texte assez long pour la densite du noeud.</p></div>"
+    assert selector_service.heuristic_selector(html) == "div.card"
+    assert sf.weights_version("css") == "builtin"
+
+    path = tmp_path / "css.json"
+    path.write_text(json.dumps({"text_over_15": 1, "log_descendants": -1}), encoding="utf-8")
+    monkeypatch.setattr(config, "CSS_SCORE_WEIGHTS_FILE", path)
+    version = sf.weights_version("css")
+    assert selector_service.heuristic_selector(html) == ".card p"
+    path.write_text(json.dumps({"text_over_15": 2}), encoding="utf-8")
+    assert sf.weights_version("css") != version
+
+
+def test_extract_stops_reading_when_out_of_time():
+    from limits import TIME_CHECK_EVERY, WorkLimits
+
+    soup = BeautifulSoup(synthetic_page(3 * TIME_CHECK_EVERY), "html.parser")
+    annotations = ds.annotate_tree(soup)
+    elements, matrix = sf.extract(soup, annotations, WorkLimits(max_seconds=0.0))
+    assert len(elements) == matrix.shape[0] == TIME_CHECK_EVERY
+    assert elements == soup.find_all(True)[:TIME_CHECK_EVERY]
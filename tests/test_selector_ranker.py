@@ -0,0 +1,80 @@
+import csv
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+import config
+import selector_service
+from src import selector_ranker
+
+
+def _rows(n=60):
+    rows = []
+    for i in range(n):
+        if i % 3 == 0:
+            rows.append((f"<div id='box{i % 7}'><p>Paragraph {i}</p></div>", f"#box{i % 7}"))
+        elif i % 3 == 1:
+            rows.append((f"<div class='card'><h2 class='title'>T{i}</h2><span>{i} €</span></div>",
+                         "h2.title"))
+        else:
+            rows.append((f"<ul><li><a href='/p{i}'>Link {i}</a></li></ul>", "ul li a"))
+    return rows
+
+
+@pytest.fixture
+def ranker_dir(tmp_path, monkeypatch):
+    data = tmp_path / "data.csv"
+    with data.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["html", "selector"])
+        writer.writerows(_rows())
+    metrics = selector_ranker.train_ranker(data, tmp_path / "ranker", test_size=0.3)
+    monkeypatch.setattr(config, "RANKER_MODEL_DIR", tmp_path / "ranker")
+    return tmp_path / "ranker", metrics
+
+
+def test_candidates_and_correctness():
+    soup = selector_ranker.parse("<ul><li><a href='/x'>x</a></li><li>y</li></ul>")
+    found = selector_ranker.candidates(soup)
+    selectors = [c.selector for c in found]
+    assert len(selectors) == len(set(selectors))
+    assert "a" in selectors and "li a" in selectors
+    assert sum(c.built for c in found if c.element.name == "a") == 1
+    # Another selector of the same elements counts as correct
+    assert selector_ranker.is_correct(soup, "a", "ul li a")
+    assert not selector_ranker.is_correct(soup, "li", "ul li a")
+    assert len(selector_ranker.features(soup, found[0])) == len(selector_ranker.FEATURES)
+
+
+def test_train_and_rank(ranker_dir):
+    path, metrics = ranker_dir
+    assert metrics["uncovered"] == 0 and metrics["test_snippets"] > 0
+    assert metrics["accuracy"] >= metrics["heuristic_accuracy"]
+    assert (path / selector_ranker.RANKER_FILE).is_file()
+
+    ranked = selector_ranker.get_ranker(path).rank(
+        "<div class='card'><h2 class='title'>New</h2><span>5 €</span></div>", top_k=3
+    )
+    assert len(ranked) == 3
+    probs = [p for _, p in ranked]
+    assert probs == sorted(probs, reverse=True) and sum(probs) <= 1 + 1e-9
+    # Selectors never seen in training are proposed too
+    assert selector_ranker.predict_selector("<div id='fresh'><p>x</p></div>") == "#fresh"
+
+
+def test_load_rejects_other_features(ranker_dir, monkeypatch):
+    path, _ = ranker_dir
+    monkeypatch.setattr(selector_ranker, "FEATURES", selector_ranker.FEATURES + ("extra",))
+    with pytest.raises(ValueError):
+        selector_ranker.Ranker.load(path)
+    with pytest.raises(FileNotFoundError):
+        selector_ranker.Ranker.load(path.parent / "none")
+
+
+def test_ranker_engine(ranker_dir, monkeypatch):
+    monkeypatch.setattr(selector_service, "ajouter_interaction", lambda *a, **k: None)
+    html = "<div id='box3'><p>Paragraph</p></div>"
+    [result] = selector_service.select_batch([html], engine="ranker", top_k=2)
+    assert result["selector"] == "#box3"
+    assert len(result["candidates"]) == 2
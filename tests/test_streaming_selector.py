@@ -0,0 +1,48 @@
+import io
+import json
+from pathlib import Path
+import sys
+
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+import css_selector_generator as csg
+import detect_selector as ds
+from streaming_selector import stream_best_elements
+
+
+def _snippets(limit=300):
+    with open(ROOT / "data" / "html_blocks.jsonl", encoding="utf-8") as f:
+        blocks = [json.loads(line)["html"] for line in f]
+    return blocks[:limit] + [
+        "<div class='card'><p>Texte <!-- note --> suite</p><script>x=1</script>"
+        "<ul><li><a href='/a'>A</a></li></ul><br><img src='i.png'/></div>",
+        "<section><div><p>non fermé<div><a href='#'>x</a></section>",
+    ]
+
+
+def test_stream_matches_detect_selector():
+    for html in _snippets():
+        for mode in ("all", "links", "text"):
+            soup = BeautifulSoup(html, "html.parser")
+            expected = [ds.build_selector(el) for el in ds.choose_best_elements(soup, mode)]
+            streamed = ds.stream_best_elements(io.StringIO(html), mode)
+            assert [ds.build_selector(el) for el in streamed] == expected, html
+
+
+def test_stream_matches_css_selector_generator():
+    for html in _snippets():
+        streamed = csg.stream_best_element(io.StringIO(html))
+        assert csg.build_selector(streamed) == csg.generate_selector(html), html
+
+
+def test_stream_small_chunks():
+    html = "<div class='card'><h2 class='title'>Un titre assez long</h2></div>" * 50
+    soup = BeautifulSoup(html, "html.parser")
+    expected = [ds.build_selector(el) for el in ds.choose_best_elements(soup)]
+    streamed = stream_best_elements(
+        io.StringIO(html), ds.compute_score, ds.build_selector, chunk_size=7
+    )
+    assert [ds.build_selector(el) for el in streamed] == expected
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import css_selector_generator as csg
+import tracing
+
+
+@pytest.fixture
+def traced(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.reset()
+    tracing.enable(str(path))
+    yield path
+    tracing.disable()
+    tracing.reset()
+
+
+def test_disabled_spans_record_nothing():
+    tracing.disable()
+    tracing.reset()
+    with tracing.span("x"):
+        pass
+    assert tracing.span("x") is tracing.span("y")
+    assert tracing.histograms() == {}
+
+
+def test_trace_file_and_histograms(traced):
+    with tracing.trace("request", source="test"):
+        csg.generate_selector("<div id='main'><a href='/'>x</a></div>")
+    record = json.loads(traced.read_text().strip())
+    assert record["name"] == "request" and record["attrs"] == {"source": "test"}
+    names = [s["name"] for s in record["spans"]]
+    assert names == ["css.parse", "css.score", "css.build_selector"]
+    assert all(s["parent"] is None and s["duration_ms"] >= 0 for s in record["spans"])
+    hists = tracing.histograms()
+    assert hists["css.parse"]["count"] == 1 and hists["request"]["count"] == 1
+
+
+def test_nested_spans_and_errors(traced):
+    with pytest.raises(ValueError):
+        with tracing.trace("request"):
+            with tracing.span("outer"):
+                with tracing.span("inner"):
+                    raise ValueError("boom")
+    record = json.loads(traced.read_text().strip())
+    assert record["error"] == "ValueError"
+    outer, inner = record["spans"]
+    assert inner["parent"] == 0 and inner["error"] == "ValueError"
+
+
+def test_prometheus_text(traced):
+    tracing.observe("css.parse", 0.0003)
+    tracing.observe("css.parse", 7.0)
+    text = tracing.prometheus_text()
+    assert '# TYPE selector_stage_seconds histogram' in text
+    assert 'selector_stage_seconds_bucket{stage="css.parse",le="0.0005"} 1' in text
+    assert 'selector_stage_seconds_bucket{stage="css.parse",le="+Inf"} 2' in text
+    assert 'selector_stage_seconds_count{stage="css.parse"} 2' in text
+
+
+def test_metrics_endpoint(traced, monkeypatch):
+    pytest.importorskip("flask")
+    import web_interface
+
+    monkeypatch.setattr(web_interface, "ajouter_interaction", lambda *a, **k: None)
+    client = web_interface.app.test_client()
+    client.post("/", data={"html": "<p class='title'>x</p>"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'stage="web.index"' in body
+    assert "selector_prediction_cache_total" in body
@@ -0,0 +1,149 @@
+import csv
+import dataclasses
+
+import pytest
+
+pytest.importorskip("accelerate")
+
+import config
+from src import training
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setattr(config, "TOKENIZED_CACHE_DIR", path)
+    return path
+
+
+def test_length_percentile():
+    lengths = list(range(1, 101))
+    assert training.length_percentile(lengths, 95, 128) == 95
+    assert training.length_percentile(lengths, 95, 64) == 64
+    assert training.length_percentile([3, 4], 95, 64) == training.MIN_MAX_LENGTH
+    assert training.length_percentile([], 95, 64) == 64
+
+
+@pytest.fixture
+def html_task(tmp_path):
+    data = tmp_path / "data.csv"
+    with data.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["html", "selector"])
+        for i in range(40):
+            body = "<span>x</span>" * (i % 5)
+            writer.writerow([f"<div id='d{i % 3}'>{body}</div>", f"#d{i % 3}"])
+    return dataclasses.replace(
+        training.TASKS["html_only_selector"], data_file=data, output_dir=tmp_path / "out"
+    )
+
+
+def test_train_dynamic_padding(html_task, tiny_model_factory):
+    base = tiny_model_factory("base", labels=("x",))
+    fixed = training.train(html_task, base_model=str(base), max_steps=2, batch_size=4,
+                           max_length=128, dynamic_padding=False, group_by_length=False,
+                           save=False)
+    metrics = training.train(html_task, base_model=str(base), max_steps=2, batch_size=4)
+    assert metrics["max_length"] < 128
+    assert metrics["padding_ratio"] < fixed["padding_ratio"]
+    assert metrics["samples_per_second"] > 0
+
+    from transformers import AutoConfig, DistilBertTokenizerFast
+
+    out = html_task.output_dir
+    assert AutoConfig.from_pretrained(out).label2id == {"#d0": 0, "#d1": 1, "#d2": 2}
+    assert DistilBertTokenizerFast.from_pretrained(out).model_max_length == metrics["max_length"]
+
+
+def test_missing_dataset(tmp_path):
+    spec = dataclasses.replace(training.TASKS["classifier"], data_file=tmp_path / "none.jsonl")
+    with pytest.raises(FileNotFoundError):
+        training.train(spec)
+
+
+def test_tokenized_cache(html_task, tiny_model_factory, cache_dir):
+    from transformers import DistilBertTokenizerFast
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(tiny_model_factory("base", labels=("x",)))
+    built, labels, max_length, info = training.prepare_dataset(html_task, tokenizer)
+    assert info["status"] == "miss"
+    cached, labels2, max_length2, info = training.prepare_dataset(html_task, tokenizer)
+    assert info["status"] == "hit" and info["saved_seconds"] >= 0
+    assert (labels2, max_length2) == (labels, max_length)
+    assert cached["train"]["input_ids"] == built["train"]["input_ids"]
+    assert training.prepare_dataset(html_task, tokenizer, rebuild=True)[3]["status"] == "rebuilt"
+
+    # Other parameters or other data make another entry
+    assert training.prepare_dataset(html_task, tokenizer, max_length=16)[3]["status"] == "miss"
+    with html_task.data_file.open("a", encoding="utf-8") as f:
+        f.write("<p id='d0'>new</p>,#d0\n")
+    assert training.prepare_dataset(html_task, tokenizer)[3]["status"] == "miss"
+    assert len(list(cache_dir.iterdir())) == 3
+
+
+def test_cache_disabled(html_task, tiny_model_factory, monkeypatch, cache_dir):
+    from transformers import DistilBertTokenizerFast
+
+    monkeypatch.setattr(config, "TOKENIZED_CACHE_DIR", None)
+    tokenizer = DistilBertTokenizerFast.from_pretrained(tiny_model_factory("base", labels=("x",)))
+    assert training.prepare_dataset(html_task, tokenizer)[3]["status"] == "disabled"
+    assert not cache_dir.exists()
+
+
+def test_streaming_matches_arrow_split(html_task, tiny_model_factory):
+    base = str(tiny_model_factory("base", labels=("x",)))
+    arrow = training.train(html_task, base_model=base, max_steps=2, batch_size=4, save=False)
+    streamed = training.train(html_task, base_model=base, max_steps=2, batch_size=4,
+                              save=False, streaming=True)
+    assert streamed["cache"]["status"] == "streaming"
+    assert streamed["rows"] == arrow["rows"]
+    assert sum(arrow["rows"].values()) == 40
+    assert streamed["max_length"] == arrow["max_length"]
+
+
+def test_stop_and_resume(html_task, tiny_model_factory):
+    import threading
+
+    base = str(tiny_model_factory("base", labels=("x",)))
+    stop = threading.Event()
+    stop.set()
+    metrics = training.train(html_task, stop_event=stop, base_model=base, max_steps=3, batch_size=4)
+    checkpoints = html_task.output_dir / training.CHECKPOINT_DIR
+    assert metrics["stopped"] and metrics["steps"] == 1
+    assert (checkpoints / "checkpoint-1").is_dir()
+    # A stopped run does not replace the model
+    assert not (html_task.output_dir / "config.json").exists()
+
+    metrics = training.train(html_task, base_model=base, max_steps=3, batch_size=4, resume=True)
+    assert metrics["resumed_from"].endswith("checkpoint-1")
+    assert metrics["steps"] == 3 and not metrics["stopped"]
+    assert (html_task.output_dir / "config.json").exists()
+    assert not checkpoints.exists()
+
+
+def test_fresh_start_drops_old_checkpoints(html_task, tiny_model_factory):
+    import threading
+
+    base = str(tiny_model_factory("base", labels=("x",)))
+    stop = threading.Event()
+    stop.set()
+    checkpoints = html_task.output_dir / training.CHECKPOINT_DIR
+    training.train(html_task, stop_event=stop, base_model=base, max_steps=3, batch_size=4)
+    training.train(html_task, stop_event=stop, base_model=base, max_steps=3, batch_size=4,
+                   resume=True)
+    assert (checkpoints / "checkpoint-2").is_dir()
+
+    # A fresh start then a resume continue the fresh run, not the older one
+    training.train(html_task, stop_event=stop, base_model=base, max_steps=3, batch_size=4)
+    assert sorted(p.name for p in checkpoints.iterdir()) == ["checkpoint-1"]
+    metrics = training.train(html_task, base_model=base, max_steps=3, batch_size=4, resume=True)
+    assert metrics["resumed_from"].endswith("checkpoint-1") and metrics["steps"] == 3
+
+
+def test_early_stopping_keeps_best(html_task, tiny_model_factory):
+    spec = dataclasses.replace(html_task, save_steps=1)
+    metrics = training.train(spec, base_model=str(tiny_model_factory("base", labels=("x",))),
+                             max_steps=30, batch_size=4, patience=1)
+    assert metrics["early_stopped"] and metrics["steps"] < 30
+    assert metrics["best_step"] is not None and metrics["best_step"] < metrics["steps"]
+    assert metrics["best_metric"] is not None
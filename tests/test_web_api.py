@@ -0,0 +1,144 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+import config
+import selector_service
+import web_interface
+from css_selector_generator import generate_selector
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CARD = "<div class='card'><h2 class='title'>Titre</h2><span class='price'>9 €</span></div>"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    logged = []
+    monkeypatch.setattr(selector_service, "ajouter_interaction", lambda t, c: logged.append(t))
+    monkeypatch.setattr(web_interface, "ajouter_interaction", lambda *a, **k: None)
+    client = web_interface.app.test_client()
+    client.logged = logged
+    return client
+
+
+def test_batch_heuristic(client):
+    items = [CARD, {"html": "<ul><li class='item'>a</li></ul>"}]
+    response = client.post("/api/v1/selectors", json={"items": items, "top_k": 2})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["engine"] == "heuristic" and body["timings"]["total_ms"] >= 0
+    first, second = body["results"]
+    assert first["selector"] == generate_selector(CARD)
+    assert first["candidates"][0]["selector"] == first["selector"]
+    assert 1 <= len(first["candidates"]) <= 2
+    assert abs(sum(c["probability"] for c in first["candidates"]) - 1) < 1e-3
+    assert second["selector"] == generate_selector(items[1]["html"])
+    assert "total_ms" in first["timings"]
+    assert client.logged == ["prediction", "prediction"]
+
+
+def test_question_items_logged_once(client, monkeypatch):
+    import detecteur
+
+    monkeypatch.setattr(detecteur, "ajouter_interaction", lambda t, c: client.logged.append(t))
+    items = [{"html": "<div><h1 class='titre'>Nom</h1><p>12 €</p></div>", "question": "le prix"}]
+    response = client.post("/api/v1/selectors", json={"items": items})
+    assert response.get_json()["results"][0]["selector"]
+    assert client.logged == ["prediction"]
+
+
+def test_model_engine_reports_errors_per_item(client, monkeypatch, tmp_path):
+    from src.model_registry import registry
+
+    monkeypatch.setitem(registry.paths, "html_only_selector", tmp_path / "missing")
+    registry.unload("html_only_selector")
+    response = client.post("/api/v1/selectors", json={"items": [CARD], "engine": "model"})
+    assert response.status_code == 200
+    (result,) = response.get_json()["results"]
+    assert result["error_type"] == "FileNotFoundError"
+    assert client.logged == ["erreur"]
+
+
+@pytest.mark.parametrize("payload", [
+    None,
+    {"items": "x"},
+    {"items": [1]},
+    {"items": [CARD], "engine": "gpu"},
+    {"items": [CARD], "top_k": 0},
+    {"items": [{"html": CARD, "question": 3}]},
+])
+def test_bad_payloads(client, payload):
+    response = client.post("/api/v1/selectors", json=payload)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_batch_too_large(client, monkeypatch):
+    monkeypatch.setattr(config, "API_MAX_BATCH", 2)
+    response = client.post("/api/v1/selectors", json={"items": [CARD] * 3})
+    assert response.status_code == 413
+
+
+def test_readiness_probe(client):
+    web_interface.ready.clear()
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").status_code == 503
+    web_interface.ready.set()
+    try:
+        assert client.get("/readyz").get_json() == {"status": "ready"}
+    finally:
+        web_interface.ready.clear()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_prefork_serve(tmp_path):
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    proc = subprocess.Popen(
+        [sys.executable, "-c",
+         "import pathlib, sys\n"
+         "from src import memoire_generale\n"
+         "memoire_generale.BASE_DIR = pathlib.Path(sys.argv.pop(1))\n"
+         "import cli; cli.cli()",
+         str(tmp_path),
+         "serve", "--workers", "2", "--port", str(port)],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(base + "/readyz", timeout=5) as r:
+                    assert r.status == 200
+                break
+            except (urllib.error.URLError, ConnectionError):
+                assert proc.poll() is None and time.monotonic() < deadline
+                time.sleep(0.2)
+        request = urllib.request.Request(
+            base + "/api/v1/selectors",
+            data=b'{"items": ["<p class=\\"x\\">a</p>"]}',
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10) as r:
+            assert b'"selector"' in r.read()
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        _, stderr = proc.communicate(timeout=30)
+    assert proc.returncode == 0, stderr.decode()
+    assert b"2 worker(s)" in stderr
+    assert (tmp_path / "data" / "historique.jsonl").is_file()
@@ -0,0 +1,271 @@
+"""Lightweight spans timing the stages of a selector request.
+
+``with span("css.parse"):`` times a stage and adds it to a per-stage
+histogram. Spans opened inside :func:`trace` are also collected into one
+record per request, appended to ``config.TRACE_FILE`` as a JSON line when it
+is set. :func:`prometheus_text` renders the histograms in the Prometheus
+text format (served at ``/metrics`` by the web interface).
+
+Tracing is off unless ``config.TRACING_ENABLED`` is set or :func:`enable`
+is called; disabled spans are a shared no-op context manager.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_enabled = bool(config.TRACING_ENABLED)
+_trace_file: Optional[Path] = Path(config.TRACE_FILE) if config.TRACE_FILE else None
+_trace_lock = threading.Lock()
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+_histograms: Dict[str, _Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Add a duration to the histogram of ``stage``."""
+    with _histograms_lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = _Histogram()
+        hist.observe(seconds)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Trace:
+    __slots__ = ("id", "name", "started", "wall", "spans", "stack")
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.stack: List[int] = []
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "started", "trace", "index")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.trace = _current.get()
+        if self.trace is not None:
+            self.index = len(self.trace.spans)
+            self.trace.spans.append({
+                "name": self.name,
+                "parent": self.trace.stack[-1] if self.trace.stack else None,
+            })
+            self.trace.stack.append(self.index)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        observe(self.name, ended - self.started)
+        if self.trace is not None:
+            record = self.trace.spans[self.index]
+            record["start_ms"] = round((self.started - self.trace.started) * 1000, 3)
+            record["duration_ms"] = round((ended - self.started) * 1000, 3)
+            if self.attrs:
+                record["attrs"] = self.attrs
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            self.trace.stack.pop()
+        return False
+
+
+def span(name: str, **attrs):
+    """Return a context manager timing the stage ``name``."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def traced(name: str):
+    """Decorate a function so each call is timed as the stage ``name``."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class trace:
+    """Collect the spans of one request and time it as the stage ``name``.
+
+    On exit the trace is written to the trace file, if any. Nested traces
+    are treated as spans of the outer one.
+    """
+
+    __slots__ = ("name", "attrs", "_trace", "_token", "_span")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._trace = None
+        self._token = None
+        self._span = None
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        if _current.get() is not None:
+            self._span = _Span(self.name, self.attrs).__enter__()
+            return self
+        self._trace = _Trace(self.name)
+        self._token = _current.set(self._trace)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            return self._span.__exit__(exc_type, exc, tb)
+        if self._trace is None:
+            return False
+        _current.reset(self._token)
+        elapsed = time.perf_counter() - self._trace.started
+        observe(self.name, elapsed)
+        if _trace_file is not None:
+            record = {
+                "trace_id": self._trace.id,
+                "name": self.name,
+                "timestamp": self._trace.wall,
+                "duration_ms": round(elapsed * 1000, 3),
+                "pid": os.getpid(),
+                "spans": self._trace.spans,
+            }
+            if self.attrs:
+                record["attrs"] = self.attrs
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            _write_trace(record)
+        return False
+
+
+def _write_trace(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _trace_lock:
+        _trace_file.parent.mkdir(parents=True, exist_ok=True)
+        with _trace_file.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def enable(trace_file: Optional[str] = None) -> None:
+    """Turn tracing on, writing request traces to ``trace_file`` if given."""
+    global _enabled, _trace_file
+    _enabled = True
+    _trace_file = Path(trace_file) if trace_file else None
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def histograms() -> Dict[str, Dict[str, Any]]:
+    """Return ``{stage: {"count", "sum", "buckets"}}`` with cumulative buckets."""
+    with _histograms_lock:
+        result = {}
+        for stage, hist in sorted(_histograms.items()):
+            cumulative, running = [], 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                running += count
+                cumulative.append((bound, running))
+            result[stage] = {"count": hist.count, "sum": hist.total, "buckets": cumulative}
+        return result
+
+
+def reset() -> None:
+    """Forget every recorded duration."""
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def counter_lines(name: str, help_text: str, values: Iterable[Tuple[str, float]],
+                  label: str, kind: str = "counter") -> List[str]:
+    """Render labelled values as Prometheus text lines."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for key, value in values:
+        lines.append(f'{name}{{{label}="{_escape(str(key))}"}} {value}')
+    return lines
+
+
+def prometheus_text() -> str:
+    """Return the stage histograms in the Prometheus text exposition format."""
+    name = "selector_stage_seconds"
+    lines = [
+        f"# HELP {name} Time spent in each stage of selector requests.",
+        f"# TYPE {name} histogram",
+    ]
+    for stage, hist in histograms().items():
+        label = _escape(stage)
+        for bound, count in hist["buckets"]:
+            lines.append(f'{name}_bucket{{stage="{label}",le="{bound:g}"}} {count}')
+        lines.append(f'{name}_bucket{{stage="{label}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{name}_sum{{stage="{label}"}} {hist["sum"]:.9f}')
+        lines.append(f'{name}_count{{stage="{label}"}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
@@ -1,25 +1,79 @@
-from flask import Flask, request, render_template
-from css_selector_generator import generate_selector
+import threading
+import time
+from flask import Flask, Response, jsonify, request, render_template
+import tracing
+from selector_service import (
+    BatchError, heuristic_selector, metrics_lines, parse_batch, select_batch,
+)
 from src.memoire_generale import ajouter_interaction
 import config
 
 app = Flask(__name__)
 
+# Set once the process is warmed up and may receive traffic (see /readyz)
+ready = threading.Event()
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     selector = ''
     html_snippet = ''
     if request.method == 'POST':
         html_snippet = request.form.get('html', '')
-        ajouter_interaction("texte_libre", {"message": html_snippet})
-        try:
-            selector = generate_selector(html_snippet)
-            ajouter_interaction("prediction", {"html": html_snippet, "reponse": selector})
-            ajouter_interaction("reponse", {"texte": selector})
-        except Exception as e:
-            ajouter_interaction("erreur", {"exception": str(e)})
-            selector = ''
+        with tracing.trace("web.index", bytes=len(html_snippet)):
+            selector = _select(html_snippet)
     return render_template('index.html', selector=selector, html=html_snippet)
 
+def _select(html_snippet: str) -> str:
+    ajouter_interaction("texte_libre", {"message": html_snippet})
+    try:
+        if config.CASCADE_ENABLED:
+            from cascade import get_cascade
+            selector = get_cascade().predict(html_snippet).selector
+        else:
+            selector = heuristic_selector(html_snippet)
+        ajouter_interaction("prediction", {"html": html_snippet, "reponse": selector})
+        ajouter_interaction("reponse", {"texte": selector})
+    except Exception as e:
+        ajouter_interaction("erreur", {"exception": str(e)})
+        selector = ''
+    return selector
+
+@app.route('/api/v1/selectors', methods=['POST'])
+def api_selectors():
+    """Return selectors for a JSON batch of snippets (see ``parse_batch``)."""
+    started = time.perf_counter()
+    try:
+        htmls, questions, engine, top_k = parse_batch(
+            request.get_json(silent=True), config.API_MAX_BATCH
+        )
+    except BatchError as e:
+        return jsonify(error=str(e)), e.status
+    with tracing.trace('api.selectors', items=len(htmls), engine=engine):
+        results = select_batch(htmls, questions, engine, top_k)
+    return jsonify(
+        engine=engine,
+        results=results,
+        timings={'total_ms': round((time.perf_counter() - started) * 1000, 3)},
+    )
+
+@app.route('/healthz')
+def healthz():
+    """Liveness probe: the process answers requests."""
+    return jsonify(status='ok')
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: 503 until warm-up is done and while shutting down."""
+    if ready.is_set():
+        return jsonify(status='ready')
+    return jsonify(status='starting'), 503
+
+@app.route('/metrics')
+def metrics():
+    """Stage histograms and counters in the Prometheus text format."""
+    lines = metrics_lines()
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
+    ready.set()
     app.run(debug=config.FLASK_DEBUG, host=config.FLASK_HOST, port=config.FLASK_PORT)